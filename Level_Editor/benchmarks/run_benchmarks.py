@@ -0,0 +1,324 @@
+"""
+Headless benchmarks for the tilemap, tileset and level file hot paths. Runs under SDL's dummy video driver
+and writes the results as json. Result structure:
+
+    {"meta": {...}, "results": {"benchmark name": {"seconds": 0.1, "operations": 10000, "operations_per_second": 100000, "python_peak_bytes": 0, "surfaces_allocated": 0}}}
+
+Usage (from the Level_Editor directory):
+
+    python benchmarks/run_benchmarks.py --output benchmarks/results.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.2
+
+The FRAME_TARGET_BENCHMARKS have to draw a frame in FRAME_TARGET_SECONDS (60 FPS), the script exits with 1 if one
+of them doesn't, or if a benchmark got slower than the threshold against the baseline.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+from scripts.tilemap import Tilemap
+from scripts.tileset import Tileset
+from scripts.tileset_cache import TILESET_CACHE_DIRECTORY
+from scripts.utils.profiler import profiler
+
+TILE_SIZE = 64
+VIEWPORT_SIZES = [(1280, 720), (1920, 1080), (2560, 1440)]
+LAYER_COUNTS = [1, 4, 8]
+
+FRAME_TARGET_SECONDS = 1 / 60
+# every layer of the render benchmarks has its own parallax, so no layers can be stacked into the same blocks
+FRAME_TARGET_BENCHMARKS = ["tilemap.render_tilemap scrolling 2560x1440 8 layers"]
+
+
+def measure(function: Callable[[], int], repeats: int = 1, setup: Callable[[], Any] | None = None) -> dict:
+    """Runs the function (which returns its number of operations) repeats times and returns the time of the fastest
+    run. The memory is measured in one more run, because tracing the allocations slows the function down."""
+    seconds = None
+    for _ in range(repeats):
+        if setup: setup()
+
+        profiler.begin_frame()
+        start = time.perf_counter()
+        operations = function()
+        run_seconds = time.perf_counter() - start
+        if seconds is None or run_seconds < seconds: seconds = run_seconds
+    surfaces_allocated = profiler.counters.get("surfaces allocated", 0)
+
+    if setup: setup()
+    tracemalloc.start()
+    function()
+    _, python_peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "repeats": repeats,
+        "operations": operations,
+        "operations_per_second": operations / seconds if seconds else 0,
+        "python_peak_bytes": python_peak_bytes,
+        "surfaces_allocated": surfaces_allocated
+    }
+
+def create_tile_image() -> pygame.Surface:
+    image = pygame.Surface((32, 32), pygame.SRCALPHA)
+    image.fill((120, 200, 80))
+    return image
+
+def create_tilemap(number_of_layers: int = 1) -> Tilemap:
+    tilemap = Tilemap(TILE_SIZE, autosave_interval=None)
+    for layer_number in range(number_of_layers):
+        tilemap.layer_manager.add_layer({"name": f"layer {layer_number}", "parallax": 1 - layer_number * 0.1})
+    tilemap.layer_manager.selected_layer = "layer 0"
+    return tilemap
+
+def fill_tilemap(tilemap: Tilemap, number_of_cells: int, layer: str = "layer 0") -> None:
+    side = int(math.sqrt(number_of_cells))
+    for tile_y in range(side):
+        for tile_x in range(side):
+            tilemap.place_tile(layer, tile_x, tile_y, "grass", (tile_x + tile_y) % 8)
+
+def benchmark_add_remove(results: Dict[str, dict], cell_counts: List[int], repeats: int) -> None:
+    image = create_tile_image()
+    for number_of_cells in cell_counts:
+        side = int(math.sqrt(number_of_cells))
+        positions = [(tile_x * TILE_SIZE, tile_y * TILE_SIZE) for tile_y in range(side) for tile_x in range(side)]
+        # a serpentine path, so every position of the stroke is next to the last one
+        stroke_positions = [(tile_x * TILE_SIZE if tile_y % 2 == 0 else (side - 1 - tile_x) * TILE_SIZE, tile_y * TILE_SIZE) for tile_y in range(side) for tile_x in range(side)]
+        tilemap = create_tilemap()
+
+        def add_tiles() -> int:
+            for position in positions: tilemap.add_tile("grass", 0, position, image)
+            return len(positions)
+
+        def paint_stroke() -> int:
+            tilemap.begin_stroke("grass", 1, image)
+            for position in stroke_positions: tilemap.continue_stroke(position)
+            tilemap.end_stroke()
+            return len(positions)
+
+        def remove_tiles() -> int:
+            for position in positions: tilemap.remove_tile(position)
+            return len(positions)
+
+        def clear_layer() -> None:
+            tilemap.erase_rect("layer 0", 0, 0, side - 1, side - 1)
+
+        def fill_layer() -> None:
+            tilemap.fill_rect("layer 0", 0, 0, side - 1, side - 1, "grass", 0)
+
+        results[f"tilemap.add_tile {number_of_cells} cells"] = measure(add_tiles, repeats, setup=clear_layer)
+        results[f"tilemap brush stroke {number_of_cells} cells"] = measure(paint_stroke, repeats, setup=fill_layer)
+        results[f"tilemap.remove_tile {number_of_cells} cells"] = measure(remove_tiles, repeats, setup=fill_layer)
+
+def benchmark_bulk_edits(results: Dict[str, dict], repeats: int) -> None:
+    tilemap = create_tilemap()
+
+    def fill_rect() -> int:
+        return tilemap.fill_rect("layer 0", 0, 0, 499, 499, "grass", 0)
+
+    def flood_fill() -> int:
+        return tilemap.flood_fill("layer 0", 250, 250, "grass", 1)
+
+    def erase_rect() -> int:
+        return tilemap.erase_rect("layer 0", 0, 0, 499, 499)
+
+    def clear_layer() -> None:
+        tilemap.erase_rect("layer 0", 0, 0, 499, 499)
+
+    def fill_layer() -> None:
+        tilemap.fill_rect("layer 0", 0, 0, 499, 499, "grass", 0)
+
+    results["tilemap.fill_rect 500x500 cells"] = measure(fill_rect, repeats, setup=clear_layer)
+    results["tilemap.flood_fill 500x500 cells"] = measure(flood_fill, repeats, setup=fill_layer)
+    results["tilemap.erase_rect 500x500 cells"] = measure(erase_rect, repeats, setup=fill_layer)
+
+def benchmark_render(results: Dict[str, dict], frames: int, repeats: int) -> None:
+    for number_of_layers in LAYER_COUNTS:
+        tilemap = create_tilemap(number_of_layers)
+        for layer_number in range(number_of_layers):
+            fill_tilemap(tilemap, 200 * 200, f"layer {layer_number}")
+        tilemap.image_registry.add_source_image("grass", 0, create_tile_image())
+        for variant in range(8): tilemap.image_registry.add_source_image("grass", variant, create_tile_image())
+
+        for viewport_size in VIEWPORT_SIZES:
+            render_surface = pygame.Surface(viewport_size, pygame.SRCALPHA)
+
+            def render_first_frame() -> int:
+                tilemap.render_tilemap(render_surface, (500, 500))
+                return 1
+
+            def render_still() -> int:
+                for _ in range(frames): tilemap.render_tilemap(render_surface, (500, 500))
+                return frames
+
+            def render_scrolling_from_first_frame() -> None:
+                # baking the first frame is measured on its own, while scrolling only the blocks coming into view are baked
+                tilemap.chunk_render_cache.clear()
+                tilemap.render_tilemap(render_surface, (500, 500))
+
+            def render_scrolling() -> int:
+                for frame in range(1, frames + 1): tilemap.render_tilemap(render_surface, (500 + frame * 16, 500 + frame * 8))
+                return frames
+
+            name = f"{viewport_size[0]}x{viewport_size[1]} {number_of_layers} layers"
+            # the first frame bakes every visible block, the still frames only blit the cached blocks
+            results[f"tilemap.render_tilemap first frame {name}"] = measure(render_first_frame, repeats, setup=tilemap.chunk_render_cache.clear)
+            results[f"tilemap.render_tilemap still {name}"] = measure(render_still, repeats)
+            results[f"tilemap.render_tilemap scrolling {name}"] = measure(render_scrolling, repeats, setup=render_scrolling_from_first_frame)
+
+            def render_zooming() -> int:
+                # zooming out to the whole level, far out the chunks are drawn as thumbnails
+                for frame in range(frames): tilemap.render_tilemap(render_surface, (0, 0), zoom=0.8 ** frame)
+                return frames
+
+            results[f"tilemap.render_tilemap zooming out {name}"] = measure(render_zooming, repeats, setup=tilemap.chunk_render_cache.clear)
+
+def benchmark_tileset(results: Dict[str, dict], directory: str, repeats: int) -> None:
+    for sheet_size in (1024, 2048, 4096):
+        sheet = pygame.Surface((sheet_size, sheet_size))
+        for _ in range(200):
+            pygame.draw.rect(sheet, [random.randint(0, 255) for _ in range(3)], (random.randint(0, sheet_size), random.randint(0, sheet_size), 64, 64))
+        path = os.path.join(directory, f"sheet_{sheet_size}.png")
+        pygame.image.save(sheet, path)
+
+        tileset = None
+        def load_tileset() -> int:
+            nonlocal tileset
+            tileset = Tileset(f"sheet {sheet_size}", "sheet", path, 32, 32, colorkey=(0, 0, 0))
+            tileset._load_image()
+            return len(tileset.tiles)
+
+        def extract_tiles() -> int:
+            tileset.tiles.clear()
+            tileset._extract_tileset_tiles()
+            return len(tileset.tiles)
+
+        def clear_tileset_cache() -> None:
+            shutil.rmtree(TILESET_CACHE_DIRECTORY, ignore_errors=True)
+
+        results[f"tileset image load uncached {sheet_size}px sheet"] = measure(load_tileset, repeats, setup=clear_tileset_cache)
+        results[f"tileset image load cached {sheet_size}px sheet"] = measure(load_tileset, repeats)
+        results[f"tileset._extract_tileset_tiles {sheet_size}px sheet"] = measure(extract_tiles, repeats)
+
+def benchmark_save_load(results: Dict[str, dict], directory: str, cell_counts: List[int], repeats: int) -> None:
+    for number_of_cells in cell_counts:
+        tilemap = create_tilemap()
+        fill_tilemap(tilemap, number_of_cells)
+
+        for extention in (".lvl", ".json"):
+            path = os.path.join(directory, f"level_{number_of_cells}{extention}")
+            loaded_tilemap = create_tilemap()
+
+            def save_level() -> int:
+                tilemap.save_level(path)
+                return 1
+
+            def load_level() -> int:
+                loaded_tilemap.load_level(path)
+                return 1
+
+            def load_level_and_decode_chunks() -> int:
+                loaded_tilemap.load_level(path)
+                chunk_grid = loaded_tilemap.tile_map["layer 0"]["on_grid"]
+                chunk_grid.load_all_chunks()
+                return len(chunk_grid)
+
+            results[f"tilemap.save_level {extention} {number_of_cells} cells"] = measure(save_level, repeats)
+            results[f"tilemap.save_level {extention} {number_of_cells} cells"]["file_bytes"] = os.path.getsize(path)
+            results[f"tilemap.load_level {extention} {number_of_cells} cells"] = measure(load_level, repeats)
+            results[f"tilemap.load_level full decode {extention} {number_of_cells} cells"] = measure(load_level_and_decode_chunks, repeats)
+
+def compare_results(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> bool:
+    """Prints the change of every benchmark against the baseline, returns False if one got slower than the threshold."""
+    passed = True
+    for name, result in results.items():
+        if name not in baseline: continue
+
+        baseline_seconds = baseline[name]["seconds"]
+        change = (result["seconds"] - baseline_seconds) / baseline_seconds if baseline_seconds else 0
+        regression = change > threshold
+        if regression: passed = False
+        print(f"{'REGRESSION' if regression else 'ok':>10}  {change * 100:+7.1f}%  {result['seconds'] * 1000:10.2f} ms  {name}")
+    return passed
+
+def check_frame_targets(results: Dict[str, dict]) -> bool:
+    """Prints the frame time of every frame target benchmark, returns False if one takes longer than FRAME_TARGET_SECONDS."""
+    passed = True
+    for name in FRAME_TARGET_BENCHMARKS:
+        if name not in results: continue
+
+        frame_seconds = results[name]["seconds"] / results[name]["operations"]
+        missed = frame_seconds > FRAME_TARGET_SECONDS
+        if missed: passed = False
+        print(f"{'MISSED' if missed else 'ok':>10}  {frame_seconds * 1000:7.2f} ms per frame (target {FRAME_TARGET_SECONDS * 1000:.2f} ms)  {name}")
+    return passed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless benchmarks for the level editor.")
+    parser.add_argument("--output", default="benchmarks/results.json", help="where to write the json results")
+    parser.add_argument("--baseline", help="json results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown against the baseline (0.2 = 20%%)")
+    parser.add_argument("--max-cells", type=int, default=10**6, help="largest tilemap size to benchmark (up to 10^7)")
+    parser.add_argument("--frames", type=int, default=60, help="frames per render benchmark")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per benchmark, the fastest run is reported")
+    arguments = parser.parse_args()
+
+    output_path = os.path.abspath(arguments.output)
+    baseline_path = os.path.abspath(arguments.baseline) if arguments.baseline else None
+    cell_counts = [10 ** exponent for exponent in range(4, 8) if 10 ** exponent <= arguments.max_cells]
+
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    random.seed(0)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        # the tilemap loads the last opened level from ./caches, so the benchmarks run in an empty directory
+        current_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            benchmark_add_remove(results, cell_counts, arguments.repeats)
+            benchmark_bulk_edits(results, arguments.repeats)
+            benchmark_render(results, arguments.frames, arguments.repeats)
+            benchmark_tileset(results, directory, arguments.repeats)
+            benchmark_save_load(results, directory, cell_counts, arguments.repeats)
+        finally:
+            os.chdir(current_directory)
+
+    for name, result in results.items():
+        print(f"{result['seconds'] * 1000:10.2f} ms  {result['operations_per_second']:14.1f} ops/s  {name}")
+
+    output = {
+        "meta": {"python": platform.python_version(), "pygame": pygame.version.ver, "platform": platform.platform(), "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+        "results": results
+    }
+    with open(output_path, "w") as file:
+        json.dump(output, file, indent=4)
+    print(f"Results saved to {output_path}")
+
+    passed = check_frame_targets(results)
+    if baseline_path:
+        with open(baseline_path, "r") as file:
+            baseline = json.load(file)["results"]
+        passed = compare_results(results, baseline, arguments.threshold) and passed
+    if not passed: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
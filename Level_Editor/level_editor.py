@@ -1,28 +1,47 @@
+import time
+STARTUP_TIME = time.perf_counter() # taken before the other imports, they are part of the startup
+
 import pygame
 import pygame_gui
-from sys import exit
+from sys import argv, exit
 from typing import List, Tuple
 
 from scripts.components.file_manager_panel import File_Manager_Panel
 from scripts.components.tile_selection_panel import Tile_Selection_Panel
 from scripts.components.handy_bar_panel import Handy_Bar_Panel
 from scripts.components.map_panel import Map_Panel
-from scripts.windows import New_Tileset_Window
 from scripts.tileset import Tileset, tileset_decoder
 from scripts.utils.file import load_json_data_from_file_explorer
+from scripts.utils.dialogs import dialog_service
+from scripts.utils.image_loader import image_loader
 from scripts.tilemap import Tilemap
+from scripts.utils.profiler import profiler
+
+IDLE_TIMEOUT = 100 # ms an idle editor waits for an event before it updates again
+ACTIVE_TIME = 0.5 # seconds the whole window keeps being drawn after the last event, for hover effects and such
+STARTUP_REPORT_PATH = "./caches/startup_times.csv"
 
 class Level_Editor:
-    def __init__(self) -> None:
+    def __init__(self, exit_after_startup: bool = False) -> None:
+        # the window is shown before anything else is built, the last level is read after the first frame (see run)
+        profiler.begin_startup(STARTUP_TIME)
+        profiler.mark_startup("imports")
+        self.exit_after_startup = exit_after_startup
+
         self.screen_background_color = (39,48,54)#(33, 40, 45)
         self.screen_size = (1300, 750)
         self.screen_min_size = (1300, 750)
         self.screen_max_size = (2560, 1440)
         self.screen = pygame.display.set_mode(self.screen_size, pygame.RESIZABLE, vsync=1)
         pygame.display.set_caption("Level... Da Fuckin Editor")
+        self.screen.fill(self.screen_background_color)
+        pygame.display.flip()
+        profiler.mark_startup("window shown")
 
         self.clock = pygame.time.Clock()
         self.target_fps = 60
+        self.idle = False
+        self.time_since_last_event = 0
 
         self.pygame_gui_manager = pygame_gui.UIManager(self.screen.get_size(), "styles/default.json")
 
@@ -31,11 +50,13 @@ class Level_Editor:
         self.deleting_tile = False
 
         self.tilesets = {}
+        self.tileset_jobs = {} # tileset name -> Load_Job of its image
         self.selected_tileset = None
 
         self.tile_size = 64
  
         self._create_widgets()
+        profiler.mark_startup("widgets created")
     
     def _create_widgets(self) -> None:
         self.handy_bar_panel = Handy_Bar_Panel(
@@ -63,7 +84,8 @@ class Level_Editor:
             size=(self.screen.get_width() - 300-4, self.screen.get_height() - 50-4),
             border_width=0,
             color=pygame.Color(39,48,54),
-            tile_size=self.tile_size
+            tile_size=self.tile_size,
+            load_last_level=False
         )
     
     def _handy_bar_callback(self, button_text: str) -> None:
@@ -85,6 +107,8 @@ class Level_Editor:
         if "option_deleted" in data:
             tileset_id = data["option_deleted"]
             self.tilesets.pop(tileset_id)
+            job = self.tileset_jobs.pop(tileset_id, None)
+            if job: job.cancel()
             self.tile_selection_panel.remove_tileset_images()
             self._set_selected_drawing_tile_id(None)
     
@@ -115,18 +139,48 @@ class Level_Editor:
         self.handy_bar_panel.set_dimensions((new_size[0], self.handy_bar_panel.relative_rect.height))
         self.map_panel.set_dimensions((new_size[0] - 300-4, new_size[1] - 50-4))
     
+    def _get_events(self) -> List[pygame.Event]:
+        if not self.idle: return pygame.event.get()
+
+        event = pygame.event.wait(IDLE_TIMEOUT)
+        if event.type == pygame.NOEVENT: return []
+        return [event] + pygame.event.get()
+
+    def _text_entry_focused(self) -> bool:
+        focus_set = self.pygame_gui_manager.get_focus_set()
+        if not focus_set: return False
+        return any(isinstance(element, pygame_gui.elements.UITextEntryLine) for element in focus_set)
+
+    def _draw_screen(self, area: pygame.Rect | None = None) -> None:
+        """Draws the whole screen, or only the area, and presents it."""
+        self.screen.set_clip(area)
+        self.screen.fill(self.screen_background_color)
+        self.map_panel.render_map(self.screen)
+
+        with profiler.timer("draw_ui"):
+            self.pygame_gui_manager.draw_ui(self.screen)
+
+        profiler.draw_overlay(self.screen)
+        self.screen.set_clip(None)
+
+        if area is None: pygame.display.update()
+        else: pygame.display.update(area)
+
     def _handle_map_click(self, mouse_position: List[int] | Tuple[int]) -> None:
         if not self.deleting_tile:
-            self.map_panel.add_tile({"type": self.selected_tileset.type, "variant": self.selected_drawing_tile_id, "image": self.get_current_drawing_tile()}, mouse_position)
+            if self.get_current_drawing_tile() is None: return # the tileset is still loading
+            self.map_panel.use_tool({"type": self.selected_tileset.type, "variant": self.selected_drawing_tile_id, "image": self.get_current_drawing_tile()}, mouse_position)
         else:
-            self.map_panel.remove_tile(mouse_position)
+            self.map_panel.use_tool(None, mouse_position)
     
     def get_current_drawing_tile(self) -> pygame.Surface | None:
         if not self.selected_tileset: return
         if not self.selected_drawing_tile_id and self.selected_drawing_tile_id is not 0: return
-        return self.selected_tileset.tiles[self.selected_drawing_tile_id]
+        return self.selected_tileset.tiles.get(self.selected_drawing_tile_id)
 
     def launch_new_tileset_window(self) -> None:
+        from scripts.windows import New_Tileset_Window # the windows are imported when first opened, it keeps them out of the startup
+
         self.new_tileset_window = New_Tileset_Window(
             manager=self.pygame_gui_manager, 
             rect=pygame.Rect(self.screen.get_width() / 2 - 250, self.screen.get_height() / 2 - 200, 500, 400),
@@ -136,6 +190,7 @@ class Level_Editor:
         self.new_tileset_window.set_blocking(True)
     
     def launch_layer_manager_window(self) -> None:
+        if self.map_panel.tilemap.is_loading(): return
         self.map_panel.tilemap.layer_manager.launch_layer_manager_window(
             manager=self.pygame_gui_manager,
             rect=pygame.Rect(self.screen.get_width() / 2 - 250, self.screen.get_height() / 2 - 200, 500, 400),
@@ -143,9 +198,13 @@ class Level_Editor:
         )
     
     def open_tileset(self) -> None:
-        tileset_object_data = load_json_data_from_file_explorer()
+        load_json_data_from_file_explorer(self._tileset_data_loaded, multiple=True)
 
+    def _tileset_data_loaded(self, tileset_object_data: dict | List[dict] | None) -> None:
         if not tileset_object_data: return
+        if isinstance(tileset_object_data, list):
+            for data in tileset_object_data: self._tileset_data_loaded(data)
+            return
 
         tileset_data = tileset_object_data["tileset_object"]
         
@@ -157,31 +216,79 @@ class Level_Editor:
 
         self.tilesets[tileset.name] = tileset
         self.file_manager_panel.add_option(tileset.name)
+
+        # the sheet is decoded on the image loader, the tileset shows up empty until it is done
+        self.file_manager_panel.set_option_progress(tileset.name, 0)
+        job = tileset.load_image_async(self._tileset_image_loaded, lambda progress: self.file_manager_panel.set_option_progress(tileset.name, progress))
+        if job: self.tileset_jobs[tileset.name] = job
+        else: self._tileset_image_loaded(tileset)
+
+    def _tileset_image_loaded(self, tileset: Tileset) -> None:
+        self.tileset_jobs.pop(tileset.name, None)
+        self.file_manager_panel.set_option_progress(tileset.name, None)
+        if self.tilesets.get(tileset.name) is not tileset: return
+
+        self.map_panel.tilemap.add_tileset(tileset)
+        self.map_panel.mark_dirty() # tiles placed before the sheet was loaded get their images
+        if tileset is self.selected_tileset: self.tile_selection_panel.set_tileset_images(tileset.tiles)
    
+    def _last_level_loaded(self) -> None:
+        self.map_panel.mark_dirty()
+        profiler.mark_startup("level loaded")
+        if self.exit_after_startup or profiler.overlay_visible:
+            print(profiler.get_startup_report())
+            profiler.export_startup_report(STARTUP_REPORT_PATH)
+        if self.exit_after_startup: pygame.event.post(pygame.Event(pygame.QUIT))
+
     def run(self) -> None:
-        while True:
-            dt = self.clock.tick(self.target_fps) / 1000
+        self._draw_screen()
+        profiler.mark_startup("first frame")
+        self.map_panel.tilemap.load_last_level_async(self._last_level_loaded)
 
-            self.screen.fill(self.screen_background_color)
+        while True:
+            events = self._get_events()
+            dt = (self.clock.tick() if self.idle else self.clock.tick(self.target_fps)) / 1000
+            profiler.begin_frame()
 
             hovering_window = self._hovering_window()
 
-            mouse_buttons = pygame.mouse.get_pressed()
-            mouse_position = pygame.mouse.get_pos()
-
-            if mouse_buttons[0] and self.map_panel.rect.collidepoint(mouse_position) and self.selected_drawing_tile_id is not None and not hovering_window:
-                self._handle_map_click(mouse_position)
+            for event in events:
+                # mouse motion on the map shows up in its render state, everything else can change what the map shows
+                if event.type != pygame.MOUSEMOTION: self.map_panel.mark_dirty()
+                self.time_since_last_event = 0
 
-            for event in pygame.event.get():
+                if dialog_service.process_event(event): continue
                 if event.type == pygame.QUIT:
+                    dialog_service.close()
+                    image_loader.close()
+                    self.map_panel.tilemap.close()
                     pygame.quit()
                     exit()
                 if event.type == pygame.WINDOWSIZECHANGED:
                     self._handle_new_screen_size(event)
+                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    if self.map_panel.rect.collidepoint(event.pos) and self.selected_drawing_tile_id is not None and not hovering_window:
+                        self._handle_map_click(event.pos)
                 
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_d:
                         self.deleting_tile = not self.deleting_tile
+                    if not self._text_entry_focused(): # typing a name into a text entry doesn't switch tools or undo edits
+                        if event.key == pygame.K_b:
+                            self.map_panel.set_tool("brush")
+                        if event.key == pygame.K_r:
+                            self.map_panel.set_tool("rect")
+                        if event.key == pygame.K_f:
+                            self.map_panel.set_tool("fill")
+                        if event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+                            if event.mod & pygame.KMOD_SHIFT: self.map_panel.redo()
+                            else: self.map_panel.undo()
+                        if event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+                            self.map_panel.redo()
+                    if event.key == pygame.K_F3:
+                        profiler.toggle_overlay()
+                    if event.key == pygame.K_F4:
+                        if profiler.export_trace("./caches/frame_trace.csv"): print("Frame trace saved to ./caches/frame_trace.csv")
                         
                 self.map_panel.process_event(event)
                 self.pygame_gui_manager.process_events(event)
@@ -190,16 +297,26 @@ class Level_Editor:
                 if self.map_panel.tilemap.layer_manager.layer_manager_window.alive(): self.handy_bar_panel.layers_button.disable()
                 else: self.handy_bar_panel.layers_button.enable()
 
-            self.map_panel.update(dt, deleting=self.deleting_tile, drawing_image=self.get_current_drawing_tile(), layer_selected=self.map_panel.tilemap.layer_manager.selected_layer)
-            self.map_panel.render_map(self.screen)
+            image_loader.update()
+
+            with profiler.timer("map update"):
+                map_drawn = self.map_panel.update(dt, deleting=self.deleting_tile, drawing_image=self.get_current_drawing_tile(), layer_selected=self.map_panel.tilemap.layer_manager.selected_layer)
         
-            self.pygame_gui_manager.update(dt)
-            self.pygame_gui_manager.draw_ui(self.screen)
+            with profiler.timer("GUI update"):
+                self.pygame_gui_manager.update(dt)
+
+            # the gui can't tell what it changed, so the whole window is drawn for a while after every event,
+            # otherwise only a changed map (camera motion, painting under a resting mouse) is presented
+            self.time_since_last_event += dt
+            gui_active = self.time_since_last_event < ACTIVE_TIME or profiler.overlay_visible or image_loader.is_busy()
+            self.idle = not gui_active and not map_drawn
+            if gui_active or self._text_entry_focused(): self._draw_screen() # a focused text entry blinks at the idle rate
+            elif map_drawn: self._draw_screen(self.map_panel.get_screen_rect())
 
-            pygame.display.update()
+            profiler.end_frame()
 
 
 if __name__ == "__main__":
     pygame.init()
-    level_editor = Level_Editor()
+    level_editor = Level_Editor(exit_after_startup="--startup-report" in argv) # --startup-report quits once the level is in
     level_editor.run()
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+Command line tool for batches of level files, it never opens a window. The files are processed in parallel on
+a process pool (see scripts/level_tools.py for the operations). Directories are searched for .lvl and .json
+files. Exits with 1 if any file has a problem.
+
+Usage (from the Level_Editor directory):
+
+    python level_tool.py validate levels/ --tilesets Ground.json Background.json
+    python level_tool.py convert levels/ --to lvl --output-dir build/levels --tilesets Ground.json
+    python level_tool.py stats levels/1.lvl --output stats.json
+    python level_tool.py fix-paths Ground.json Background.json levels/ --search assets/tilesets --dry-run
+    python level_tool.py export-collision levels/ --types grass rock --tile-size 32
+
+With fewer files than jobs, export-collision splits the layers of every level over the pool instead.
+"""
+
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Iterator, List
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from scripts.level_tools import collect_level_paths, load_tileset_files, validate_level, convert_level, level_stats, fix_image_paths, export_collision
+
+
+def run_operation(operation: Callable[..., dict], paths: List[str], jobs: int, **options) -> Iterator[dict]:
+    """Yields the result of the operation for every path in order, on a process pool if there are several jobs."""
+    work = partial(operation, **options)
+    if jobs <= 1 or len(paths) <= 1:
+        yield from map(work, paths)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as executor:
+        yield from executor.map(work, paths, chunksize=max(1, len(paths) // (jobs * 4)))
+
+def _export_collision_of_large_levels(paths: List[str], jobs: int, **options) -> Iterator[dict]:
+    # the levels are exported one after another, the bands of their layers are meshed on the pool
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for path in paths: yield export_collision(path, executor=executor, **options)
+
+def _convert_level(path: str, to: str, output_directory: str | None, **options) -> dict:
+    output_directory = output_directory or os.path.dirname(path)
+    output_path = os.path.join(output_directory, os.path.splitext(os.path.basename(path))[0] + "." + to)
+    return convert_level(path, output_path, **options)
+
+def _format_result(command: str, result: dict) -> str:
+    status = "ok" if result["ok"] else "FAILED"
+    if "skipped" in result: status = f"skipped ({result['skipped']})"
+    elif command == "validate" and "tile_count" in result: status += f", {result['tile_count']} tiles"
+    elif command == "convert" and result["ok"]: status += f" -> {result['output_path']} ({result['bytes']} -> {result['output_bytes']} bytes)"
+    elif command == "export-collision" and result["ok"]: status += f" -> {result['output_path']} ({result['tiles']} tiles in {result['rects']} rectangles)"
+    elif command == "fix-paths" and result.get("fixed"): status += "".join(f"\n    '{old}' -> '{new}'" for old, new in result["fixed"].items())
+    elif command == "stats" and result["ok"]:
+        status += f", {result['file_bytes']} bytes on disk, {result['palette_size']} tile kinds"
+        for layer, layer_stats in result["layers"].items():
+            types = ", ".join(f"{t_type} {count}" for t_type, count in layer_stats["types"].items())
+            status += (f"\n    {layer}: {layer_stats['on_grid_tiles']} on grid in {layer_stats['chunks']} chunks, "
+                       f"{layer_stats['off_grid_tiles']} off grid, {layer_stats['bytes'] / 1024:.1f} KiB ({types})")
+
+    return f"{result['path']}: {status}" + "".join(f"\n    {problem}" for problem in result["problems"])
+
+def main(arguments: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Validate, convert and inspect level files without opening the editor.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes (1 runs everything in this process)")
+    common_parser.add_argument("--output", help="where to write the results as json")
+
+    validate_parser = commands.add_parser("validate", parents=[common_parser], help="check that the tile types and variants of the levels exist in their tilesets")
+    validate_parser.add_argument("paths", nargs="+")
+    validate_parser.add_argument("--tilesets", nargs="*", default=[], help="tileset json files, they replace the tilesets stored in the levels")
+
+    convert_parser = commands.add_parser("convert", parents=[common_parser], help="convert levels between the json layout and the binary level format")
+    convert_parser.add_argument("paths", nargs="+")
+    convert_parser.add_argument("--to", choices=["lvl", "json"], required=True)
+    convert_parser.add_argument("--output-dir", help="where to write the converted levels (next to the levels by default)")
+    convert_parser.add_argument("--tilesets", nargs="*", default=[], help="tileset json files to store in binary levels")
+
+    stats_parser = commands.add_parser("stats", parents=[common_parser], help="report the tile counts and memory of every layer")
+    stats_parser.add_argument("paths", nargs="+")
+
+    fix_paths_parser = commands.add_parser("fix-paths", parents=[common_parser], help="rewrite image paths that don't exist in tileset files and binary levels")
+    fix_paths_parser.add_argument("paths", nargs="+")
+    fix_paths_parser.add_argument("--search", nargs="*", default=[os.getcwd()], help="directories to look for the images in (the file's own directory is searched first)")
+    fix_paths_parser.add_argument("--dry-run", action="store_true", help="only report what would be rewritten")
+
+    export_collision_parser = commands.add_parser("export-collision", parents=[common_parser], help="write the greedy meshed collision rectangles of the on grid tiles next to the levels")
+    export_collision_parser.add_argument("paths", nargs="+")
+    export_collision_parser.add_argument("--types", nargs="*", help="tile types with collision (all types by default)")
+    export_collision_parser.add_argument("--tile-size", type=int, default=1, help="pixels per tile of the rectangles (1 writes them in tiles)")
+
+    arguments = parser.parse_args(arguments)
+    paths = collect_level_paths(arguments.paths)
+
+    match arguments.command:
+        case "validate":
+            results = run_operation(validate_level, paths, arguments.jobs, tilesets=load_tileset_files(arguments.tilesets))
+        case "convert":
+            if arguments.output_dir: os.makedirs(arguments.output_dir, exist_ok=True)
+            results = run_operation(_convert_level, paths, arguments.jobs, to=arguments.to, output_directory=arguments.output_dir, tilesets=load_tileset_files(arguments.tilesets))
+        case "stats":
+            results = run_operation(level_stats, paths, arguments.jobs)
+        case "fix-paths":
+            results = run_operation(fix_image_paths, paths, arguments.jobs, search_directories=arguments.search, dry_run=arguments.dry_run)
+        case "export-collision":
+            options = {"types": arguments.types, "tile_size": arguments.tile_size}
+            if 1 < arguments.jobs and len(paths) < arguments.jobs: results = _export_collision_of_large_levels(paths, arguments.jobs, **options)
+            else: results = run_operation(export_collision, paths, arguments.jobs, **options)
+
+    all_results = []
+    for result in results:
+        print(_format_result(arguments.command, result))
+        all_results.append(result)
+
+    failed = sum(not result["ok"] for result in all_results)
+    print(f"{len(all_results)} files, {failed} with problems")
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(all_results, file, indent=4)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
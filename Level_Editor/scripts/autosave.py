@@ -0,0 +1,195 @@
+"""
+The autosave appends every edit of the tilemap to a journal file next to the level file as it happens, and
+compacts the journal into the level file on a worker thread every interval seconds. Journal structure (one
+json list per line):
+
+    ["set", layer, x, y, type, variant]
+    ["erase", layer, x, y]
+    ["set_cells", layer, type, variant, [x, y, x, y, ...]]   # one brush stroke
+    ["erase_cells", layer, [x, y, x, y, ...]]
+    ["fill_rect", layer, left, top, right, bottom, type, variant]   # right and bottom are inclusive
+    ["erase_rect", layer, left, top, right, bottom]
+    ["add_off_grid", layer, x, y, type, variant]
+    ["remove_off_grid", layer, x, y]
+    ["add_layer", name, parallax]
+    ["remove_layer", name]
+    ["reorder_layers", [name, name, ...]]
+
+While compacting, the journal is moved to the COMPACTING_EXTENTION file and a new journal is started. That
+file is deleted once the level file is written, so after a crash the level file plus the remaining journal
+files always hold every edit. They are replayed by recover.
+
+The tile map is snapshotted on the main thread without decoding the chunks that are still pending in a lazily
+loaded level, they are decoded on the worker thread while the level file is written.
+"""
+
+import os
+import json
+import threading
+from typing import Any, List
+
+from .level_format import is_level_file, save_level_file, tile_map_to_json_data, serialize_tile_record, detach_pending_chunks
+
+JOURNAL_EXTENTION = ".journal"
+COMPACTING_EXTENTION = ".journal.compacting"
+AUTOSAVE_LEVEL_PATH = "./caches/autosave.lvl"
+
+
+class Autosave:
+    def __init__(self, tilemap: Any, level_path: str | None = None, interval: float = 60) -> None:
+        self.tilemap = tilemap
+        self.level_path = level_path if level_path else AUTOSAVE_LEVEL_PATH
+        self.interval = interval
+
+        self.journal_file = None
+        self.journal_entries = 0
+        self.replaying = False
+
+        self.time_since_compaction = 0
+        self.compaction_thread: threading.Thread | None = None
+
+    def _get_journal_path(self) -> str:
+        return self.level_path + JOURNAL_EXTENTION
+
+    def _get_compacting_path(self) -> str:
+        return self.level_path + COMPACTING_EXTENTION
+
+    def _open_journal(self) -> None:
+        if self.journal_file: return
+        try:
+            self.journal_file = open(self._get_journal_path(), "a", encoding="utf-8")
+        except Exception as e:
+            print(f"Error opening journal file: {e}")
+
+    def _close_journal(self) -> None:
+        if not self.journal_file: return
+        self.journal_file.close()
+        self.journal_file = None
+
+    def _snapshot_tile_map(self) -> dict:
+        # the snapshot is written on the worker thread, so it can't share any mutable data with the tilemap
+        snapshot = {}
+        for layer, layer_data in self.tilemap.tile_map.items():
+            # the pending chunks may still read the level file that is about to be replaced
+            detach_pending_chunks(layer_data["on_grid"])
+            snapshot[layer] = {
+                "on_grid": layer_data["on_grid"].copy(),
+                "off_grid": [serialize_tile_record(tile) for tile in layer_data["off_grid"]],
+                "parallax": layer_data["parallax"],
+                "render_number": layer_data["render_number"]
+            }
+        return snapshot
+
+    def _compact_worker(self, tile_map: dict, palette: Any, tilesets: List[dict], compacting_path: str) -> None:
+        if is_level_file(self.level_path):
+            saved = save_level_file(tile_map, palette, self.level_path, tilesets=tilesets)
+        else:
+            try:
+                temporary_path = self.level_path + ".tmp"
+                with open(temporary_path, "w") as file:
+                    json.dump(tile_map_to_json_data(tile_map, palette), file, indent=4)
+                os.replace(temporary_path, self.level_path)
+                saved = True
+            except Exception as e:
+                print(f"Error saving JSON file: {e}")
+                saved = False
+
+        if saved and os.path.exists(compacting_path): os.remove(compacting_path)
+
+    def _replay_journal(self, path: str) -> int:
+        if not os.path.exists(path): return 0
+
+        replayed_entries = 0
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break # the last line might be cut off by a crash
+                self.tilemap.apply_journal_entry(entry)
+                replayed_entries += 1
+        return replayed_entries
+
+    def is_compacting(self) -> bool:
+        return self.compaction_thread is not None and self.compaction_thread.is_alive()
+
+    def record(self, entry: list) -> None:
+        if self.replaying: return
+
+        self._open_journal()
+        if not self.journal_file: return
+
+        self.journal_file.write(json.dumps(entry, separators=(",", ":")))
+        self.journal_file.write("\n")
+        self.journal_entries += 1
+
+    def recover(self) -> int:
+        """Replays the journals of the level on top of the loaded tilemap, returns the number of replayed edits."""
+        self.replaying = True
+        replayed_entries = self._replay_journal(self._get_compacting_path()) + self._replay_journal(self._get_journal_path())
+        self.replaying = False
+
+        self.journal_entries = replayed_entries
+        if replayed_entries: print(f"Recovered {replayed_entries} edits from the autosave journal.")
+        return replayed_entries
+
+    def compact(self) -> None:
+        if self.is_compacting(): return
+        if not self.journal_entries: return
+
+        # the current journal becomes the compacting journal, edits made while compacting go to a new journal
+        self._close_journal()
+        journal_path = self._get_journal_path()
+        compacting_path = self._get_compacting_path()
+        try:
+            if os.path.exists(journal_path) and os.path.exists(compacting_path):
+                with open(compacting_path, "a", encoding="utf-8") as compacting_file, open(journal_path, "r", encoding="utf-8") as journal_file:
+                    compacting_file.write(journal_file.read())
+                os.remove(journal_path)
+            elif os.path.exists(journal_path):
+                os.replace(journal_path, compacting_path)
+        except Exception as e:
+            print(f"Error rotating journal file: {e}")
+            return
+
+        self.journal_entries = 0
+        self.time_since_compaction = 0
+
+        tile_map = self._snapshot_tile_map()
+        palette = self.tilemap.palette.copy()
+        tilesets = self.tilemap.get_used_tilesets_data()
+        self.compaction_thread = threading.Thread(target=self._compact_worker, args=(tile_map, palette, tilesets, compacting_path), daemon=True)
+        self.compaction_thread.start()
+
+    def clear_journal(self) -> None:
+        """Removes the journals, used after the level was saved manually."""
+        self.wait_for_compaction()
+
+        self._close_journal()
+        for path in (self._get_journal_path(), self._get_compacting_path()):
+            if os.path.exists(path): os.remove(path)
+        self.journal_entries = 0
+        self.time_since_compaction = 0
+
+    def wait_for_compaction(self) -> None:
+        if self.is_compacting(): self.compaction_thread.join()
+
+    def set_level_path(self, level_path: str) -> None:
+        """Switches to the journal of another level, the edits of the current level are compacted first."""
+        if level_path == self.level_path: return
+
+        self.compact()
+        self.wait_for_compaction()
+        self._close_journal()
+        self.level_path = level_path
+        self.journal_entries = 0
+
+    def update(self, dt: float) -> None:
+        if self.journal_file: self.journal_file.flush()
+
+        self.time_since_compaction += dt
+        if self.time_since_compaction >= self.interval: self.compact()
+
+    def close(self) -> None:
+        self.wait_for_compaction()
+        self._close_journal()
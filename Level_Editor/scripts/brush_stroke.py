@@ -0,0 +1,61 @@
+"""
+A brush stroke paints (or erases) the grid cells the mouse moves over while the mouse button is held. The
+cells between two mouse positions are interpolated with Bresenham's line algorithm, so fast drags don't leave
+gaps, and every cell is only visited once per stroke. Structure:
+
+    Brush_Stroke.visited_cells = {(tile_x, tile_y), ...}
+    Brush_Stroke.changes = [(tile_x, tile_y, old_tile_id), ...]   # the cells the stroke changed, in order
+
+A stroke with the EMPTY_TILE_ID erases. The tilemap commits a finished stroke as one edit (see
+Tilemap.end_stroke).
+"""
+
+from typing import Iterator, List, Set, Tuple
+
+from .tile_chunks import EMPTY_TILE_ID
+
+
+def get_line_cells(start: Tuple[int, int], end: Tuple[int, int]) -> Iterator[Tuple[int, int]]:
+    """Yields the cells of the line from start to end (both included) with Bresenham's line algorithm."""
+    x, y = start
+    delta_x = abs(end[0] - x)
+    delta_y = -abs(end[1] - y)
+    step_x = 1 if x < end[0] else -1
+    step_y = 1 if y < end[1] else -1
+    error = delta_x + delta_y
+
+    while True:
+        yield (x, y)
+        if x == end[0] and y == end[1]: return
+
+        double_error = error * 2
+        if double_error >= delta_y:
+            error += delta_y
+            x += step_x
+        if double_error <= delta_x:
+            error += delta_x
+            y += step_y
+
+
+class Brush_Stroke:
+    def __init__(self, layer: str, tile_id: int) -> None:
+        self.layer = layer
+        self.tile_id = tile_id
+
+        self.last_cell: Tuple[int, int] | None = None
+        self.visited_cells: Set[Tuple[int, int]] = set()
+        self.changes: List[Tuple[int, int, int]] = []
+
+    def is_erasing(self) -> bool:
+        return self.tile_id == EMPTY_TILE_ID
+
+    def get_new_cells(self, cell: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """Moves the stroke to the cell and returns the cells it passed over that weren't visited before."""
+        if cell == self.last_cell: return []
+
+        cells = [cell] if self.last_cell is None else get_line_cells(self.last_cell, cell)
+        self.last_cell = cell
+
+        new_cells = [cell for cell in cells if cell not in self.visited_cells]
+        self.visited_cells.update(new_cells)
+        return new_cells
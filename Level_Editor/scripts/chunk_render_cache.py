@@ -0,0 +1,304 @@
+"""
+The chunk render cache bakes the on grid tiles of a layer into surfaces of RENDER_BLOCK_SIZE x RENDER_BLOCK_SIZE
+cells, so a frame only has to blit a few surfaces per layer. A render block is smaller than a storage chunk
+to keep the baked surfaces small with large tile sizes. Blocks are baked per tile size (the zoom level of the
+map), only the blocks of the MAX_TILE_SIZES most recently used tile sizes are kept. Cache structure:
+
+    {((layer, ...), (block_x, block_y), (image_key, ...), tile_size): pygame.Surface | None}  # None for empty blocks
+
+A block holds a stack of layers sharing their parallax (back to front, every layer with its own image key), their
+tiles are baked on top of each other. Drawing a frame is bound by how many full screen surfaces are blended, so
+a stack costs about as much as one layer. The keys of the blocks holding a layer are indexed per block position:
+
+    layer_blocks = {layer: {(block_x, block_y): {key, ...}}}
+
+The baked blocks take at most max_bytes, the least recently used ones are dropped first. Blocks used by the
+current or the last frame (frames start with begin_frame) are never dropped, a frame needing more than max_bytes
+would otherwise bake the blocks of its last layers again on every frame.
+
+Every surface handed out (blocks, tile images and thumbnails) holds premultiplied colors and is drawn with
+BLEND_PREMULTIPLIED, it blends about twice as fast as straight alpha and the layer composites need it anyway.
+
+Above MAX_BLOCK_TILE_SIZE a block would be a large surface and only a few tiles are visible, so the tiles are
+drawn one by one (get_visible_tiles). Below MIN_BLOCK_TILE_SIZE a block would hold too little detail for what it
+costs to bake, so every chunk is drawn as a thumbnail instead, one pixel per cell in the average color of its tile,
+scaled to the chunk size:
+
+    thumbnails = {(layer, (chunk_x, chunk_y), image_key): pygame.Surface | None}
+    scaled_thumbnails = {(layer, (chunk_x, chunk_y), image_key): (chunk_pixel_size, pygame.Surface)}
+
+"""
+
+import pygame
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from .tile_chunks import Chunk_Grid, Tile_Chunk, CHUNK_SHIFT, CHUNK_MASK, CHUNK_SIZE, EMPTY_TILE_ID
+from .utils.profiler import profiler
+
+RENDER_BLOCK_SHIFT = 3
+RENDER_BLOCK_SIZE = 1 << RENDER_BLOCK_SHIFT
+
+MIN_BLOCK_TILE_SIZE = 16
+MAX_BLOCK_TILE_SIZE = 64
+MAX_TILE_SIZES = 4
+MAX_BLOCK_BYTES = 128 << 20
+MAX_THUMBNAILS = 4096
+MAX_SCALED_THUMBNAIL_PIXELS = 1 << 23
+
+
+class Chunk_Render_Cache:
+    def __init__(self, max_bytes: int = MAX_BLOCK_BYTES) -> None:
+        self.max_bytes = max_bytes
+
+        self.surfaces: OrderedDict = OrderedDict()
+        self.surface_bytes = 0
+        self.frame_keys = set()
+        self.last_frame_keys = set()
+        self.tile_sizes: OrderedDict = OrderedDict()
+        self.layer_grids: Dict[str, Chunk_Grid] = {}
+        self.layer_blocks: Dict[str, Dict[Tuple[int, int], set]] = {}
+
+        self.thumbnails: OrderedDict = OrderedDict()
+        self.scaled_thumbnails: OrderedDict = OrderedDict()
+        self.scaled_thumbnail_pixels = 0
+
+    def _bake_block(self, chunk_grids: List[Chunk_Grid], block_position: Tuple[int, int], get_tile_image: Callable[[int, str, int], pygame.Surface | None], image_keys: Tuple[str, ...], tile_size: int) -> pygame.Surface | None:
+        left = block_position[0] << RENDER_BLOCK_SHIFT
+        top = block_position[1] << RENDER_BLOCK_SHIFT
+        local_left = left & CHUNK_MASK
+        local_top = top & CHUNK_MASK
+
+        blit_sequence = []
+        for chunk_grid, image_key in zip(chunk_grids, image_keys):
+            chunk = chunk_grid.get_chunk(Chunk_Grid.get_chunk_position(left, top))
+            if chunk is None: continue
+
+            for local_y in range(RENDER_BLOCK_SIZE):
+                row = (local_top + local_y) << CHUNK_SHIFT
+                for local_x in range(RENDER_BLOCK_SIZE):
+                    tile_id = chunk.tiles[row | (local_left + local_x)]
+                    if not tile_id: continue
+                    image = get_tile_image(tile_id, image_key, tile_size)
+                    if image is None: continue
+                    blit_sequence.append((image, (local_x * tile_size, local_y * tile_size)))
+            profiler.count("tiles visited", RENDER_BLOCK_SIZE * RENDER_BLOCK_SIZE)
+
+        if not blit_sequence: return
+        block_surface = pygame.Surface((RENDER_BLOCK_SIZE * tile_size, RENDER_BLOCK_SIZE * tile_size), pygame.SRCALPHA)
+        block_surface.fblits(blit_sequence, pygame.BLEND_PREMULTIPLIED)
+        profiler.count("surfaces allocated")
+        profiler.count("blits", len(blit_sequence))
+        return block_surface
+
+    def _get_block_surface(self, layers: Tuple[str, ...], chunk_grids: List[Chunk_Grid], block_position: Tuple[int, int], get_tile_image: Callable[[int, str, int], pygame.Surface | None], image_keys: Tuple[str, ...], tile_size: int) -> pygame.Surface | None:
+        chunk_position = Chunk_Grid.get_chunk_position(block_position[0] << RENDER_BLOCK_SHIFT, block_position[1] << RENDER_BLOCK_SHIFT)
+        if all(chunk_grid.get_chunk(chunk_position) is None for chunk_grid in chunk_grids): return # empty space is not cached
+
+        key = (layers, block_position, image_keys, tile_size)
+        self.frame_keys.add(key)
+        if key in self.surfaces:
+            self.surfaces.move_to_end(key)
+            return self.surfaces[key]
+
+        block_surface = self._bake_block(chunk_grids, block_position, get_tile_image, image_keys, tile_size)
+        self.surfaces[key] = block_surface
+        for layer in layers:
+            self.layer_blocks.setdefault(layer, {}).setdefault(block_position, set()).add(key)
+        if block_surface is not None: self.surface_bytes += block_surface.get_width() * block_surface.get_height() * block_surface.get_bytesize()
+        while self.surface_bytes > self.max_bytes:
+            oldest_key = next(iter(self.surfaces))
+            if oldest_key in self.frame_keys or oldest_key in self.last_frame_keys: break # the rest is in use as well
+            self._drop_block(oldest_key)
+        return block_surface
+
+    def _drop_block(self, key: tuple) -> None:
+        if key not in self.surfaces: return
+        block_surface = self.surfaces.pop(key)
+        if block_surface is not None: self.surface_bytes -= block_surface.get_width() * block_surface.get_height() * block_surface.get_bytesize()
+        for layer in key[0]:
+            keys = self.layer_blocks[layer][key[1]]
+            keys.discard(key)
+            if not keys: del self.layer_blocks[layer][key[1]]
+
+    def _drop_blocks(self, keys: Iterable[tuple]) -> None:
+        for key in list(keys): self._drop_block(key)
+
+    def begin_frame(self) -> None:
+        """Called before a frame asks for its blocks, the blocks of the frames before the last one can be dropped from then on."""
+        self.frame_keys, self.last_frame_keys = set(), self.frame_keys
+
+    def _use_tile_size(self, tile_size: int) -> None:
+        if tile_size in self.tile_sizes:
+            self.tile_sizes.move_to_end(tile_size)
+            return
+
+        self.tile_sizes[tile_size] = None
+        if len(self.tile_sizes) <= MAX_TILE_SIZES: return
+        old_tile_size, _ = self.tile_sizes.popitem(last=False)
+        self._drop_blocks(key for key in self.surfaces if key[3] == old_tile_size)
+
+    def _create_thumbnail(self, chunk: Tile_Chunk, get_tile_color: Callable[[int, str], pygame.Color | None], image_key: str) -> pygame.Surface | None:
+        pixels = {EMPTY_TILE_ID: bytes(4)}
+        for tile_id in set(chunk.tiles):
+            if tile_id == EMPTY_TILE_ID: continue
+            color = get_tile_color(tile_id, image_key)
+            pixels[tile_id] = bytes((color.b, color.g, color.r, color.a)) if color is not None else bytes(4)
+
+        profiler.count("tiles visited", len(chunk.tiles))
+        if len(pixels) == 1: return
+        # BGRA is the pixel layout of SRCALPHA surfaces, blits between different layouts are a lot slower
+        thumbnail = pygame.image.frombytes(b"".join([pixels[tile_id] for tile_id in chunk.tiles]), (CHUNK_SIZE, CHUNK_SIZE), "BGRA")
+        thumbnail.premul_alpha_ip()
+        profiler.count("surfaces allocated")
+        return thumbnail
+
+    def _get_thumbnail(self, layer: str, chunk_grid: Chunk_Grid, chunk_position: Tuple[int, int], get_tile_color: Callable[[int, str], pygame.Color | None], image_key: str) -> pygame.Surface | None:
+        key = (layer, chunk_position, image_key)
+        if key in self.thumbnails:
+            self.thumbnails.move_to_end(key)
+            return self.thumbnails[key]
+
+        chunk = chunk_grid.get_chunk(chunk_position)
+        if chunk is None: return # empty space is not cached
+        thumbnail = self.thumbnails[key] = self._create_thumbnail(chunk, get_tile_color, image_key)
+        if len(self.thumbnails) > MAX_THUMBNAILS: self._drop_thumbnail(next(iter(self.thumbnails)))
+        return thumbnail
+
+    def _get_scaled_thumbnail(self, layer: str, chunk_grid: Chunk_Grid, chunk_position: Tuple[int, int], get_tile_color: Callable[[int, str], pygame.Color | None], image_key: str, chunk_pixel_size: int) -> pygame.Surface | None:
+        key = (layer, chunk_position, image_key)
+        scaled_thumbnail = self.scaled_thumbnails.get(key)
+        if scaled_thumbnail is not None and scaled_thumbnail[0] == chunk_pixel_size:
+            self.scaled_thumbnails.move_to_end(key)
+            return scaled_thumbnail[1]
+
+        thumbnail = self._get_thumbnail(layer, chunk_grid, chunk_position, get_tile_color, image_key)
+        if thumbnail is None: return
+
+        # shrinking averages the cells, growing keeps them sharp
+        if chunk_pixel_size < CHUNK_SIZE: surface = pygame.transform.smoothscale(thumbnail, (chunk_pixel_size, chunk_pixel_size))
+        else: surface = pygame.transform.scale(thumbnail, (chunk_pixel_size, chunk_pixel_size))
+        profiler.count("surfaces allocated")
+
+        self._drop_scaled_thumbnail(key)
+        self.scaled_thumbnails[key] = (chunk_pixel_size, surface)
+        self.scaled_thumbnail_pixels += chunk_pixel_size * chunk_pixel_size
+        while self.scaled_thumbnail_pixels > MAX_SCALED_THUMBNAIL_PIXELS and len(self.scaled_thumbnails) > 1:
+            self._drop_scaled_thumbnail(next(iter(self.scaled_thumbnails)))
+        return surface
+
+    def _drop_scaled_thumbnail(self, key: tuple) -> None:
+        scaled_thumbnail = self.scaled_thumbnails.pop(key, None)
+        if scaled_thumbnail is not None: self.scaled_thumbnail_pixels -= scaled_thumbnail[0] * scaled_thumbnail[0]
+
+    def _drop_thumbnail(self, key: tuple) -> None:
+        self.thumbnails.pop(key, None)
+        self._drop_scaled_thumbnail(key)
+
+    def mark_dirty(self, layer: str, x: int, y: int) -> None:
+        """Drops the baked surfaces of the block and the thumbnails of the chunk containing the tile at grid position (x, y)."""
+        block_position = (x >> RENDER_BLOCK_SHIFT, y >> RENDER_BLOCK_SHIFT)
+        self._drop_blocks(self.layer_blocks.get(layer, {}).get(block_position, ()))
+
+        chunk_position = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        self._drop_thumbnail((layer, chunk_position, "normal"))
+        self._drop_thumbnail((layer, chunk_position, "alpha"))
+
+    def mark_area_dirty(self, layer: str, left: int, top: int, right: int, bottom: int) -> None:
+        """Drops the baked surfaces and thumbnails overlapping the tile area, right and bottom are inclusive."""
+        block_left, block_top = left >> RENDER_BLOCK_SHIFT, top >> RENDER_BLOCK_SHIFT
+        block_right, block_bottom = right >> RENDER_BLOCK_SHIFT, bottom >> RENDER_BLOCK_SHIFT
+        for block_position, keys in list(self.layer_blocks.get(layer, {}).items()):
+            if block_left <= block_position[0] <= block_right and block_top <= block_position[1] <= block_bottom: self._drop_blocks(keys)
+
+        chunk_left, chunk_top = left >> CHUNK_SHIFT, top >> CHUNK_SHIFT
+        chunk_right, chunk_bottom = right >> CHUNK_SHIFT, bottom >> CHUNK_SHIFT
+        for key in [key for key in self.thumbnails if key[0] == layer and chunk_left <= key[1][0] <= chunk_right and chunk_top <= key[1][1] <= chunk_bottom]:
+            self._drop_thumbnail(key)
+
+    def invalidate_layer(self, layer: str) -> None:
+        for keys in list(self.layer_blocks.get(layer, {}).values()):
+            self._drop_blocks(keys)
+        self.layer_blocks.pop(layer, None)
+        for key in [key for key in self.thumbnails if key[0] == layer]:
+            self._drop_thumbnail(key)
+
+    def clear(self) -> None:
+        self.surfaces.clear()
+        self.surface_bytes = 0
+        self.tile_sizes.clear()
+        self.layer_grids.clear()
+        self.layer_blocks.clear()
+        self.thumbnails.clear()
+        self.scaled_thumbnails.clear()
+        self.scaled_thumbnail_pixels = 0
+
+    def _check_layer_grid(self, layer: str, chunk_grid: Chunk_Grid) -> None:
+        if self.layer_grids.get(layer) is not chunk_grid:
+            # the layer was replaced (removed and added again, or loaded from a file)
+            self.invalidate_layer(layer)
+            self.layer_grids[layer] = chunk_grid
+
+    def get_visible_blocks(self, layers: Tuple[str, ...], chunk_grids: List[Chunk_Grid], get_tile_image: Callable[[int, str, int], pygame.Surface | None], image_keys: Tuple[str, ...], render_offset: List[int] | Tuple[int], render_size: List[int] | Tuple[int], tile_size: int) -> List[Tuple[pygame.Surface, Tuple[int, int]]]:
+        """Returns (surface, position) pairs for the baked blocks of a stack of layers (back to front, with their chunk grids
+        and image keys) that are inside the render area. The layers of a stack have to share their parallax."""
+        for layer, chunk_grid in zip(layers, chunk_grids):
+            self._check_layer_grid(layer, chunk_grid)
+        self._use_tile_size(tile_size)
+
+        block_pixel_size = RENDER_BLOCK_SIZE * tile_size
+        left = render_offset[0] // block_pixel_size
+        top = render_offset[1] // block_pixel_size
+        right = (render_offset[0] + render_size[0]) // block_pixel_size
+        bottom = (render_offset[1] + render_size[1]) // block_pixel_size
+
+        blocks = []
+        for block_y in range(top, bottom + 1):
+            for block_x in range(left, right + 1):
+                block_surface = self._get_block_surface(layers, chunk_grids, (block_x, block_y), get_tile_image, image_keys, tile_size)
+                if block_surface is None: continue
+                blocks.append((block_surface, (block_x * block_pixel_size - render_offset[0], block_y * block_pixel_size - render_offset[1])))
+        return blocks
+
+    def get_visible_tiles(self, chunk_grid: Chunk_Grid, get_tile_image: Callable[[int, str, int], pygame.Surface | None], image_key: str, render_offset: List[int] | Tuple[int], render_size: List[int] | Tuple[int], tile_size: int) -> List[Tuple[pygame.Surface, Tuple[int, int]]]:
+        """Returns (image, position) pairs for the tiles of a layer that are inside the render area, without baking them."""
+        left = render_offset[0] // tile_size
+        top = render_offset[1] // tile_size
+        right = (render_offset[0] + render_size[0]) // tile_size
+        bottom = (render_offset[1] + render_size[1]) // tile_size
+
+        tiles = []
+        for chunk in chunk_grid.get_chunks_in_area(left, top, right, bottom):
+            chunk_left, chunk_top = chunk.position[0] << CHUNK_SHIFT, chunk.position[1] << CHUNK_SHIFT
+            for y in range(max(top, chunk_top), min(bottom, chunk_top + CHUNK_MASK) + 1):
+                row = (y - chunk_top) << CHUNK_SHIFT
+                for x in range(max(left, chunk_left), min(right, chunk_left + CHUNK_MASK) + 1):
+                    tile_id = chunk.tiles[row | (x - chunk_left)]
+                    if not tile_id: continue
+                    image = get_tile_image(tile_id, image_key, tile_size)
+                    if image is None: continue
+                    tiles.append((image, (x * tile_size - render_offset[0], y * tile_size - render_offset[1])))
+        profiler.count("tiles visited", (right - left + 1) * (bottom - top + 1))
+        return tiles
+
+    def get_visible_thumbnails(self, layer: str, chunk_grid: Chunk_Grid, get_tile_color: Callable[[int, str], pygame.Color | None], image_key: str, render_offset: List[int] | Tuple[int], render_size: List[int] | Tuple[int], chunk_pixel_size: int) -> List[Tuple[pygame.Surface, Tuple[int, int]]]:
+        """Returns (surface, position) pairs for the chunk thumbnails of a layer that are inside the render area."""
+        self._check_layer_grid(layer, chunk_grid)
+
+        left = render_offset[0] // chunk_pixel_size
+        top = render_offset[1] // chunk_pixel_size
+        right = (render_offset[0] + render_size[0]) // chunk_pixel_size
+        bottom = (render_offset[1] + render_size[1]) // chunk_pixel_size
+
+        # zoomed far out the render area covers more chunk positions than the level has chunks
+        if (right - left + 1) * (bottom - top + 1) > len(chunk_grid.chunks) + len(chunk_grid.pending_chunks):
+            chunk_positions = [(x, y) for x, y in chunk_grid.get_chunk_positions() if left <= x <= right and top <= y <= bottom]
+        else:
+            chunk_positions = [(x, y) for y in range(top, bottom + 1) for x in range(left, right + 1)]
+
+        thumbnails = []
+        for chunk_position in chunk_positions:
+            surface = self._get_scaled_thumbnail(layer, chunk_grid, chunk_position, get_tile_color, image_key, chunk_pixel_size)
+            if surface is None: continue
+            thumbnails.append((surface, (chunk_position[0] * chunk_pixel_size - render_offset[0], chunk_position[1] * chunk_pixel_size - render_offset[1])))
+        return thumbnails
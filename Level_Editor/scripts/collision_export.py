@@ -0,0 +1,126 @@
+"""
+Export of the on grid tiles of a level as merged collision rectangles, so a game doesn't have to merge solid
+tiles every time it loads a level. The tiles of every layer and tile type are greedy meshed: every row is split
+into runs of the same type, and a run continues the rectangle of the row above if it spans the same cells.
+The rectangles are written next to the level. Collision file structure:
+
+    {"level": "1.lvl", "tile_size": 1, "layers": {"layer": {"grass": [[x, y, width, height], ...]}}}
+
+Positions and sizes are in tiles, or in pixels if a tile_size is given. Off grid tiles are not exported.
+The files are written by export_collision in level_tools.py.
+
+A layer is meshed in bands of BAND_CHUNK_ROWS chunk rows, which can run on a process pool. The rectangles
+reaching the bottom of a band are joined with the ones continuing them at the top of the next band, so the
+result is the same as meshing the layer in one go.
+"""
+
+import os
+from array import array
+from concurrent.futures import Executor
+from itertools import groupby
+from typing import Dict, Iterable, List, Tuple
+
+from .tile_chunks import Chunk_Grid, Tile_Palette, CHUNK_SHIFT, CHUNK_SIZE
+
+COLLISION_FILE_EXTENTION = ".collision.json"
+BAND_CHUNK_ROWS = 4
+
+# [kind, x, y, width, height], the kind is the index of the tile type + 1
+Rect = List[int]
+
+
+def get_collision_path(level_path: str) -> str:
+    return os.path.splitext(level_path)[0] + COLLISION_FILE_EXTENTION
+
+def _get_row_runs(row_chunks: List[Tuple[int, array]], start: int, tile_kinds: List[int]) -> List[Tuple[int, int, int]]:
+    """Returns the (kind, first x, last x) runs of one row of the chunks, runs go on over chunk borders."""
+    runs = []
+    for chunk_x, tiles in row_chunks:
+        row = tiles[start:start + CHUNK_SIZE]
+        if not any(row): continue
+
+        x = chunk_x << CHUNK_SHIFT
+        for kind, cells in groupby(tile_kinds[tile_id] for tile_id in row):
+            length = sum(1 for _ in cells)
+            if kind:
+                if runs and runs[-1][0] == kind and runs[-1][2] == x - 1: runs[-1] = (kind, runs[-1][1], x + length - 1)
+                else: runs.append((kind, x, x + length - 1))
+            x += length
+    return runs
+
+def mesh_band(chunks: List[Tuple[int, int, bytes]], tile_kinds: List[int]) -> List[Rect]:
+    """Greedy meshes the (chunk x, chunk y, tile id bytes) chunks of consecutive chunk rows. Runs in a worker
+    process, so the chunks come as bytes."""
+    chunk_rows: Dict[int, List[Tuple[int, array]]] = {}
+    for chunk_x, chunk_y, data in sorted(chunks, key=lambda chunk: (chunk[1], chunk[0])):
+        chunk_rows.setdefault(chunk_y, []).append((chunk_x, array("H", data)))
+
+    rects = []
+    open_rects: Dict[Tuple[int, int, int], Rect] = {}
+    for chunk_y, row_chunks in chunk_rows.items():
+        for local_y in range(CHUNK_SIZE):
+            y = (chunk_y << CHUNK_SHIFT) | local_y
+            continued_rects = {}
+            for kind, left, right in _get_row_runs(row_chunks, local_y << CHUNK_SHIFT, tile_kinds):
+                rect = open_rects.pop((kind, left, right), None)
+                if rect is not None and rect[2] + rect[4] == y:
+                    rect[4] += 1
+                else:
+                    rect = [kind, left, y, right - left + 1, 1]
+                    rects.append(rect)
+                continued_rects[(kind, left, right)] = rect
+            open_rects = continued_rects
+    return rects
+
+def _get_bands(chunk_grid: Chunk_Grid) -> List[Tuple[int, int, List[Tuple[int, int, bytes]]]]:
+    """Returns the (first chunk row, chunk row after the last, chunks) bands of a layer."""
+    chunk_grid.load_all_chunks()
+    chunk_rows: Dict[int, List[Tuple[int, int, bytes]]] = {}
+    for (chunk_x, chunk_y), chunk in chunk_grid.chunks.items():
+        chunk_rows.setdefault(chunk_y, []).append((chunk_x, chunk_y, chunk.tiles.tobytes()))
+
+    bands = []
+    for chunk_y in sorted(chunk_rows):
+        if bands and bands[-1][1] == chunk_y and chunk_y - bands[-1][0] < BAND_CHUNK_ROWS:
+            bands[-1] = (bands[-1][0], chunk_y + 1, bands[-1][2] + chunk_rows[chunk_y])
+        else:
+            bands.append((chunk_y, chunk_y + 1, chunk_rows[chunk_y]))
+    return bands
+
+def _join_bands(bands: List[Tuple[int, int, List[Tuple[int, int, bytes]]]], band_rects: Iterable[List[Rect]]) -> List[Rect]:
+    """Joins the rectangles reaching the bottom of a band with the ones going on at the top of the next band."""
+    rects = []
+    bottom_rects: Dict[Tuple[int, int, int], Rect] = {}
+    previous_end = None
+    for (first_row, end_row, _), band in zip(bands, band_rects):
+        top, bottom = first_row << CHUNK_SHIFT, end_row << CHUNK_SHIFT
+        if previous_end != first_row: bottom_rects = {}
+
+        next_bottom_rects = {}
+        for rect in band:
+            kind, x, y, width, height = rect
+            above = bottom_rects.get((kind, x, width)) if y == top else None
+            if above is not None:
+                above[4] += height
+                rect = above
+            else:
+                rects.append(rect)
+            if rect[2] + rect[4] == bottom: next_bottom_rects[(kind, x, width)] = rect
+
+        bottom_rects = next_bottom_rects
+        previous_end = end_row
+    return rects
+
+def mesh_layer(chunk_grid: Chunk_Grid, tile_kinds: List[int], executor: Executor | None = None) -> List[Rect]:
+    """Returns the [kind, x, y, width, height] rectangles of the tiles with a kind, tile_kinds maps the tile ids
+    to kinds (0 for tiles without collision). The bands are meshed on the executor if there is one."""
+    bands = _get_bands(chunk_grid)
+    chunks = [band[2] for band in bands]
+    if executor is not None and len(bands) > 1: band_rects = executor.map(mesh_band, chunks, [tile_kinds] * len(bands))
+    else: band_rects = (mesh_band(band_chunks, tile_kinds) for band_chunks in chunks)
+    return _join_bands(bands, band_rects)
+
+def get_tile_kinds(palette: Tile_Palette, types: List[str]) -> List[int]:
+    """Returns the kind of every tile id, the index of its type in types + 1, or 0 if its type isn't in types."""
+    kinds = {t_type: index + 1 for index, t_type in enumerate(types)}
+    return [0] + [kinds.get(tile[0], 0) for tile in palette.tiles[1:]]
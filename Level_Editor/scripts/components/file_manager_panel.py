@@ -6,6 +6,7 @@ from typing import Any, Callable, Dict
 from ..widgets.right_click_button import Right_Click_Button
 from ..widgets.context_menu import Context_Menu
 from ..tileset import Tileset
+from ..utils.reactive import Reactive_Value
 
 
 class File_Manager_Panel(pygame_gui.elements.UIPanel):
@@ -23,8 +24,10 @@ class File_Manager_Panel(pygame_gui.elements.UIPanel):
         self.buttons = {}
         self.button_id_count = 0
         self.selected_button_id = None
+        self.has_content = Reactive_Value(False)
 
         self._create_widgets()
+        self.has_content.subscribe(self._show_no_content_label)
         self.new_radio_button_size = (self.scrolling_container.rect.width-11, 30)
 
     def _create_widgets(self) -> None:
@@ -50,6 +53,10 @@ class File_Manager_Panel(pygame_gui.elements.UIPanel):
         )
         self.no_content_label.relative_rect.center = (self.scrolling_container.rect.width / 2, 20)
         self.no_content_label.rebuild()
+
+    def _show_no_content_label(self, has_content: bool) -> None:
+        if has_content: self.no_content_label.hide()
+        else: self.no_content_label.show()
     
     def _context_menu_callback(self, context_menu_button_id: str) -> None:
         if context_menu_button_id == "delete":
@@ -81,12 +88,21 @@ class File_Manager_Panel(pygame_gui.elements.UIPanel):
         )
         
         self.buttons[button_id] = {"button": button, "callback_id": callback_id}
+        self.has_content.set(True)
+    
+    def set_option_progress(self, callback_id: str, progress: float | None) -> None:
+        """Shows the load progress (0..1) next to an option, None shows the plain name again."""
+        for button_data in self.buttons.values():
+            if button_data["callback_id"] != callback_id: continue
+            text = str(callback_id) if progress is None else f"{callback_id} ({round(progress * 100)}%)"
+            if button_data["button"].text != text: button_data["button"].set_text(text)
     
     def remove_option(self, button_id: str) -> None:
         self.callback({"option_deleted": self.buttons[button_id]["callback_id"]})
         self.buttons[button_id]["button"].kill()
         self.buttons.pop(button_id)
         self._reload_option_stack(button_id)
+        self.has_content.set(len(self.buttons) > 0)
     
     def select_option(self, button_id: str) -> None:
         button: pygame_gui.elements.UIButton = self.buttons[button_id]["button"]
@@ -137,10 +153,4 @@ class File_Manager_Panel(pygame_gui.elements.UIPanel):
                 self.new_radio_button_size = (self.scrolling_container.rect.width-11, 30)
                 button.set_dimensions(self.new_radio_button_size)
 
-        self.vertical_scrollbar_last_state = vertical_scrollbar_current_state
-
-        if len(self.buttons) > 0:
-            self.no_content_label.visible = False
-        else:
-            self.no_content_label.visible = True
-        self.no_content_label.rebuild()
\ No newline at end of file
+        self.vertical_scrollbar_last_state = vertical_scrollbar_current_state
\ No newline at end of file
@@ -4,10 +4,20 @@ from typing import List, Tuple
 
 from ..tilemap import Tilemap
 from ..utils.other import one_key_pressed
+from ..utils.profiler import profiler
+
+MAP_TOOLS = ("brush", "rect", "fill")
+MAX_CAMERA_TIME_STEP = 1 / 30 # the first frame after the editor was idle can have a long dt
+
+MIN_ZOOM = 1 / 1024
+MAX_ZOOM = 4
+ZOOM_STEP = 1.25
+FIT_MARGIN = 0.9 # part of the map the level fills after zooming to fit
+MIN_GRID_TILE_SIZE = 16
 
 class Map_Panel:
     def __init__(self, position: List[int] | Tuple[int], size: List[int] | Tuple[int], color: pygame.Color = pygame.Color(33, 40, 45), 
-                 border_width: int = 1, border_color: pygame.Color = pygame.Color(92, 96, 98), tile_size: int = 64) -> None:
+                 border_width: int = 1, border_color: pygame.Color = pygame.Color(92, 96, 98), tile_size: int = 64, load_last_level: bool = True) -> None:
         self.position = position
         self.size = (max(0, size[0]), max(0, size[1]))
         self.color = color
@@ -20,11 +30,25 @@ class Map_Panel:
         self.render_surface_position = None
         self.render_surface_size = None
 
+        self.grid_surface = None
+        self.grid_tile_size = None
+
+        self.preview_image = None
+        self.preview_image_key = None
+        self.last_stroke_world_offset = None
+
+        self.tool = "brush"
+        self.rect_selection = None
+
+        self.needs_redraw = True
+        self.last_render_state = None
+
         self.rect = None
 
-        self.tilemap = Tilemap(tile_size)
+        self.tilemap = Tilemap(tile_size, load_last_level=load_last_level, on_images_loaded=self.mark_dirty)
 
         self.world_offset = [0,0]
+        self.zoom = 1
 
         self.camera_controls = {"left": [pygame.K_LEFT], "right": [pygame.K_RIGHT], "up": [pygame.K_UP], "down": [pygame.K_DOWN]}
         self.camera_direction = pygame.math.Vector2(0,0)
@@ -55,12 +79,27 @@ class Map_Panel:
         
         self.render_surface = pygame.Surface(self.render_surface_size, pygame.SRCALPHA)
         self.render_surface.fill(self.color)
+        self.grid_surface = None
+    
+    def _create_grid_surface(self, tile_size: int) -> None:
+        # one tile larger than the render surface, so it can be shifted by the camera offset
+        width = (self.render_surface.get_width() // tile_size + 2) * tile_size
+        height = (self.render_surface.get_height() // tile_size + 2) * tile_size
+
+        self.grid_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        profiler.count("surfaces allocated")
+        for x in range(0, width, tile_size):
+            pygame.draw.line(self.grid_surface, (255,255,255, 50), (x, 0), (x, height))
+        for y in range(0, height, tile_size):
+            pygame.draw.line(self.grid_surface, (255,255,255, 50), (0, y), (width, y))
+        self.grid_tile_size = tile_size
     
     def _create_rect(self) -> None:
         self.rect = self.render_surface.get_rect()
         self.rect.topleft = self.position
     
     def _move_camera(self, dt: float) -> None:
+        dt = min(dt, MAX_CAMERA_TIME_STEP)
         self.camera_direction.x = 0
         self.camera_direction.y = 0
 
@@ -72,29 +111,23 @@ class Map_Panel:
         if self.camera_direction.length() > 0:
             self.camera_direction = self.camera_direction.normalize()
         
-        self.camera_direction *= self.camera_speed
+        self.camera_direction *= self.camera_speed / self.get_scale()
 
         self.world_offset[0] += self.camera_direction.x * dt
         self.world_offset[1] += self.camera_direction.y * dt
 
     def _draw_grid(self) -> None:
-        tile_size = self.tilemap.tile_size
-
-        number_of_row_lines = self.render_surface.get_width() // tile_size + 2
-        number_of_column_lines = self.render_surface.get_height() // tile_size + 2
+        tile_size = self.tilemap.get_render_tile_size(self.zoom)
+        if tile_size < MIN_GRID_TILE_SIZE: return # the grid would cover the tiles
+        if self.grid_surface is None or self.grid_tile_size != tile_size: self._create_grid_surface(tile_size)
 
         selected_layer_parallax = self.tilemap.get_selected_layer_parallax()
         if not selected_layer_parallax: selected_layer_parallax = 1
+        scale = self.get_scale()
 
-        for row in range(number_of_row_lines):
-            x = row * tile_size
-            if (self.world_offset[0] * selected_layer_parallax) != 0: x -= ((self.world_offset[0] * selected_layer_parallax) % tile_size)
-            pygame.draw.line(self.render_surface, (255,255,255, 50), (x, 0), (x, self.render_surface.get_height()))
-        
-        for col in range(number_of_column_lines):
-            y = col * tile_size
-            if (self.world_offset[1] * selected_layer_parallax) != 0: y -= ((self.world_offset[1] * selected_layer_parallax) % tile_size)
-            pygame.draw.line(self.render_surface, (255,255,255, 50), (0, y), (self.render_surface.get_width(), y))
+        x = -((self.world_offset[0] * selected_layer_parallax * scale) % tile_size)
+        y = -((self.world_offset[1] * selected_layer_parallax * scale) % tile_size)
+        self.render_surface.blit(self.grid_surface, (x, y))
      
     def __draw_mouse_tile_rect(self) -> None:
         mouse_position = pygame.mouse.get_pos()
@@ -124,7 +157,6 @@ class Map_Panel:
         if not layer_selected: return
 
         mouse_position = pygame.mouse.get_pos()
-        print(deleting, drawing_image)
 
         # Subtract self.position to get the relative mouse position on the grid
         relative_mouse_position = mouse_position[0] - self.position[0], mouse_position[1] - self.position[1]
@@ -133,6 +165,8 @@ class Map_Panel:
         if not self.rect.collidepoint(mouse_position): return
 
         tile_size = self.tilemap.tile_size
+        scale = self.get_scale()
+        preview_size = max(1, round(tile_size * scale))
 
         # Get the selected layer's parallax factor
         selected_layer_parallax = self.tilemap.get_selected_layer_parallax()
@@ -143,24 +177,28 @@ class Map_Panel:
         parallax_offset_x = self.world_offset[0] * selected_layer_parallax
         parallax_offset_y = self.world_offset[1] * selected_layer_parallax
 
-        # Adjust the relative mouse position by subtracting the world offset (with parallax)
-        adjusted_mouse_x = relative_mouse_position[0] + parallax_offset_x
-        adjusted_mouse_y = relative_mouse_position[1] + parallax_offset_y
+        # Adjust the relative mouse position (unzoomed) by subtracting the world offset (with parallax)
+        adjusted_mouse_x = relative_mouse_position[0] / scale + parallax_offset_x
+        adjusted_mouse_y = relative_mouse_position[1] / scale + parallax_offset_y
 
         # Snap the mouse position to the nearest tile on the grid
         tile_x = (adjusted_mouse_x // tile_size) * tile_size
         tile_y = (adjusted_mouse_y // tile_size) * tile_size
 
-        if deleting:
-            surface = pygame.Surface((tile_size+1, tile_size+1), pygame.SRCALPHA)
-            surface.fill(pygame.Color(231, 41, 41, 50))
-            self.render_surface.blit(surface, (tile_x - parallax_offset_x, tile_y - parallax_offset_y))
-            pygame.draw.rect(self.render_surface, pygame.Color(231, 41, 41, 220), pygame.Rect(tile_x - parallax_offset_x, tile_y - parallax_offset_y, tile_size+1, tile_size+1), width=1)
-        else:
-            drawing_image_copy = drawing_image.copy()
-            drawing_image_copy.set_alpha(50)
-            drawing_image_copy = pygame.transform.scale(drawing_image_copy, (tile_size, tile_size))
-            self.render_surface.blit(drawing_image_copy, (tile_x - parallax_offset_x, tile_y - parallax_offset_y))
+        # the preview is only created again when the drawing image or the tile size changes
+        preview_image_key = (None if deleting else drawing_image, preview_size)
+        if preview_image_key != self.preview_image_key:
+            if deleting:
+                self.preview_image = pygame.Surface((preview_size+1, preview_size+1), pygame.SRCALPHA)
+                self.preview_image.fill(pygame.Color(231, 41, 41, 50))
+                pygame.draw.rect(self.preview_image, pygame.Color(231, 41, 41, 220), self.preview_image.get_rect(), width=1)
+            else:
+                self.preview_image = pygame.transform.scale(drawing_image, (preview_size, preview_size))
+                self.preview_image.set_alpha(50)
+            self.preview_image_key = preview_image_key
+            profiler.count("surfaces allocated")
+
+        self.render_surface.blit(self.preview_image, ((tile_x - parallax_offset_x) * scale, (tile_y - parallax_offset_y) * scale))
 
 
     def set_dimensions(self, dimension: List[int] | Tuple[int]):
@@ -168,25 +206,172 @@ class Map_Panel:
         self._create_border()
         self._create_render_surface()
         self._create_rect()
+        self.mark_dirty()
+
+    def get_screen_rect(self) -> pygame.Rect:
+        """Returns the area of the screen the map panel draws on, border included."""
+        return self.border.copy() if self.border else self.rect.copy()
+
+    def mark_dirty(self) -> None:
+        """The map is drawn again on the next update, for changes the render state doesn't show (like edits)."""
+        self.needs_redraw = True
+
+    def _get_render_state(self, deleting: bool, drawing_image: pygame.Surface | None, layer_selected: bool) -> tuple:
+        mouse_position = pygame.mouse.get_pos()
+        if not self.rect.collidepoint(mouse_position): mouse_position = None
+        scale = self.get_scale()
+        return (int(self.world_offset[0] * scale), int(self.world_offset[1] * scale), scale, mouse_position, deleting, drawing_image, layer_selected, self.tool)
+
+    def get_scale(self) -> float:
+        """Returns how many screen pixels an unzoomed pixel of the map is drawn with."""
+        return self.tilemap.get_render_tile_size(self.zoom) / self.tilemap.tile_size
+
+    def _get_map_position(self, mouse_position_screen: List[int] | Tuple[int]) -> Tuple[float, float]:
+        """Returns the unzoomed position of the mouse on the map, without the world offset."""
+        scale = self.get_scale()
+        return ((mouse_position_screen[0] - self.position[0]) / scale, (mouse_position_screen[1] - self.position[1]) / scale)
+
+    def _get_camera_parallax(self) -> float:
+        selected_layer_parallax = self.tilemap.get_selected_layer_parallax()
+        return selected_layer_parallax if selected_layer_parallax else 1
+
+    def set_zoom(self, zoom: float, anchor_screen: List[int] | Tuple[int] | None = None) -> None:
+        """Zooms the map, keeping the selected layer under the anchor (the center of the map by default) in place."""
+        if anchor_screen is None: anchor_screen = self.rect.center
+        old_scale = self.get_scale()
+        self.zoom = min(MAX_ZOOM, max(MIN_ZOOM, zoom))
+        new_scale = self.get_scale()
+        if new_scale == old_scale: return
+
+        parallax = self._get_camera_parallax()
+        for axis in (0, 1):
+            anchor = anchor_screen[axis] - self.position[axis]
+            self.world_offset[axis] += (anchor / old_scale - anchor / new_scale) / parallax
+        self.mark_dirty()
+
+    def zoom_to_fit(self) -> None:
+        """Zooms out (or in) until the whole level fits in the map and centers it."""
+        bounds = self.tilemap.get_level_bounds()
+        if bounds is None: return
+        left, top, right, bottom = bounds
+
+        width, height = self.render_surface.get_size()
+        self.zoom = min(MAX_ZOOM, max(MIN_ZOOM, min(width / max(1, right - left), height / max(1, bottom - top)) * FIT_MARGIN))
+        scale = self.get_scale()
+
+        parallax = self._get_camera_parallax()
+        self.world_offset[0] = ((left + right) / 2 - width / 2 / scale) / parallax
+        self.world_offset[1] = ((top + bottom) / 2 - height / 2 / scale) / parallax
+        self.mark_dirty()
     
     def add_tile(self, tile_data: dict, mouse_position_screen: List[int] | Tuple[int], on_grid: bool = True) -> None:
         if not self.rect.collidepoint(mouse_position_screen): return
 
         t_type = tile_data["type"]
         variant = tile_data["variant"]
-        image = tile_data["image"].copy()
-        alpha_image = tile_data["image"].copy()
-        alpha_image.set_alpha(40)
-        position_x = (mouse_position_screen[0] - self.position[0])
-        position_y = (mouse_position_screen[1] - self.position[1])
-        position = (position_x, position_y)
+        image = tile_data["image"]
+        position = self._get_map_position(mouse_position_screen)
         
-        self.tilemap.add_tile(t_type, variant, position, image, alpha_image, on_grid=on_grid, world_offset=self.world_offset)
+        self.tilemap.add_tile(t_type, variant, position, image, on_grid=on_grid, world_offset=self.world_offset)
+    
+    def set_tool(self, tool: str) -> None:
+        if tool not in MAP_TOOLS: return
+        self.end_stroke()
+        self.rect_selection = None
+        self.tool = tool
+    
+    def _get_mouse_cell(self, mouse_position_screen: List[int] | Tuple[int]) -> Tuple[int, int] | None:
+        layer = self.tilemap.layer_manager.get_selected_layer()
+        if layer not in self.tilemap.tile_map: return
+
+        position = self._get_map_position(mouse_position_screen)
+        return self.tilemap.get_layer_grid_position(layer, position, self.world_offset)
+    
+    def use_tool(self, tile_data: dict | None, mouse_position_screen: List[int] | Tuple[int]) -> None:
+        """Starts using the selected tool at the mouse position, without tile_data the tool erases."""
+        if not self.rect.collidepoint(mouse_position_screen): return
+        if self.tilemap.is_loading(): return # edits would be lost when the level comes in
+
+        if self.tool == "brush": self.begin_stroke(tile_data, mouse_position_screen)
+        elif self.tool == "rect": self.begin_rect(tile_data, mouse_position_screen)
+        elif self.tool == "fill": self.flood_fill(tile_data, mouse_position_screen)
+    
+    def begin_rect(self, tile_data: dict | None, mouse_position_screen: List[int] | Tuple[int]) -> None:
+        cell = self._get_mouse_cell(mouse_position_screen)
+        if cell is None: return
+        self.rect_selection = {"layer": self.tilemap.layer_manager.get_selected_layer(), "tile_data": tile_data, "start": cell, "end": cell}
+    
+    def _update_rect(self, mouse_position_screen: List[int] | Tuple[int]) -> None:
+        if not self.rect.collidepoint(mouse_position_screen): return
+        cell = self._get_mouse_cell(mouse_position_screen)
+        if cell is not None: self.rect_selection["end"] = cell
+    
+    def end_rect(self) -> None:
+        """Fills (or erases) the selected rectangle in one edit."""
+        rect_selection = self.rect_selection
+        self.rect_selection = None
+        if not rect_selection: return
+
+        layer, tile_data = rect_selection["layer"], rect_selection["tile_data"]
+        (left, top), (right, bottom) = rect_selection["start"], rect_selection["end"]
+        if tile_data: self.tilemap.fill_rect(layer, left, top, right, bottom, tile_data["type"], tile_data["variant"], tile_data["image"])
+        else: self.tilemap.erase_rect(layer, left, top, right, bottom)
+    
+    def flood_fill(self, tile_data: dict | None, mouse_position_screen: List[int] | Tuple[int]) -> None:
+        cell = self._get_mouse_cell(mouse_position_screen)
+        if cell is None: return
+
+        layer = self.tilemap.layer_manager.get_selected_layer()
+        if tile_data: self.tilemap.flood_fill(layer, cell[0], cell[1], tile_data["type"], tile_data["variant"], tile_data["image"])
+        else: self.tilemap.flood_fill(layer, cell[0], cell[1])
+    
+    def _draw_rect_selection(self) -> None:
+        if not self.rect_selection: return
+        layer = self.rect_selection["layer"]
+        if layer not in self.tilemap.tile_map: return
+
+        scale = self.get_scale()
+        tile_size = self.tilemap.tile_size * scale
+        layer_parallax = self.tilemap.tile_map[layer]["parallax"] * scale
+        (start_x, start_y), (end_x, end_y) = self.rect_selection["start"], self.rect_selection["end"]
+        left, top = min(start_x, end_x), min(start_y, end_y)
+        width, height = abs(end_x - start_x) + 1, abs(end_y - start_y) + 1
+
+        selection_rect = pygame.Rect(left * tile_size - self.world_offset[0] * layer_parallax, top * tile_size - self.world_offset[1] * layer_parallax, width * tile_size + 1, height * tile_size + 1)
+        color = pygame.Color(231, 41, 41) if self.rect_selection["tile_data"] is None else pygame.Color(80, 200, 120)
+        pygame.draw.rect(self.render_surface, color, selection_rect, width=2)
+    
+    def begin_stroke(self, tile_data: dict | None, mouse_position_screen: List[int] | Tuple[int]) -> None:
+        """Starts painting the tile at the mouse position, without tile_data the stroke erases."""
+        if not self.rect.collidepoint(mouse_position_screen): return
+
+        if tile_data: started = self.tilemap.begin_stroke(tile_data["type"], tile_data["variant"], tile_data["image"])
+        else: started = self.tilemap.begin_stroke()
+        if started: self.continue_stroke(mouse_position_screen)
+    
+    def continue_stroke(self, mouse_position_screen: List[int] | Tuple[int]) -> None:
+        if not self.tilemap.stroke: return
+        if not self.rect.collidepoint(mouse_position_screen):
+            self.tilemap.lift_stroke()
+            return
+
+        position = self._get_map_position(mouse_position_screen)
+        self.tilemap.continue_stroke(position, world_offset=self.world_offset)
+        self.last_stroke_world_offset = tuple(self.world_offset)
+    
+    def end_stroke(self) -> None:
+        self.tilemap.end_stroke()
+
+    def undo(self) -> None:
+        self.rect_selection = None
+        self.tilemap.undo()
+
+    def redo(self) -> None:
+        self.rect_selection = None
+        self.tilemap.redo()
     
     def remove_tile(self, mouse_position_screen: List[int] | Tuple[int], on_grid: bool = True, delete_overlapping_objects: bool = False) -> None:
-        position_x = (mouse_position_screen[0] - self.position[0])
-        position_y = (mouse_position_screen[1] - self.position[1])
-        position = (position_x, position_y)
+        position = self._get_map_position(mouse_position_screen)
         self.tilemap.remove_tile(position=position, on_grid=on_grid, world_offset=self.world_offset, delete_overlapping_objects=delete_overlapping_objects)
 
     def render_map(self, render_surface: pygame.Surface, offset: List[int] | Tuple[int] = (0,0)) -> None:
@@ -201,31 +386,60 @@ class Map_Panel:
         if event.type == pygame.MOUSEBUTTONDOWN:
             if self.rect.collidepoint(event.pos):
                 if event.button == 2: self.drag_camera = True
-                if event.button == 4: self.world_offset[0 if self.alt_pressed else 1] -= self.mouse_wheel_speed
-                if event.button == 5: self.world_offset[0 if self.alt_pressed else 1] += self.mouse_wheel_speed
+                if pygame.key.get_mods() & pygame.KMOD_CTRL:
+                    if event.button == 4: self.set_zoom(self.zoom * ZOOM_STEP, event.pos)
+                    if event.button == 5: self.set_zoom(self.zoom / ZOOM_STEP, event.pos)
+                else:
+                    if event.button == 4: self.world_offset[0 if self.alt_pressed else 1] -= self.mouse_wheel_speed / self.get_scale()
+                    if event.button == 5: self.world_offset[0 if self.alt_pressed else 1] += self.mouse_wheel_speed / self.get_scale()
         if event.type == pygame.MOUSEBUTTONUP:
             if event.button == 2: self.drag_camera = False
         if event.type == pygame.MOUSEMOTION:
             if self.drag_camera: 
-                self.world_offset[0] += -event.rel[0]
-                self.world_offset[1] += -event.rel[1]
+                self.world_offset[0] += -event.rel[0] / self.get_scale()
+                self.world_offset[1] += -event.rel[1] / self.get_scale()
+            if self.tilemap.stroke:
+                if event.buttons[0]: self.continue_stroke(event.pos)
+                else: self.end_stroke() # the button was released outside of the window
+            if self.rect_selection:
+                if event.buttons[0]: self._update_rect(event.pos)
+                else: self.end_rect()
+        if event.type == pygame.MOUSEBUTTONUP:
+            if event.button == 1:
+                self.end_stroke()
+                self.end_rect()
         
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_LALT:
                 self.alt_pressed = True
+            if event.key == pygame.K_HOME:
+                self.zoom_to_fit()
         if event.type == pygame.KEYUP:
             if event.key == pygame.K_LALT:
                 self.alt_pressed = False
         
         self.tilemap.process_event(event)
 
-    def update(self, dt: float, deleting: bool = False, drawing_image: pygame.Surface | None = None, layer_selected: bool = False) -> None:
-        self.render_surface.fill(self.color)
-        self.tilemap.render_tilemap(self.render_surface, offset=(int(self.world_offset[0]), int(self.world_offset[1])))
-        
-        self._draw_grid()
-        self._draw_mouse_tile_rect(deleting, drawing_image, layer_selected)
+    def update(self, dt: float, deleting: bool = False, drawing_image: pygame.Surface | None = None, layer_selected: bool = False) -> bool:
+        """Moves the camera and draws the map again if something changed since the last update, returns True if it was drawn."""
+        render_state = self._get_render_state(deleting, drawing_image, layer_selected)
+        redraw = self.needs_redraw or render_state != self.last_render_state
+        if redraw:
+            self.render_surface.fill(self.color)
+            with profiler.timer("tile render"):
+                self.tilemap.render_tilemap(self.render_surface, offset=(self.world_offset[0], self.world_offset[1]), zoom=self.zoom)
+            
+            with profiler.timer("grid draw"):
+                self._draw_grid()
+            self._draw_mouse_tile_rect(deleting, drawing_image, layer_selected)
+            self._draw_rect_selection()
+
+            self.needs_redraw = False
+            self.last_render_state = render_state
         self._move_camera(dt)
-        
-        #self.tilemap.update()
 
+        # keep painting under the resting mouse while the camera moves
+        if self.tilemap.stroke and tuple(self.world_offset) != self.last_stroke_world_offset: self.continue_stroke(pygame.mouse.get_pos())
+        
+        self.tilemap.update(dt)
+        return redraw
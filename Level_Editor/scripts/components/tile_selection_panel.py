@@ -1,8 +1,24 @@
+"""
+The tile selection panel only creates buttons for the rows of tiles that are visible in the scrolling
+container. When the panel is scrolled, the buttons of rows that left the view are hidden and reused for
+the rows that entered it, so opening a tileset costs the same no matter how many tiles it has. Structure:
+
+    Tile_Selection_Panel.tile_ids = [tile_id, ...]          # every tile of the tileset, in palette order
+    Tile_Selection_Panel.buttons = {tile_id: Image_Button}  # only the visible tiles
+    Tile_Selection_Panel.free_buttons = [Image_Button, ...] # hidden buttons waiting to be reused
+"""
+
 import pygame
 import pygame_gui
 from typing import List, Tuple, Dict, Any, Callable
 
 from ..widgets.image_button import Image_Button
+from ..utils.reactive import Reactive_Value
+
+TILE_BUTTON_SIZE = 64
+TILE_BUTTON_SPACING = 66
+TILE_BUTTONS_PER_ROW = 3
+TILE_BUTTONS_OFFSET = (40, 19)
 
 class Tile_Selection_Panel(pygame_gui.elements.UIPanel):
     def __init__(self, manager: pygame_gui.UIManager, position: List[int] | Tuple[int], size: List[int] | Tuple[int], callback: Callable[[Any], Any] | None = None, *args, **kwargs) -> None:
@@ -10,11 +26,17 @@ class Tile_Selection_Panel(pygame_gui.elements.UIPanel):
         super().__init__(manager=manager, relative_rect=relative_rect, *args, **kwargs)
         self.callback = callback
 
-        self.buttons = {}
+        self.tiles: Dict[int, pygame.Surface] = {}
+        self.tile_ids: List[int] = []
+        self.buttons: Dict[int, Image_Button] = {}
+        self.free_buttons: List[Image_Button] = []
+        self.visible_rows = None
         self.selected_button_id = None
         self.current_scrollbar_percentage = 0
+        self.has_content = Reactive_Value(False)
 
         self._create_widgets()
+        self.has_content.subscribe(self._show_no_content_label)
     
     def _create_widgets(self) -> None:
         self.scrolling_container = pygame_gui.elements.UIScrollingContainer(
@@ -39,54 +61,109 @@ class Tile_Selection_Panel(pygame_gui.elements.UIPanel):
         )
         self.no_content_label.relative_rect.center = (self.scrolling_container.rect.width / 2, 20)
         self.no_content_label.rebuild()
+
+    def _show_no_content_label(self, has_content: bool) -> None:
+        if has_content: self.no_content_label.hide()
+        else: self.no_content_label.show()
         
 
     def _button_pressed_callback(self, button_id: str) -> None:
         self._select_button(button_id)
     
     def _select_button(self, button_id: str) -> None:
-        selected_button: pygame_gui.elements.UIButton = self.buttons[button_id]
-        selected_button.select()
-        for image_button in self.buttons.values():
-            if image_button != selected_button:
-                image_button.unselect()
+        for tile_id, image_button in self.buttons.items():
+            if tile_id == button_id: image_button.select()
+            else: image_button.unselect()
 
         if self.selected_button_id == button_id: return
         self.selected_button_id = button_id
         self.callback(button_id)
     
+    def _get_number_of_rows(self) -> int:
+        return -(-len(self.tile_ids) // TILE_BUTTONS_PER_ROW)
+    
+    def _get_button_rect(self, index: int) -> pygame.Rect:
+        x = TILE_BUTTON_SPACING * (index % TILE_BUTTONS_PER_ROW) + TILE_BUTTONS_OFFSET[0]
+        y = TILE_BUTTON_SPACING * (index // TILE_BUTTONS_PER_ROW) + TILE_BUTTONS_OFFSET[1]
+        return pygame.Rect(x, y, TILE_BUTTON_SIZE, TILE_BUTTON_SIZE)
+    
+    def _update_scrollable_area(self) -> None:
+        height = self._get_number_of_rows() * TILE_BUTTON_SPACING + TILE_BUTTONS_OFFSET[1]
+        width = TILE_BUTTONS_PER_ROW * TILE_BUTTON_SPACING + TILE_BUTTONS_OFFSET[0]
+        self.scrolling_container.set_scrollable_area_dimensions((width, height))
+    
+    def _get_visible_rows(self) -> Tuple[int, int]:
+        scroll_top = -self.scrolling_container.scrollable_container.relative_rect.top
+        first_row = (scroll_top - TILE_BUTTONS_OFFSET[1]) // TILE_BUTTON_SPACING
+        last_row = (scroll_top + self.scrolling_container.rect.height - TILE_BUTTONS_OFFSET[1]) // TILE_BUTTON_SPACING
+        return (max(0, first_row), min(self._get_number_of_rows() - 1, last_row))
+    
+    def _update_visible_buttons(self, force: bool = False) -> None:
+        visible_rows = self._get_visible_rows()
+        if visible_rows == self.visible_rows and not force: return
+        self.visible_rows = visible_rows
+
+        first_index = visible_rows[0] * TILE_BUTTONS_PER_ROW
+        last_index = min(len(self.tile_ids), (visible_rows[1] + 1) * TILE_BUTTONS_PER_ROW)
+        visible_tile_ids = set(self.tile_ids[first_index:last_index])
+
+        for tile_id in [tile_id for tile_id in self.buttons if tile_id not in visible_tile_ids]:
+            button = self.buttons.pop(tile_id)
+            button.hide()
+            self.free_buttons.append(button)
+
+        for index in range(first_index, last_index):
+            tile_id = self.tile_ids[index]
+            if tile_id in self.buttons: continue
+
+            button_rect = self._get_button_rect(index)
+            if self.free_buttons:
+                image_button = self.free_buttons.pop()
+                image_button.set_relative_position(button_rect.topleft)
+                image_button.set_tile_image(tile_id, self.tiles[tile_id])
+                image_button.show()
+            else:
+                image_button = Image_Button(
+                    id=tile_id, 
+                    image=self.tiles[tile_id], 
+                    manager=self.ui_manager, 
+                    relative_rect=button_rect,
+                    callback=self._button_pressed_callback,
+                    container=self.scrolling_container
+                )
+
+            if tile_id == self.selected_button_id: image_button.select()
+            else: image_button.unselect()
+            self.buttons[tile_id] = image_button
+    
     def remove_tileset_images(self) -> None:
         for button in self.buttons.values():
-            button.kill()
+            button.hide()
+            self.free_buttons.append(button)
         self.buttons.clear()
+        self.tiles = {}
+        self.tile_ids = []
+        self.visible_rows = None
+        self.has_content.set(False)
     
     def set_tileset_images(self, tiles: Dict[int, pygame.Surface]) -> None:
         self.remove_tileset_images()
         self.selected_button_id = None
 
-        for index, (image_id, image) in enumerate(tiles.items()):
-            image_button = Image_Button(
-                id=image_id, 
-                image=image, 
-                manager=self.ui_manager, 
-                relative_rect=pygame.Rect((66)*(index % 3)+40, (index // 3) * (66) + 19, 64, 64),
-                callback=self._button_pressed_callback,
-                container=self.scrolling_container
-            )
-            
-            self.buttons[image_id] = image_button
+        self.tiles = tiles
+        self.tile_ids = list(tiles)
+        self.has_content.set(len(self.tile_ids) > 0)
+        self._update_scrollable_area()
+        self._update_visible_buttons(force=True)
     
     def process_event(self, event: pygame.Event) -> bool:
         if event.type == pygame.WINDOWSIZECHANGED:
             self.scrolling_container.vert_scroll_bar.set_scroll_from_start_percentage(self.scrolling_container.vert_scroll_bar.start_percentage)
+            self.visible_rows = None
 
         return super().process_event(event)
     
     def update(self, time_delta: float):
-        if len(self.buttons) > 0:
-            self.no_content_label.visible = False
-        else:
-            self.no_content_label.visible = True
-        self.no_content_label.rebuild()
+        self._update_visible_buttons()
 
         return super().update(time_delta)
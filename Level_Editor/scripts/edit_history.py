@@ -0,0 +1,139 @@
+"""
+The edit history keeps the undo and redo steps of the tilemap as compact deltas. A step holds one delta per
+changed layer, the on grid cells are packed into parallel arrays (12 bytes per changed cell):
+
+    Edit_Step.deltas = {layer: Edit_Delta}
+    Edit_Delta.xs, Edit_Delta.ys = array("i", [x, ...]), array("i", [y, ...])
+    Edit_Delta.old_tile_ids, Edit_Delta.new_tile_ids = array("H", [tile_id, ...]), array("H", [tile_id, ...])
+    Edit_Delta.off_grid_changes = [(tile record, added), ...]
+
+Tile ids point into the tilemap palette, which only grows, so they stay valid while the level is open.
+Edits made between begin_group and end_group (like the cells of a brush stroke) become one step. The oldest
+steps are dropped once the history holds more than memory_limit bytes.
+"""
+
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+STEP_OVERHEAD_BYTES = 256 # rough size of the python objects around the arrays of a step
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+
+
+class Edit_Delta:
+    __slots__ = ("xs", "ys", "old_tile_ids", "new_tile_ids", "off_grid_changes")
+
+    def __init__(self) -> None:
+        self.xs = array("i")
+        self.ys = array("i")
+        self.old_tile_ids = array("H")
+        self.new_tile_ids = array("H")
+        self.off_grid_changes: List[Tuple[dict, bool]] = []
+
+    def get_memory_size(self) -> int:
+        return (len(self.xs) + len(self.ys)) * 4 + (len(self.old_tile_ids) + len(self.new_tile_ids)) * 2 + len(self.off_grid_changes) * 200
+
+
+class Edit_Step:
+    __slots__ = ("deltas", "memory_size")
+
+    def __init__(self) -> None:
+        self.deltas: Dict[str, Edit_Delta] = {}
+        self.memory_size = STEP_OVERHEAD_BYTES
+
+    def get_delta(self, layer: str) -> Edit_Delta:
+        delta = self.deltas.get(layer)
+        if delta is None: delta = self.deltas[layer] = Edit_Delta()
+        return delta
+
+
+class Edit_History:
+    def __init__(self, memory_limit: int = DEFAULT_MEMORY_LIMIT) -> None:
+        self.memory_limit = memory_limit
+
+        self.undo_steps: List[Edit_Step] = []
+        self.redo_steps: List[Edit_Step] = []
+        self.memory_size = 0
+
+        self.group_depth = 0
+        self.group_step: Edit_Step | None = None
+
+    def _push_step(self, step: Edit_Step) -> None:
+        for delta in step.deltas.values(): step.memory_size += delta.get_memory_size()
+
+        self.undo_steps.append(step)
+        self.memory_size += step.memory_size
+        for redo_step in self.redo_steps: self.memory_size -= redo_step.memory_size
+        self.redo_steps.clear()
+
+        # the newest step is always kept, even if it is larger than the limit on its own
+        while self.memory_size > self.memory_limit and len(self.undo_steps) > 1:
+            self.memory_size -= self.undo_steps.pop(0).memory_size
+
+    def _get_recording_step(self) -> Edit_Step:
+        if self.group_step is not None: return self.group_step
+        return Edit_Step()
+
+    def _finish_recording(self, step: Edit_Step) -> None:
+        if step is not self.group_step: self._push_step(step)
+
+    def begin_group(self) -> None:
+        """Everything recorded until the matching end_group is undone as one step."""
+        if self.group_depth == 0: self.group_step = Edit_Step()
+        self.group_depth += 1
+
+    def end_group(self) -> None:
+        if self.group_depth == 0: return
+        self.group_depth -= 1
+        if self.group_depth > 0: return
+
+        step = self.group_step
+        self.group_step = None
+        if step.deltas: self._push_step(step)
+
+    def record_cells(self, layer: str, xs: Iterable[int], ys: Iterable[int], old_tile_ids: Iterable[int], new_tile_ids: Iterable[int]) -> None:
+        step = self._get_recording_step()
+        delta = step.get_delta(layer)
+        delta.xs.extend(xs)
+        delta.ys.extend(ys)
+        delta.old_tile_ids.extend(old_tile_ids)
+        delta.new_tile_ids.extend(new_tile_ids)
+        self._finish_recording(step)
+
+    def record_cell(self, layer: str, x: int, y: int, old_tile_id: int, new_tile_id: int) -> None:
+        step = self._get_recording_step()
+        delta = step.get_delta(layer)
+        delta.xs.append(x)
+        delta.ys.append(y)
+        delta.old_tile_ids.append(old_tile_id)
+        delta.new_tile_ids.append(new_tile_id)
+        self._finish_recording(step)
+
+    def record_off_grid(self, layer: str, tile: dict, added: bool) -> None:
+        step = self._get_recording_step()
+        step.get_delta(layer).off_grid_changes.append((tile, added))
+        self._finish_recording(step)
+
+    def can_undo(self) -> bool:
+        return bool(self.undo_steps)
+
+    def can_redo(self) -> bool:
+        return bool(self.redo_steps)
+
+    def pop_undo_step(self) -> Edit_Step | None:
+        if not self.undo_steps: return
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        return step
+
+    def pop_redo_step(self) -> Edit_Step | None:
+        if not self.redo_steps: return
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        return step
+
+    def clear(self) -> None:
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.memory_size = 0
+        self.group_depth = 0
+        self.group_step = None
@@ -0,0 +1,97 @@
+"""
+The layer composite cache keeps the layers below and above the selected layer flattened into one surface each,
+so a frame with a resting camera is two cached blits plus the selected layer. Cache structure:
+
+    {"below": (key, pygame.Surface), "above": (key, pygame.Surface)}
+    key = (((layer, parallax), ...), camera, size, version, (layer_version, ...))
+    camera = (offset_x, offset_y, render_tile_size)
+
+A composite is rebuilt when its key changes: the camera moved or zoomed, the layers were reordered, or one of its
+layers was edited (mark_layer_dirty). The composites are only used while the camera rests (update_camera), while it
+moves a composite would be outdated on the next frame anyway. The tilemap draws every layer directly then, stacking
+the layers sharing their parallax (the selected one included) into the same blocks.
+
+The layers are drawn by a render_layers(surface, layers) function, with premultiplied tiles and BLEND_PREMULTIPLIED.
+The below composite starts from a copy of the map background, so it is the same as drawing the layers one by one.
+The above composite goes on top of the selected layer, it starts transparent and holds premultiplied colors, which
+blend onto the map like the layers drawn one by one.
+"""
+
+import pygame
+from typing import Callable, Dict, List, Tuple
+
+from .utils.profiler import profiler
+
+
+class Layer_Composite_Cache:
+    def __init__(self) -> None:
+        self.composites: Dict[str, Tuple[tuple, pygame.Surface]] = {}
+        self.last_camera: tuple | None = None
+
+        self.layer_versions: Dict[str, int] = {}
+        self.version = 0
+
+    def mark_layer_dirty(self, layer: str) -> None:
+        self.layer_versions[layer] = self.layer_versions.get(layer, 0) + 1
+
+    def clear(self) -> None:
+        """Invalidates every composite, used when tile images change."""
+        self.version += 1
+
+    def _get_key(self, layers: List[Tuple[str, float]], camera: tuple, size: Tuple[int, int]) -> tuple:
+        return (tuple(layers), camera, size, self.version, tuple(self.layer_versions.get(layer, 0) for layer, _ in layers))
+
+    def _get_surface(self, name: str, size: Tuple[int, int]) -> pygame.Surface:
+        """Returns the surface of the old composite to draw the new one on, or a new surface if the size changed."""
+        composite = self.composites.get(name)
+        if composite is not None and composite[1].get_size() == size: return composite[1]
+
+        profiler.count("surfaces allocated")
+        return pygame.Surface(size, pygame.SRCALPHA)
+
+    def update_camera(self, camera: tuple) -> bool:
+        """Called once per frame with (offset_x, offset_y, render_tile_size), returns True if the camera moved since the last frame."""
+        camera = tuple(camera)
+        camera_moved = self.last_camera != camera
+        self.last_camera = camera
+        return camera_moved
+
+    def render_below(self, render_surface: pygame.Surface, layers: List[Tuple[str, float]], camera: tuple,
+                     render_layers: Callable[[pygame.Surface, List[str]], None]) -> None:
+        """Draws the (layer, parallax) pairs, back to front, onto a render surface that only holds the map background yet.
+        The layers are drawn by calling render_layers with the surface and the layers, camera is (offset_x, offset_y, render_tile_size)."""
+        if not layers: return
+        camera = tuple(camera)
+        size = render_surface.get_size()
+
+        key = self._get_key(layers, camera, size)
+        composite = self.composites.get("below")
+        if composite is None or composite[0] != key:
+            surface = self._get_surface("below", size)
+            surface.fill((0, 0, 0, 0))
+            surface.blit(render_surface, (0, 0)) # the map background
+            render_layers(surface, [layer for layer, _ in layers])
+            composite = self.composites["below"] = (key, surface)
+
+        # the map background is opaque, premultiplied blending leaves opaque pixels as they are and is faster
+        render_surface.blit(composite[1], (0, 0), special_flags=pygame.BLEND_PREMULTIPLIED)
+        profiler.count("blits")
+
+    def render_above(self, render_surface: pygame.Surface, layers: List[Tuple[str, float]], camera: tuple,
+                     render_layers: Callable[[pygame.Surface, List[str]], None]) -> None:
+        """Draws the (layer, parallax) pairs, back to front, on top of what is on the render surface.
+        The layers are drawn by calling render_layers with the surface and the layers, camera is (offset_x, offset_y, render_tile_size)."""
+        if not layers: return
+        camera = tuple(camera)
+        size = render_surface.get_size()
+
+        key = self._get_key(layers, camera, size)
+        composite = self.composites.get("above")
+        if composite is None or composite[0] != key:
+            surface = self._get_surface("above", size)
+            surface.fill((0, 0, 0, 0))
+            render_layers(surface, [layer for layer, _ in layers])
+            composite = self.composites["above"] = (key, surface)
+
+        render_surface.blit(composite[1], (0, 0), special_flags=pygame.BLEND_PREMULTIPLIED)
+        profiler.count("blits")
@@ -1,11 +1,14 @@
 import pygame
 import pygame_gui
-from typing import List
+from typing import Any, Callable, List
 
-from .windows import Layer_Manager_Window
+from .tile_chunks import Chunk_Grid
+from .spatial_hash import Spatial_Hash
 
 class Layer_Manager:
-    def __init__(self) -> None:
+    def __init__(self, callback: Callable[[dict], Any] | None = None) -> None:
+        self.callback = callback
+
         self.layers_render_order = []
         self.layers_data = {}
 
@@ -20,6 +23,8 @@ class Layer_Manager:
         if "reorder_layers" in data: self.reorder_layers()
         if "selected_layer" in data: self.selected_layer = data["selected_layer"]["name"]
 
+        if self.callback: self.callback(data)
+
         print(data)
     
     def get_layer_render_number(self, layer_name: str) -> int | None:
@@ -39,7 +44,7 @@ class Layer_Manager:
         name = data["name"]
         parallax = data["parallax"]
         self.layers_render_order.append(name)
-        self.layers_data[name] = {"name": name, "on_grid": {}, "off_grid": [], "parallax": parallax, "render_number": self.get_layer_render_number(name)}
+        self.layers_data[name] = {"name": name, "on_grid": Chunk_Grid(), "off_grid": Spatial_Hash(), "parallax": parallax, "render_number": self.get_layer_render_number(name)}
     
     def remove_layer(self, layer_name: str) -> None:
         if layer_name == self.selected_layer: self.selected_layer = None
@@ -47,13 +52,18 @@ class Layer_Manager:
         del self.layers_data[layer_name]
     
     def reorder_layers(self) -> None:
-        self.layers_render_order = self.layer_manager_window.get_order_list()
+        self.set_layers_render_order(self.layer_manager_window.get_order_list())
+
+    def set_layers_render_order(self, layers_render_order: List[str]) -> None:
+        self.layers_render_order = list(layers_render_order)
 
         for layer in self.layers_data:
             new_layer_render_number = self.layers_render_order.index(layer)
             self.layers_data[layer]["render_number"] = new_layer_render_number
     
     def launch_layer_manager_window(self, manager: pygame_gui.UIManager, rect: pygame.Rect, blocking: bool = True, *args, **kwargs) -> None:
+        from .windows import Layer_Manager_Window # the windows are imported when first opened, it keeps them out of the startup
+
         self.layer_manager_window = Layer_Manager_Window(manager=manager, rect=rect, starting_buttons=self.layers_render_order, starting_selected_button_text=self.selected_layer, callback=self._layer_manager_window_callback, *args, **kwargs)
         self.layer_manager_window.set_blocking(blocking)
     
@@ -0,0 +1,199 @@
+"""
+Reading and writing of level files. Levels can be saved in the json layout (see tilemap.py) or in the
+binary level format, which stores the on grid tiles as chunked tile id arrays. Binary level file structure:
+
+    header          HEADER_FORMAT       magic, version, chunk size, flags, metadata size
+    metadata        utf-8 json          {"palette": [[type, variant], ...], "tilesets": [tileset dict, ...], "layers": [{"name", "parallax", "render_number", "off_grid", "chunk_count"}]}
+    chunk table     CHUNK_ENTRY_FORMAT  chunk x, chunk y, data offset, data size, compression (chunk_count entries per layer, in layer order)
+    chunk data      little endian uint16 tile ids (CHUNK_SIZE * CHUNK_SIZE per chunk), zlib compressed or raw
+
+The palette in the file maps the stored tile ids to (type, variant). The chunk data is memory mapped when a
+level is loaded and a chunk is only decoded when the tilemap first accesses it. detach_pending_chunks copies the
+compressed data of the undecoded chunks out of the mapped file, so the file can be replaced while they stay pending.
+
+Only the saved model is written: tile records are reduced to their type, variant and position, runtime data
+(like images) never reaches the file. The images are bound again after loading through the tilesets, which
+the binary format stores as Tileset.to_dict data.
+"""
+
+import os
+import mmap
+import json
+import struct
+import sys
+import zlib
+from array import array
+from functools import partial
+from typing import Callable, List, Tuple
+
+from .tile_chunks import Chunk_Grid, Tile_Palette, CHUNK_SIZE, CHUNK_AREA
+from .spatial_hash import Spatial_Hash
+
+LEVEL_FILE_EXTENTION = ".lvl"
+LEVEL_FILE_MAGIC = b"LVED"
+LEVEL_FILE_VERSION = 1
+
+HEADER_FORMAT = "<4sHHII"
+CHUNK_ENTRY_FORMAT = "<iiQIB"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+CHUNK_ENTRY_SIZE = struct.calcsize(CHUNK_ENTRY_FORMAT)
+
+FLAG_COMPRESSED = 1
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+
+def is_level_file(path: str) -> bool:
+    return path.lower().endswith(LEVEL_FILE_EXTENTION)
+
+def serialize_tile_record(tile: dict) -> dict:
+    position = tile["position"]
+    return {"type": tile["type"], "variant": tile["variant"], "position": [position[0], position[1]]}
+
+def deserialize_tile_record(data: dict) -> dict:
+    position = data["position"]
+    return {"type": data["type"], "variant": data["variant"], "position": (position[0], position[1])}
+
+def tile_map_to_json_data(tile_map: dict, palette: Tile_Palette) -> dict:
+    tile_map_data = {}
+    for layer, layer_data in tile_map.items():
+        tile_map_data[layer] = {
+            "name": layer,
+            "on_grid": layer_data["on_grid"].to_dict(palette),
+            "off_grid": [serialize_tile_record(tile) for tile in layer_data["off_grid"]],
+            "parallax": layer_data["parallax"],
+            "render_number": layer_data["render_number"]
+        }
+    return tile_map_data
+
+def tile_map_from_json_data(data: dict, palette: Tile_Palette) -> dict:
+    tile_map = {}
+    for layer, layer_data in data.items():
+        tile_map[layer] = {
+            "name": layer,
+            "on_grid": Chunk_Grid.from_dict(layer_data["on_grid"], palette),
+            "off_grid": Spatial_Hash(tiles=(deserialize_tile_record(tile) for tile in layer_data["off_grid"])),
+            "parallax": layer_data["parallax"],
+            "render_number": layer_data["render_number"]
+        }
+    return tile_map
+
+def _encode_chunk(tiles: array, compress: bool) -> tuple:
+    if sys.byteorder == "big":
+        tiles = array("H", tiles)
+        tiles.byteswap()
+    data = tiles.tobytes()
+
+    if compress:
+        compressed_data = zlib.compress(data)
+        if len(compressed_data) < len(data): return (compressed_data, COMPRESSION_ZLIB)
+    return (data, COMPRESSION_NONE)
+
+def _decode_chunk(level_data: mmap.mmap | bytes, offset: int, size: int, compression: int, tile_id_map: array | None) -> array:
+    data = level_data[offset:offset + size]
+    if compression == COMPRESSION_ZLIB: data = zlib.decompress(data)
+
+    tiles = array("H")
+    tiles.frombytes(data)
+    if sys.byteorder == "big": tiles.byteswap()
+    if len(tiles) != CHUNK_AREA: raise ValueError("Corrupted chunk in level file.")
+
+    if tile_id_map is not None: tiles = array("H", map(tile_id_map.__getitem__, tiles))
+    return tiles
+
+def _make_chunk_loader(level_mmap: mmap.mmap, offset: int, size: int, compression: int, tile_id_map: array | None) -> Callable[[], array]:
+    return partial(_decode_chunk, level_mmap, offset, size, compression, tile_id_map)
+
+def detach_pending_chunks(chunk_grid: Chunk_Grid) -> None:
+    """Makes the loaders of the pending chunks read a copy of their compressed data instead of the level file."""
+    for chunk_position, loader in chunk_grid.pending_chunks.items():
+        level_data, offset, size, compression, tile_id_map = loader.args
+        if isinstance(level_data, mmap.mmap):
+            chunk_grid.pending_chunks[chunk_position] = partial(_decode_chunk, level_data[offset:offset + size], 0, size, compression, tile_id_map)
+
+def save_level_file(tile_map: dict, palette: Tile_Palette, path: str, tilesets: List[dict] = (), compress: bool = True) -> bool:
+    try:
+        metadata = {"palette": [list(tile) for tile in palette.tiles[1:]], "tilesets": list(tilesets), "layers": []}
+        layers_chunks = []
+        for layer, layer_data in tile_map.items():
+            chunk_grid: Chunk_Grid = layer_data["on_grid"]
+            chunk_grid.load_all_chunks()
+            chunks = list(chunk_grid.chunks.values())
+            layers_chunks.append(chunks)
+            metadata["layers"].append({
+                "name": layer,
+                "parallax": layer_data["parallax"],
+                "render_number": layer_data["render_number"],
+                "off_grid": [serialize_tile_record(tile) for tile in layer_data["off_grid"]],
+                "chunk_count": len(chunks)
+            })
+        metadata_bytes = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+
+        chunk_count = sum(len(chunks) for chunks in layers_chunks)
+        data_offset = HEADER_SIZE + len(metadata_bytes) + chunk_count * CHUNK_ENTRY_SIZE
+
+        chunk_table = bytearray()
+        chunk_data = []
+        for chunks in layers_chunks:
+            for chunk in chunks:
+                data, compression = _encode_chunk(chunk.tiles, compress)
+                chunk_table += struct.pack(CHUNK_ENTRY_FORMAT, chunk.position[0], chunk.position[1], data_offset, len(data), compression)
+                chunk_data.append(data)
+                data_offset += len(data)
+
+        # written to a temporary file first, so a failed save never leaves a broken level behind
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(struct.pack(HEADER_FORMAT, LEVEL_FILE_MAGIC, LEVEL_FILE_VERSION, CHUNK_SIZE, FLAG_COMPRESSED if compress else 0, len(metadata_bytes)))
+            file.write(metadata_bytes)
+            file.write(chunk_table)
+            for data in chunk_data: file.write(data)
+        os.replace(temporary_path, path)
+        return True
+    except Exception as e:
+        print(f"Error saving level file: {e}")
+
+    return False
+
+def load_level_file(path: str, palette: Tile_Palette) -> Tuple[dict, List[dict]] | None:
+    """Loads a binary level file and returns (tile_map, tilesets), the chunks of the tile map are decoded on first access."""
+    try:
+        with open(path, "rb") as file:
+            level_mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, chunk_size, flags, metadata_size = struct.unpack_from(HEADER_FORMAT, level_mmap, 0)
+        if magic != LEVEL_FILE_MAGIC: raise ValueError("Not a level file.")
+        if version > LEVEL_FILE_VERSION: raise ValueError(f"Unsupported level file version {version}.")
+        if chunk_size != CHUNK_SIZE: raise ValueError(f"Unsupported chunk size {chunk_size}.")
+
+        metadata = json.loads(level_mmap[HEADER_SIZE:HEADER_SIZE + metadata_size].decode("utf-8"))
+
+        tile_id_map = array("H", [0] + [palette.get_tile_id(t_type, variant) for t_type, variant in metadata["palette"]])
+        if tile_id_map == array("H", range(len(tile_id_map))): tile_id_map = None
+
+        tile_map = {}
+        entry_offset = HEADER_SIZE + metadata_size
+        for layer_metadata in metadata["layers"]:
+            chunk_grid = Chunk_Grid()
+            for _ in range(layer_metadata["chunk_count"]):
+                chunk_x, chunk_y, offset, size, compression = struct.unpack_from(CHUNK_ENTRY_FORMAT, level_mmap, entry_offset)
+                chunk_grid.add_pending_chunk((chunk_x, chunk_y), _make_chunk_loader(level_mmap, offset, size, compression, tile_id_map))
+                entry_offset += CHUNK_ENTRY_SIZE
+
+            name = layer_metadata["name"]
+            off_grid = Spatial_Hash(tiles=(deserialize_tile_record(tile) for tile in layer_metadata["off_grid"]))
+            tile_map[name] = {"name": name, "on_grid": chunk_grid, "off_grid": off_grid, "parallax": layer_metadata["parallax"], "render_number": layer_metadata["render_number"]}
+        return (tile_map, metadata.get("tilesets", []))
+    except Exception as e:
+        print(f"Error loading level file: {e}")
+
+def read_level(path: str, palette: Tile_Palette) -> Tuple[dict, List[dict]] | None:
+    """Returns the (tile_map, tilesets) of a binary level file or a json level, the tiles are added to the palette."""
+    if is_level_file(path): return load_level_file(path, palette)
+
+    try:
+        with open(path, "r") as file:
+            return (tile_map_from_json_data(json.load(file), palette), [])
+    except Exception as e:
+        print(f"Error loading JSON level: {e}")
@@ -0,0 +1,281 @@
+"""
+Headless operations on level and tileset files, run by level_tool.py. They never open a window, so they can run
+on the worker processes of a process pool. Every operation takes a path and returns a result dict:
+
+    {"path": "levels/1.lvl", "ok": True, "problems": ["..."], ...}   # plus the data of the operation
+
+Tilesets are passed as {type: Tileset.to_dict data}, read from tileset files with load_tileset_files. Binary
+levels also store the tilesets they use (see level_format.py), the passed tilesets replace those of the same
+type. Json files holding a tileset ({"tileset_object": {...}}) are skipped by the level operations:
+
+    {"path": "Ground.json", "ok": True, "problems": [], "skipped": "tileset file"}
+"""
+
+import os
+import sys
+import json
+import ntpath
+import pygame
+from collections import Counter
+from functools import lru_cache
+from concurrent.futures import Executor
+from typing import Dict, List, Tuple
+
+from .tile_chunks import Tile_Palette, EMPTY_TILE_ID
+from .level_format import LEVEL_FILE_EXTENTION, is_level_file, load_level_file, save_level_file, tile_map_from_json_data, tile_map_to_json_data
+from .tileset import Tileset
+from .collision_export import COLLISION_FILE_EXTENTION, get_collision_path, get_tile_kinds, mesh_layer
+
+LEVEL_FILE_EXTENTIONS = (LEVEL_FILE_EXTENTION, ".json")
+
+
+def collect_level_paths(paths: List[str]) -> List[str]:
+    """Returns the files of the paths, directories are searched for level and json files."""
+    level_paths = []
+    for path in paths:
+        if not os.path.isdir(path):
+            level_paths.append(path)
+            continue
+        for directory, _, file_names in os.walk(path):
+            level_paths += sorted(os.path.join(directory, file_name) for file_name in file_names
+                                  if file_name.lower().endswith(LEVEL_FILE_EXTENTIONS) and not file_name.lower().endswith(COLLISION_FILE_EXTENTION))
+    return level_paths
+
+def load_tileset_files(paths: List[str]) -> Dict[str, dict]:
+    """Returns the tilesets of tileset json files by type."""
+    tilesets = {}
+    for path in paths:
+        try:
+            with open(path, "r") as file:
+                tileset_data = json.load(file)["tileset_object"]
+            tilesets[Tileset.from_dict(tileset_data).type] = tileset_data
+        except KeyError as e:
+            print(f"Error loading tileset file '{path}': no {e} value")
+        except Exception as e:
+            print(f"Error loading tileset file '{path}': {e}")
+    return tilesets
+
+def _result(path: str, **data) -> dict:
+    return {"path": path, "ok": True, "problems": [], **data}
+
+def _failed(path: str, problem: str) -> dict:
+    return {"path": path, "ok": False, "problems": [problem]}
+
+def load_level(path: str) -> Tuple[dict, List[dict], Tile_Palette] | str | None:
+    """Returns the (tile_map, tilesets, palette) of a level, "tileset file" for tileset json files or None if
+    the level can't be read."""
+    palette = Tile_Palette()
+    if is_level_file(path):
+        level = load_level_file(path, palette)
+        if level is None: return
+        return (*level, palette)
+
+    try:
+        with open(path, "r") as file:
+            data = json.load(file)
+        if "tileset_object" in data: return "tileset file"
+        return (tile_map_from_json_data(data, palette), [], palette)
+    except Exception as e:
+        print(f"Error loading JSON level '{path}': {e}")
+
+def count_tiles(tile_map: dict, palette: Tile_Palette) -> Counter:
+    """Returns the number of on grid and off grid tiles of every (type, variant) in the tile map."""
+    tile_counts = Counter()
+    for layer_data in tile_map.values():
+        tile_counts.update(_count_layer_tiles(layer_data, palette))
+    return tile_counts
+
+def _count_layer_tiles(layer_data: dict, palette: Tile_Palette) -> Counter:
+    tile_id_counts = Counter()
+    layer_data["on_grid"].load_all_chunks()
+    for chunk in layer_data["on_grid"].chunks.values(): tile_id_counts.update(chunk.tiles)
+    tile_id_counts.pop(EMPTY_TILE_ID, None)
+
+    tile_counts = Counter({palette.get_tile(tile_id): count for tile_id, count in tile_id_counts.items()})
+    tile_counts.update((tile["type"], tile["variant"]) for tile in layer_data["off_grid"])
+    return tile_counts
+
+@lru_cache(maxsize=64)
+def _get_image_size(image_path: str) -> Tuple[int, int] | None:
+    # decoded without a display, the image is never converted or drawn
+    if not os.path.exists(image_path): return
+    try:
+        return pygame.image.load(image_path).get_size()
+    except Exception as e:
+        print(f"Error loading image '{image_path}': {e}")
+
+def get_tileset_tile_count(tileset_data: dict) -> int | None:
+    """Returns the number of tiles of a tileset, None if its image can't be read. Raises KeyError if a value of
+    the tileset is missing."""
+    tileset = Tileset.from_dict(tileset_data)
+    image_size = _get_image_size(tileset.image_path)
+    if image_size is None: return
+    tiles_per_row, tiles_per_column = tileset.get_grid_size(image_size)
+    return tiles_per_row * tiles_per_column
+
+def validate_level(path: str, tilesets: Dict[str, dict] | None = None) -> dict:
+    """Checks that every tile type of the level has a tileset with a readable image and that every variant is
+    one of its tiles."""
+    level = load_level(path)
+    if level is None: return _failed(path, "the level can't be read")
+    if isinstance(level, str): return _result(path, skipped=level)
+
+    tile_map, level_tilesets, palette = level
+    tilesets = {**{tileset_data.get("type"): tileset_data for tileset_data in level_tilesets}, **(tilesets or {})}
+
+    problems = []
+    tile_counts = count_tiles(tile_map, palette)
+    for t_type in sorted({t_type for t_type, _ in tile_counts}):
+        tileset_data = tilesets.get(t_type)
+        type_tile_count = sum(count for (tile_type, _), count in tile_counts.items() if tile_type == t_type)
+        if tileset_data is None:
+            problems.append(f"type '{t_type}' has no tileset ({type_tile_count} tiles)")
+            continue
+
+        try:
+            tileset_tile_count = get_tileset_tile_count(tileset_data)
+        except KeyError as e:
+            problems.append(f"tileset of type '{t_type}' has no {e} value")
+            continue
+        if tileset_tile_count is None:
+            problems.append(f"tileset '{tileset_data['name']}' of type '{t_type}': image '{tileset_data['image_path']}' can't be read")
+            continue
+
+        for (tile_type, variant), count in sorted(tile_counts.items()):
+            if tile_type != t_type or 0 <= variant < tileset_tile_count: continue
+            problems.append(f"type '{t_type}': variant {variant} is not in tileset '{tileset_data['name']}' ({tileset_tile_count} tiles, used {count} times)")
+
+    return {"path": path, "ok": not problems, "problems": problems, "tile_count": sum(tile_counts.values())}
+
+def convert_level(path: str, output_path: str, tilesets: Dict[str, dict] | None = None) -> dict:
+    """Saves the level in the format of the output path (binary level file or json level). Binary levels get
+    the tilesets of the used types."""
+    level = load_level(path)
+    if level is None: return _failed(path, "the level can't be read")
+    if isinstance(level, str): return _result(path, skipped=level)
+
+    tile_map, level_tilesets, palette = level
+    if os.path.abspath(output_path) == os.path.abspath(path): return _failed(path, "the output path is the level itself")
+
+    if is_level_file(output_path):
+        tilesets = {**{tileset_data["type"]: tileset_data for tileset_data in level_tilesets}, **(tilesets or {})}
+        used_types = {t_type for t_type, _ in count_tiles(tile_map, palette)}
+        saved = save_level_file(tile_map, palette, output_path, tilesets=[tileset_data for t_type, tileset_data in tilesets.items() if t_type in used_types])
+    else:
+        try:
+            with open(output_path, "w") as file:
+                json.dump(tile_map_to_json_data(tile_map, palette), file, indent=4)
+            saved = True
+        except Exception as e:
+            print(f"Error saving JSON level '{output_path}': {e}")
+            saved = False
+
+    if not saved: return _failed(path, f"'{output_path}' can't be written")
+    return _result(path, output_path=output_path, bytes=os.path.getsize(path), output_bytes=os.path.getsize(output_path))
+
+def level_stats(path: str) -> dict:
+    """Returns the tile counts and the memory the tiles of every layer take up once loaded."""
+    level = load_level(path)
+    if level is None: return _failed(path, "the level can't be read")
+    if isinstance(level, str): return _result(path, skipped=level)
+
+    tile_map, _, palette = level
+    layers = {}
+    for layer, layer_data in sorted(tile_map.items(), key=lambda item: item[1]["render_number"]):
+        chunk_grid = layer_data["on_grid"]
+        tile_counts = _count_layer_tiles(layer_data, palette)
+        type_counts = Counter()
+        for (t_type, _), count in tile_counts.items(): type_counts[t_type] += count
+
+        layers[layer] = {
+            "on_grid_tiles": len(chunk_grid),
+            "off_grid_tiles": len(layer_data["off_grid"]),
+            "chunks": len(chunk_grid.chunks),
+            "bytes": sum(sys.getsizeof(chunk.tiles) for chunk in chunk_grid.chunks.values()) +
+                     sum(sys.getsizeof(tile) + sys.getsizeof(tile["position"]) for tile in layer_data["off_grid"]),
+            "types": dict(type_counts.most_common())
+        }
+    return _result(path, file_bytes=os.path.getsize(path), palette_size=len(palette), layers=layers)
+
+def export_collision(path: str, types: List[str] | None = None, tile_size: int = 1, output_path: str | None = None, executor: Executor | None = None) -> dict:
+    """Writes the greedy meshed collision rectangles of the on grid tiles next to the level (see
+    collision_export.py), only of the tile types in types if given. The bands of the layers are meshed on the
+    executor if there is one."""
+    level = load_level(path)
+    if level is None: return _failed(path, "the level can't be read")
+    if isinstance(level, str): return _result(path, skipped=level)
+
+    tile_map, _, palette = level
+    types = list(types) if types else sorted({tile[0] for tile in palette.tiles[1:]})
+    tile_kinds = get_tile_kinds(palette, types)
+
+    layers = {}
+    tile_count = rect_count = 0
+    for layer, layer_data in sorted(tile_map.items(), key=lambda item: item[1]["render_number"]):
+        layer_rects = {}
+        for kind, x, y, width, height in sorted(mesh_layer(layer_data["on_grid"], tile_kinds, executor), key=lambda rect: (rect[0], rect[2], rect[1])):
+            layer_rects.setdefault(types[kind - 1], []).append([x * tile_size, y * tile_size, width * tile_size, height * tile_size])
+            tile_count += width * height
+            rect_count += 1
+        if layer_rects: layers[layer] = layer_rects
+
+    output_path = output_path or get_collision_path(path)
+    try:
+        with open(output_path, "w") as file:
+            json.dump({"level": os.path.basename(path), "tile_size": tile_size, "layers": layers}, file, separators=(",", ":"))
+    except Exception as e:
+        print(f"Error saving collision file: {e}")
+        return _failed(path, f"'{output_path}' can't be written")
+
+    return _result(path, output_path=output_path, tiles=tile_count, rects=rect_count)
+
+def find_image(image_path: str, search_directories: List[str]) -> str | None:
+    """Returns where a missing image is now, found by its file name in the search directories. The path is
+    relative to the working directory (where the editor resolves image paths from) if the image is below it."""
+    file_name = ntpath.basename(image_path) # handles paths saved on windows too
+    for directory in search_directories:
+        found_path = os.path.join(directory, file_name)
+        if not os.path.isfile(found_path): continue
+
+        relative_path = os.path.relpath(os.path.abspath(found_path))
+        return relative_path.replace(os.sep, "/") if not relative_path.startswith("..") else os.path.abspath(found_path).replace(os.sep, "/")
+
+def fix_image_paths(path: str, search_directories: List[str] | None = None, dry_run: bool = False) -> dict:
+    """Rewrites the image paths that don't exist of a tileset file or of the tilesets stored in a binary level,
+    the file's own directory is searched first."""
+    search_directories = [os.path.dirname(os.path.abspath(path))] + list(search_directories or [])
+
+    def fix(tileset_data: dict, problems: List[str], fixed: Dict[str, str]) -> None:
+        image_path = tileset_data["image_path"]
+        if os.path.exists(image_path): return
+        found_path = find_image(image_path, search_directories)
+        if found_path is None:
+            problems.append(f"tileset '{tileset_data['name']}': image '{image_path}' was not found")
+            return
+        fixed[image_path] = found_path
+        tileset_data["image_path"] = found_path
+
+    problems, fixed = [], {}
+    if is_level_file(path):
+        level = load_level(path)
+        if level is None: return _failed(path, "the level can't be read")
+        tile_map, tilesets, palette = level
+        for tileset_data in tilesets: fix(tileset_data, problems, fixed)
+        if fixed and not dry_run and not save_level_file(tile_map, palette, path, tilesets=tilesets): return _failed(path, "the level can't be written")
+        return {"path": path, "ok": not problems, "problems": problems, "fixed": fixed}
+
+    try:
+        with open(path, "r") as file:
+            data = json.load(file)
+    except Exception as e:
+        return _failed(path, f"the file can't be read: {e}")
+    if "tileset_object" not in data: return _result(path, skipped="json level, it has no tilesets", fixed={})
+
+    fix(data["tileset_object"], problems, fixed)
+    if fixed and not dry_run:
+        try:
+            with open(path, "w") as file:
+                json.dump(data, file, indent=4)
+        except Exception as e:
+            return _failed(path, f"the file can't be written: {e}")
+    return {"path": path, "ok": not problems, "problems": problems, "fixed": fixed}
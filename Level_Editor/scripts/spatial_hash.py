@@ -0,0 +1,87 @@
+"""
+The spatial hash indexes off grid tiles by their position in a uniform grid of cell_size x cell_size pixel
+cells, so duplicate checks, area queries and hit tests only look at the tiles near the position. Structure:
+
+    Spatial_Hash.tiles = {(x, y): tile}                      # in insertion (render) order
+    Spatial_Hash.cells = {(cell_x, cell_y): {(x, y): tile}}
+
+Only positions are indexed, so queries for tiles of a certain size have to be widened by that size by the
+caller (see get_tiles_at).
+"""
+
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+DEFAULT_CELL_SIZE = 256
+
+
+class Spatial_Hash:
+    def __init__(self, cell_size: int = DEFAULT_CELL_SIZE, tiles: Iterable[dict] = ()) -> None:
+        self.cell_size = cell_size
+
+        self.tiles: Dict[Tuple[float, float], dict] = {}
+        self.cells: Dict[Tuple[int, int], Dict[Tuple[float, float], dict]] = {}
+        self.insert_numbers: Dict[Tuple[float, float], int] = {}
+        self.insert_count = 0
+
+        for tile in tiles: self.add(tile)
+
+    def _get_cell_position(self, x: float, y: float) -> Tuple[int, int]:
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def add(self, tile: dict) -> bool:
+        """Adds a tile, returns False if there already is a tile at its position."""
+        position = tile["position"]
+        if position in self.tiles: return False
+
+        self.tiles[position] = tile
+        self.cells.setdefault(self._get_cell_position(position[0], position[1]), {})[position] = tile
+        self.insert_numbers[position] = self.insert_count
+        self.insert_count += 1
+        return True
+
+    def remove(self, position: Tuple[float, float]) -> dict | None:
+        tile = self.tiles.pop(position, None)
+        if tile is None: return
+
+        cell_position = self._get_cell_position(position[0], position[1])
+        cell = self.cells[cell_position]
+        del cell[position]
+        if not cell: del self.cells[cell_position]
+        del self.insert_numbers[position]
+        return tile
+
+    def get(self, position: Tuple[float, float]) -> dict | None:
+        return self.tiles.get(position)
+
+    def query_area(self, left: float, top: float, right: float, bottom: float) -> List[dict]:
+        """Returns the tiles with left <= x < right and top <= y < bottom, in render order."""
+        cell_left, cell_top = self._get_cell_position(left, top)
+        cell_right, cell_bottom = self._get_cell_position(right, bottom)
+
+        # a large area (like a zoomed out map) covers more cell positions than there are cells
+        if (cell_right - cell_left + 1) * (cell_bottom - cell_top + 1) > len(self.cells):
+            cells = [cell for (cell_x, cell_y), cell in self.cells.items() if cell_left <= cell_x <= cell_right and cell_top <= cell_y <= cell_bottom]
+        else:
+            cells = [self.cells[(cell_x, cell_y)] for cell_y in range(cell_top, cell_bottom + 1) for cell_x in range(cell_left, cell_right + 1) if (cell_x, cell_y) in self.cells]
+
+        tiles = []
+        for cell in cells:
+            for (x, y), tile in cell.items():
+                if left <= x < right and top <= y < bottom: tiles.append(tile)
+
+        tiles.sort(key=lambda tile: self.insert_numbers[tile["position"]])
+        return tiles
+
+    def get_tiles_at(self, point: Tuple[float, float], tile_size: int) -> List[dict]:
+        """Returns the tiles of size tile_size x tile_size that contain the point, in render order."""
+        tiles = self.query_area(point[0] - tile_size, point[1] - tile_size, point[0] + 1, point[1] + 1)
+        return [tile for tile in tiles if tile["position"][0] <= point[0] < tile["position"][0] + tile_size and tile["position"][1] <= point[1] < tile["position"][1] + tile_size]
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.tiles.values())
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+    def __contains__(self, position: Tuple[float, float]) -> bool:
+        return position in self.tiles
@@ -0,0 +1,293 @@
+"""
+On grid tiles are stored in chunks of CHUNK_SIZE x CHUNK_SIZE cells. Every chunk holds a flat array
+of tile ids, where a tile id points to a (type, variant) pair in the Tile_Palette.
+
+    Chunk_Grid.chunks = {(chunk_x, chunk_y): Tile_Chunk}
+
+    Tile_Chunk.tiles = array("H", [tile_id, tile_id, ...])  # row major, EMPTY_TILE_ID for no tile
+
+Chunks can also be pending, in which case they are only decoded (by calling their loader) the first time
+they are accessed. This is used to load level files lazily (see level_format.py).
+
+Bulk edits (fill_rect, flood_fill) write whole rows of a chunk at once and return the cells they changed as
+parallel arrays:
+
+    (array("i", [x, ...]), array("i", [y, ...]), array("H", [old_tile_id, ...]))
+"""
+
+from array import array
+from typing import Callable, Dict, Iterator, List, Tuple
+
+CHUNK_SHIFT = 5
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+CHUNK_AREA = CHUNK_SIZE * CHUNK_SIZE
+
+EMPTY_TILE_ID = 0
+
+
+class Tile_Palette:
+    def __init__(self) -> None:
+        self.tiles: List[Tuple[str, int] | None] = [None] # tile_id -> (type, variant), id 0 is the empty tile
+        self.tile_ids: Dict[Tuple[str, int], int] = {}
+
+    def get_tile_id(self, t_type: str, variant: int) -> int:
+        key = (t_type, variant)
+        tile_id = self.tile_ids.get(key)
+        if tile_id is None:
+            tile_id = len(self.tiles)
+            self.tiles.append(key)
+            self.tile_ids[key] = tile_id
+        return tile_id
+
+    def get_tile(self, tile_id: int) -> Tuple[str, int] | None:
+        if not 0 < tile_id < len(self.tiles): return
+        return self.tiles[tile_id]
+
+    def copy(self) -> "Tile_Palette":
+        palette = Tile_Palette()
+        palette.tiles = self.tiles.copy()
+        palette.tile_ids = self.tile_ids.copy()
+        return palette
+
+    def __len__(self) -> int:
+        return len(self.tiles) - 1
+
+
+class Tile_Chunk:
+    __slots__ = ("position", "tiles", "tile_count")
+
+    def __init__(self, position: Tuple[int, int], tiles: array | None = None) -> None:
+        self.position = position
+        self.tiles = tiles if tiles is not None else array("H", bytes(CHUNK_AREA * 2))
+        self.tile_count = CHUNK_AREA - self.tiles.count(EMPTY_TILE_ID) if tiles is not None else 0
+
+    def get_tile_id(self, local_x: int, local_y: int) -> int:
+        return self.tiles[(local_y << CHUNK_SHIFT) | local_x]
+
+    def set_tile_id(self, local_x: int, local_y: int, tile_id: int) -> int:
+        index = (local_y << CHUNK_SHIFT) | local_x
+        old_tile_id = self.tiles[index]
+        if old_tile_id == tile_id: return old_tile_id
+
+        self.tiles[index] = tile_id
+        if old_tile_id == EMPTY_TILE_ID: self.tile_count += 1
+        elif tile_id == EMPTY_TILE_ID: self.tile_count -= 1
+        return old_tile_id
+
+    def iter_tiles(self) -> Iterator[Tuple[int, int, int]]:
+        """Yields (local_x, local_y, tile_id) for every non empty cell."""
+        for index, tile_id in enumerate(self.tiles):
+            if tile_id: yield (index & CHUNK_MASK, index >> CHUNK_SHIFT, tile_id)
+
+
+class Chunk_Grid:
+    def __init__(self) -> None:
+        self.chunks: Dict[Tuple[int, int], Tile_Chunk] = {}
+        self.pending_chunks: Dict[Tuple[int, int], Callable[[], array]] = {}
+
+    def _load_pending_chunk(self, chunk_position: Tuple[int, int]) -> Tile_Chunk | None:
+        loader = self.pending_chunks.pop(chunk_position, None)
+        if loader is None: return
+
+        chunk = Tile_Chunk(chunk_position, loader())
+        if chunk.tile_count == 0: return
+        self.chunks[chunk_position] = chunk
+        return chunk
+
+    def add_pending_chunk(self, chunk_position: Tuple[int, int], loader: Callable[[], array]) -> None:
+        self.chunks.pop(chunk_position, None)
+        self.pending_chunks[chunk_position] = loader
+
+    def load_all_chunks(self) -> None:
+        for chunk_position in list(self.pending_chunks):
+            self._load_pending_chunk(chunk_position)
+
+    @staticmethod
+    def get_chunk_position(x: int, y: int) -> Tuple[int, int]:
+        return (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+
+    def get_chunk(self, chunk_position: Tuple[int, int]) -> Tile_Chunk | None:
+        chunk = self.chunks.get(chunk_position)
+        if chunk is None and self.pending_chunks: return self._load_pending_chunk(chunk_position)
+        return chunk
+
+    def get_tile_id(self, x: int, y: int) -> int:
+        chunk = self.get_chunk((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None: return EMPTY_TILE_ID
+        return chunk.tiles[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+    def set_tile_id(self, x: int, y: int, tile_id: int) -> int:
+        """Sets the tile id of a cell and returns the tile id it replaced."""
+        chunk_position = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.get_chunk(chunk_position)
+        if chunk is None:
+            if tile_id == EMPTY_TILE_ID: return EMPTY_TILE_ID
+            chunk = self.chunks[chunk_position] = Tile_Chunk(chunk_position)
+
+        old_tile_id = chunk.set_tile_id(x & CHUNK_MASK, y & CHUNK_MASK, tile_id)
+        if chunk.tile_count == 0: del self.chunks[chunk_position]
+        return old_tile_id
+
+    def remove_tile(self, x: int, y: int) -> int:
+        return self.set_tile_id(x, y, EMPTY_TILE_ID)
+
+    def fill_rect(self, left: int, top: int, right: int, bottom: int, tile_id: int, changes: Tuple[array, array, array] | None = None) -> Tuple[array, array, array]:
+        """Sets every cell of the area (right and bottom are inclusive) to the tile id, returns the changed cells."""
+        if changes is None: changes = (array("i"), array("i"), array("H"))
+        changed_xs, changed_ys, old_tile_ids = changes
+
+        for chunk_y in range(top >> CHUNK_SHIFT, (bottom >> CHUNK_SHIFT) + 1):
+            for chunk_x in range(left >> CHUNK_SHIFT, (right >> CHUNK_SHIFT) + 1):
+                chunk_position = (chunk_x, chunk_y)
+                chunk = self.get_chunk(chunk_position)
+                if chunk is None:
+                    if tile_id == EMPTY_TILE_ID: continue
+                    chunk = self.chunks[chunk_position] = Tile_Chunk(chunk_position)
+
+                chunk_left = chunk_x << CHUNK_SHIFT
+                chunk_top = chunk_y << CHUNK_SHIFT
+                local_left = max(left, chunk_left) - chunk_left
+                local_right = min(right, chunk_left + CHUNK_MASK) - chunk_left
+                width = local_right - local_left + 1
+                new_row = array("H", [tile_id]) * width
+
+                for local_y in range(max(top, chunk_top) - chunk_top, min(bottom, chunk_top + CHUNK_MASK) - chunk_top + 1):
+                    start = (local_y << CHUNK_SHIFT) | local_left
+                    old_row = chunk.tiles[start:start + width]
+                    if old_row == new_row: continue
+
+                    chunk.tile_count += old_row.count(EMPTY_TILE_ID) - (width if tile_id == EMPTY_TILE_ID else 0)
+                    x = chunk_left + local_left
+                    y = chunk_top + local_y
+                    if tile_id not in old_row: # every cell changes, the common case when filling empty space
+                        changed_xs.extend(range(x, x + width))
+                        changed_ys.extend(array("i", [y]) * width)
+                        old_tile_ids.extend(old_row)
+                    else:
+                        for local_x, old_tile_id in enumerate(old_row):
+                            if old_tile_id == tile_id: continue
+                            changed_xs.append(x + local_x)
+                            changed_ys.append(y)
+                            old_tile_ids.append(old_tile_id)
+                    chunk.tiles[start:start + width] = new_row
+
+                if chunk.tile_count == 0: del self.chunks[chunk_position]
+        return changes
+
+    def get_row(self, left: int, right: int, y: int) -> array:
+        """Returns the tile ids of the cells from left to right (inclusive) in row y."""
+        row = array("H")
+        chunk_y = y >> CHUNK_SHIFT
+        local_y = y & CHUNK_MASK
+        for chunk_x in range(left >> CHUNK_SHIFT, (right >> CHUNK_SHIFT) + 1):
+            chunk_left = chunk_x << CHUNK_SHIFT
+            local_left = max(left, chunk_left) - chunk_left
+            width = min(right, chunk_left + CHUNK_MASK) - chunk_left - local_left + 1
+
+            chunk = self.get_chunk((chunk_x, chunk_y))
+            if chunk is None:
+                row.extend(array("H", [EMPTY_TILE_ID]) * width)
+            else:
+                start = (local_y << CHUNK_SHIFT) | local_left
+                row.extend(chunk.tiles[start:start + width])
+        return row
+
+    def flood_fill(self, x: int, y: int, tile_id: int, bounds: Tuple[int, int, int, int]) -> Tuple[array, array, array]:
+        """Sets the cells connected to (x, y) that hold the same tile id as it to the tile id, without leaving the
+        bounds (left, top, right, bottom, inclusive). Returns the changed cells."""
+        changes = (array("i"), array("i"), array("H"))
+        left, top, right, bottom = bounds
+        if not (left <= x <= right and top <= y <= bottom): return changes
+        target_tile_id = self.get_tile_id(x, y)
+        if target_tile_id == tile_id: return changes
+
+        # scanline fill on copies of the rows inside the bounds, every filled span is written with one fill_rect call
+        rows: Dict[int, array] = {}
+        last_index = right - left
+        seeds = [(x - left, y)]
+        while seeds:
+            seed_index, seed_y = seeds.pop()
+            row = rows.get(seed_y)
+            if row is None: row = rows[seed_y] = self.get_row(left, right, seed_y)
+            if row[seed_index] != target_tile_id: continue
+
+            span_left = seed_index
+            while span_left > 0 and row[span_left - 1] == target_tile_id: span_left -= 1
+            span_right = seed_index
+            while span_right < last_index and row[span_right + 1] == target_tile_id: span_right += 1
+            row[span_left:span_right + 1] = array("H", [tile_id]) * (span_right - span_left + 1)
+            self.fill_rect(left + span_left, seed_y, left + span_right, seed_y, tile_id, changes)
+
+            for row_y in (seed_y - 1, seed_y + 1):
+                if not top <= row_y <= bottom: continue
+                next_row = rows.get(row_y)
+                if next_row is None: next_row = rows[row_y] = self.get_row(left, right, row_y)
+
+                span = next_row[span_left:span_right + 1]
+                if target_tile_id not in span: continue
+                if span.count(target_tile_id) == len(span):
+                    seeds.append((span_left, row_y))
+                    continue
+
+                in_span = False
+                for index in range(span_left, span_right + 1):
+                    if next_row[index] == target_tile_id:
+                        if not in_span: seeds.append((index, row_y))
+                        in_span = True
+                    else:
+                        in_span = False
+        return changes
+
+    def get_chunks_in_area(self, left: int, top: int, right: int, bottom: int) -> Iterator[Tile_Chunk]:
+        """Yields the existing chunks overlapping the tile area, right and bottom are inclusive."""
+        for chunk_y in range(top >> CHUNK_SHIFT, (bottom >> CHUNK_SHIFT) + 1):
+            for chunk_x in range(left >> CHUNK_SHIFT, (right >> CHUNK_SHIFT) + 1):
+                chunk = self.get_chunk((chunk_x, chunk_y))
+                if chunk is not None: yield chunk
+
+    def get_chunk_positions(self) -> List[Tuple[int, int]]:
+        """Returns the positions of the loaded and the pending chunks, without loading any."""
+        return list(self.chunks) + list(self.pending_chunks)
+
+    def get_extent(self) -> Tuple[int, int, int, int] | None:
+        """Returns the cell area (left, top, right, bottom, inclusive) covered by the chunks, or None if there are none."""
+        chunk_positions = self.get_chunk_positions()
+        if not chunk_positions: return None
+        chunk_xs, chunk_ys = [position[0] for position in chunk_positions], [position[1] for position in chunk_positions]
+        return (min(chunk_xs) << CHUNK_SHIFT, min(chunk_ys) << CHUNK_SHIFT, ((max(chunk_xs) + 1) << CHUNK_SHIFT) - 1, ((max(chunk_ys) + 1) << CHUNK_SHIFT) - 1)
+
+    def iter_tiles(self) -> Iterator[Tuple[int, int, int]]:
+        """Yields (x, y, tile_id) for every tile in the grid."""
+        self.load_all_chunks()
+        for (chunk_x, chunk_y), chunk in self.chunks.items():
+            for local_x, local_y, tile_id in chunk.iter_tiles():
+                yield ((chunk_x << CHUNK_SHIFT) | local_x, (chunk_y << CHUNK_SHIFT) | local_y, tile_id)
+
+    def copy(self) -> "Chunk_Grid":
+        """Copies the loaded chunks, the pending chunks stay undecoded and share their loaders with the copy."""
+        chunk_grid = Chunk_Grid()
+        for chunk_position, chunk in self.chunks.items():
+            chunk_grid.chunks[chunk_position] = Tile_Chunk(chunk_position, array("H", chunk.tiles))
+        chunk_grid.pending_chunks = self.pending_chunks.copy()
+        return chunk_grid
+
+    def to_dict(self, palette: Tile_Palette) -> dict:
+        """Returns the tiles in the json on_grid layout: {"x;y": {"type": ..., "variant": ..., "position": [x, y]}}"""
+        on_grid = {}
+        for x, y, tile_id in self.iter_tiles():
+            t_type, variant = palette.get_tile(tile_id)
+            on_grid[f"{x};{y}"] = {"type": t_type, "variant": variant, "position": (x, y)}
+        return on_grid
+
+    @staticmethod
+    def from_dict(data: dict, palette: Tile_Palette) -> "Chunk_Grid":
+        chunk_grid = Chunk_Grid()
+        for tile in data.values():
+            x, y = tile["position"]
+            chunk_grid.set_tile_id(int(x), int(y), palette.get_tile_id(tile["type"], tile["variant"]))
+        return chunk_grid
+
+    def __len__(self) -> int:
+        self.load_all_chunks()
+        return sum(chunk.tile_count for chunk in self.chunks.values())
@@ -0,0 +1,142 @@
+"""
+The tile image registry shares one pre scaled surface between every tile of the same variant. Images are
+created the first time they are asked for and stored per tile size (one level per zoom level of the map):
+
+    {64: {("grass", 0, False, False): pygame.Surface, ("grass", 0, True, False): pygame.Surface}, 16: {...}}
+    key = (type, variant, alpha, premultiplied)
+
+Only the MAX_IMAGE_LEVELS most recently used tile sizes are kept, zooming drops the images of the oldest one.
+The average color of every variant is stored as well, it is what the chunk thumbnails are drawn with.
+Premultiplied images have their colors multiplied by their alpha (ALPHA_VALUE included for alpha images), they
+are drawn with BLEND_PREMULTIPLIED onto surfaces holding premultiplied colors, like the layer composites.
+
+The source images come from the registered tilesets (tilesets are identified by their type, since that is
+what the tiles store), or from images added with add_source_image when no tileset is registered. Tilesets
+stored in a level file are added as data, their image is loaded on the image loader when one of their images is
+first needed. Until then the variant has no image, on_tileset_loaded is called once it has, so the caches holding
+what was drawn without it can be dropped.
+"""
+
+import pygame
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+from .tileset import Tileset
+from .utils.profiler import profiler
+
+ALPHA_VALUE = 40
+MAX_IMAGE_LEVELS = 4
+
+
+class Tile_Image_Registry:
+    def __init__(self, on_tileset_loaded: Callable[[Tileset], Any] | None = None) -> None:
+        self.on_tileset_loaded = on_tileset_loaded
+        self.tilesets: Dict[str, Tileset] = {}
+        self.tilesets_data: Dict[str, dict] = {}
+        self.source_images: Dict[Tuple[str, int], pygame.Surface] = {}
+        self.levels: OrderedDict = OrderedDict()
+        self.average_colors: Dict[Tuple[str, int], pygame.Color] = {}
+
+    def _remove_images_of_type(self, t_type: str) -> None:
+        for images in self.levels.values():
+            for key in [key for key in images if key[0] == t_type]:
+                del images[key]
+        for key in [key for key in self.average_colors if key[0] == t_type]:
+            del self.average_colors[key]
+
+    def add_tileset(self, tileset: Tileset) -> None:
+        if self.tilesets.get(tileset.type) is tileset: return
+
+        self.tilesets[tileset.type] = tileset
+        self._remove_images_of_type(tileset.type)
+
+    def add_tileset_data(self, data: dict) -> None:
+        if data["type"] in self.tilesets: return
+        self.tilesets_data[data["type"]] = data
+
+    def get_tileset(self, t_type: str) -> Tileset | None:
+        tileset = self.tilesets.get(t_type)
+        if tileset is not None or t_type not in self.tilesets_data: return tileset
+
+        data = self.tilesets_data.pop(t_type)
+        try:
+            tileset = Tileset.from_dict(data)
+        except Exception as e:
+            print(f"Error loading tileset '{data['name']}': {e}")
+            return
+        
+        self.tilesets[t_type] = tileset
+        return tileset
+
+    def add_source_image(self, t_type: str, variant: int, image: pygame.Surface) -> bool:
+        """Stores an image for a variant without a registered tileset, returns True if it was new."""
+        if (t_type, variant) in self.source_images: return False
+
+        self.source_images[(t_type, variant)] = image
+        return True
+
+    def _tileset_image_loaded(self, tileset: Tileset) -> None:
+        if self.tilesets.get(tileset.type) is not tileset: return
+
+        self._remove_images_of_type(tileset.type)
+        if self.on_tileset_loaded: self.on_tileset_loaded(tileset)
+
+    def get_source_image(self, t_type: str, variant: int) -> pygame.Surface | None:
+        tileset = self.get_tileset(t_type)
+        if tileset and tileset.image is None: tileset.load_image_async(self._tileset_image_loaded) # does nothing if it is already loading
+        elif tileset and variant in tileset.tiles: return tileset.tiles[variant]
+        return self.source_images.get((t_type, variant))
+
+    def _get_level(self, tile_size: int) -> Dict[Tuple[str, int, bool, bool], pygame.Surface]:
+        images = self.levels.get(tile_size)
+        if images is not None:
+            self.levels.move_to_end(tile_size)
+            return images
+
+        images = self.levels[tile_size] = {}
+        if len(self.levels) > MAX_IMAGE_LEVELS: self.levels.popitem(last=False)
+        return images
+
+    def get_image(self, t_type: str, variant: int, tile_size: int, alpha: bool = False, premultiplied: bool = False) -> pygame.Surface | None:
+        images = self._get_level(tile_size)
+        key = (t_type, variant, alpha, premultiplied)
+        image = images.get(key)
+        if image is not None: return image
+
+        if premultiplied:
+            normal_image = self.get_image(t_type, variant, tile_size)
+            if normal_image is None: return
+            # blitting into a per pixel alpha surface also covers tiles without an alpha channel or with a colorkey
+            image = pygame.Surface(normal_image.get_size(), pygame.SRCALPHA)
+            image.blit(normal_image, (0, 0))
+            # the surface alpha of alpha images is left out by premul_alpha, so it goes into the pixels first
+            if alpha: image.fill((255, 255, 255, ALPHA_VALUE), special_flags=pygame.BLEND_RGBA_MULT)
+            image.premul_alpha_ip()
+        elif alpha:
+            normal_image = self.get_image(t_type, variant, tile_size)
+            if normal_image is None: return
+            image = normal_image.copy()
+            image.set_alpha(ALPHA_VALUE)
+        else:
+            source_image = self.get_source_image(t_type, variant)
+            if source_image is None: return
+            # smoothscale keeps the detail of shrunk tiles, it only works on 24 and 32 bit surfaces
+            if tile_size < source_image.get_width() and source_image.get_bitsize() in (24, 32): image = pygame.transform.smoothscale(source_image, (tile_size, tile_size))
+            else: image = pygame.transform.scale(source_image, (tile_size, tile_size))
+
+        images[key] = image
+        profiler.count("surfaces allocated")
+        return image
+
+    def get_average_color(self, t_type: str, variant: int) -> pygame.Color | None:
+        color = self.average_colors.get((t_type, variant))
+        if color is not None: return color
+
+        source_image = self.get_source_image(t_type, variant)
+        if source_image is None: return
+        color = self.average_colors[(t_type, variant)] = pygame.Color(pygame.transform.average_color(source_image, consider_alpha=True))
+        return color
+
+    def clear(self) -> None:
+        self.levels.clear()
+        self.average_colors.clear()
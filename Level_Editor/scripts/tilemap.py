@@ -5,53 +5,255 @@ The tilemap stores tiles in a dictionary. Tilemap structure:
     {"layer": {"on_grid": {}, "off_grid": [], "render_number": 0, "parallax": 1}}
 
     
-The on_grid key stores tiles at grid positions. On_grid structure:
+The on_grid key stores tiles at grid positions in a Chunk_Grid (see tile_chunks.py). Every cell holds
+a tile id from the tilemap palette. Tiles don't store images, they are shared through the
+Tile_Image_Registry (see tile_images.py). Levels are saved in the binary level format (see level_format.py)
+or in the json layout, where the on_grid structure is:
 
     {"tile_x;tile_y": {"type": "grass", "variant": 0, "position": "x;y"}}
 
 
-The off_grid key stores tiles at a position. Off_grid structure:
+The off_grid key stores tiles at a position in a Spatial_Hash (see spatial_hash.py). In json files the
+off_grid structure is:
 
     [{"type": "grass", "variant": 0, "position": "x;y"}]
 
+
+Every edit is recorded as a compact delta in the Edit_History (see edit_history.py) for undo and redo.
+
+
+The last opened level (or the autosave) is loaded when the tilemap is created, or with load_last_level_async it
+is read into a new palette on a worker thread and swapped in once it is done, so the editor can show its window
+first. The map can't be edited until the level is in.
+
+
+The map can be drawn at any zoom, positions stay in tile_size pixels and are only scaled when drawn. Tiles are
+drawn at whole pixel sizes, below MIN_BLOCK_TILE_SIZE the chunks are drawn as thumbnails at whole pixel sizes
+instead (see chunk_render_cache.py), so far out a tile can be smaller than a pixel.
+
 """
 
+import os
 import pygame
-from typing import List, Tuple
+from array import array
+from typing import Any, Callable, List, Tuple
 
-from .utils.file import save_json_data, load_json_data, save_as_json_data, load_json_data_from_file_explorer
+from .utils.file import save_json_data, load_json_data, get_level_save_path_from_file_explorer, get_level_path_from_file_explorer
 from .layer_manager import Layer_Manager
+from .tile_chunks import Tile_Palette, EMPTY_TILE_ID, CHUNK_SIZE
+from .level_format import is_level_file, save_level_file, read_level, tile_map_to_json_data
+from .chunk_render_cache import Chunk_Render_Cache, MIN_BLOCK_TILE_SIZE, MAX_BLOCK_TILE_SIZE
+from .layer_composite_cache import Layer_Composite_Cache
+from .tile_images import Tile_Image_Registry, ALPHA_VALUE
+from .autosave import Autosave, AUTOSAVE_LEVEL_PATH
+from .utils.profiler import profiler
+from .utils.image_loader import image_loader, Load_Job
+from .tileset import Tileset
+from .brush_stroke import Brush_Stroke
+from .edit_history import Edit_History, Edit_Step, DEFAULT_MEMORY_LIMIT
+
+FLOOD_FILL_RANGE = 512 # cells in every direction of the start cell a flood fill can reach
+LAST_LEVEL_PATH = "./caches/tile_map_data.json"
 
 
 class Tilemap:
-    def __init__(self, tile_size: int) -> None:
+    def __init__(self, tile_size: int, autosave_interval: float | None = 60, history_memory_limit: int = DEFAULT_MEMORY_LIMIT, load_last_level: bool = True, on_images_loaded: Callable[[], Any] | None = None) -> None:
         self.tile_size = tile_size
+        self.on_images_loaded = on_images_loaded
 
-        self.layer_manager = Layer_Manager()
+        self.layer_manager = Layer_Manager(callback=self._layer_manager_callback)
         self.tile_map = self.layer_manager.layers_data
 
-        print(type(self.tile_map))
+        self.palette = Tile_Palette()
+        self.image_registry = Tile_Image_Registry(on_tileset_loaded=self._tileset_image_loaded)
+        self.chunk_render_cache = Chunk_Render_Cache()
+        self.layer_composite_cache = Layer_Composite_Cache()
+        self.stroke: Brush_Stroke | None = None
+        self.history = Edit_History(memory_limit=history_memory_limit)
+        self.applying_history = False
 
+        self.autosave = None
+        self.autosave_interval = autosave_interval
+        self.tile_map_data_path = None
+        self.level_job: Load_Job | None = None
+
+        if load_last_level: self._last_level_read(self._read_last_level())
+
+    def _read_last_level(self, job: Load_Job | None = None) -> Tuple[str | None, dict, List[dict], Tile_Palette] | None:
+        """Returns the (path, tile_map, tilesets data, palette) of the last opened level, or of the autosave with
+        no path. Doesn't touch the tilemap, so it can run on a worker thread."""
+        palette = Tile_Palette()
         try:
-            self.tile_map_data_path = load_json_data("./caches/tile_map_data.json")["tile_map_data_path"]
-            tile_map_data = load_json_data(self.tile_map_data_path)
-            if tile_map_data: 
-                self.layer_manager.layers_data = tile_map_data
-                self.tile_map = self.layer_manager.layers_data 
+            path = load_json_data(LAST_LEVEL_PATH)["tile_map_data_path"]
+            level = read_level(path, palette)
         except:
-            self.tile_map_data_path = None
-    
+            level = None
+        if level: return (path, *level, palette)
+
+        if self.autosave_interval is None or not os.path.exists(AUTOSAVE_LEVEL_PATH): return
+        palette = Tile_Palette()
+        level = read_level(AUTOSAVE_LEVEL_PATH, palette)
+        if level: return (None, *level, palette)
+
+    def _last_level_read(self, level: Tuple[str | None, dict, List[dict], Tile_Palette] | None) -> None:
+        self.level_job = None
+        if level:
+            self.tile_map_data_path, tile_map, tilesets, palette = level
+            self._set_level(tile_map, tilesets, palette)
+
+        if self.autosave_interval is not None:
+            self.autosave = Autosave(self, self.tile_map_data_path, interval=self.autosave_interval)
+            self.autosave.recover()
+
+    def load_last_level_async(self, callback: Callable[[], Any] | None = None) -> Load_Job:
+        """Reads the last opened level on the image loader, the callback is called once the tilemap holds it."""
+        def finish(level: Tuple[str | None, dict, List[dict], Tile_Palette] | None) -> None:
+            self._last_level_read(level)
+            if callback: callback()
+
+        self.level_job = image_loader.submit(self._read_last_level, finish)
+        return self.level_job
+
+    def is_loading(self) -> bool:
+        return self.level_job is not None
+
+    def _layer_manager_callback(self, data: dict) -> None:
+        if not self.autosave: return
+
+        if "add_layer" in data: self.autosave.record(["add_layer", data["add_layer"]["name"], data["add_layer"]["parallax"]])
+        if "remove_layer" in data: self.autosave.record(["remove_layer", data["remove_layer"]["name"]])
+        if "reorder_layers" in data: self.autosave.record(["reorder_layers", self.layer_manager.get_layers_render_order()])
+
+    def _set_tile_map(self, tile_map: dict) -> None:
+        self.layer_manager.layers_data = tile_map
+        self.layer_manager.layers_render_order = sorted(tile_map, key=lambda layer: tile_map[layer]["render_number"])
+        if self.layer_manager.selected_layer not in tile_map: self.layer_manager.selected_layer = None
+        self.tile_map = self.layer_manager.layers_data
+        self.chunk_render_cache.clear()
+        self.layer_composite_cache.clear()
+        self.history.clear()
+
     def _save_data(self) -> None:
-        if self.tile_map_data_path:
-            save_json_data(self.tile_map, self.tile_map_data_path)
-        else:
-            file_path = save_as_json_data(self.tile_map)
-            self.tile_map_data_path = file_path if file_path else self.tile_map_data_path
-            save_json_data({"tile_map_data_path": self.tile_map_data_path}, "./caches/tile_map_data")
+        if not self.tile_map_data_path:
+            get_level_save_path_from_file_explorer(self._save_data_as)
+            return
+
+        self.save_level(self.tile_map_data_path)
+
+    def _save_data_as(self, file_path: str | None) -> None:
+        if not file_path: return
+        if not self.save_level(file_path): return
+        
+        self.tile_map_data_path = file_path
+        save_json_data({"tile_map_data_path": self.tile_map_data_path}, LAST_LEVEL_PATH)
+        if self.autosave:
+            self.autosave.clear_journal() # the unsaved work is in the new level file now
+            self.autosave.set_level_path(file_path)
 
     def _open_data(self) -> None:
-        self.tile_map = load_json_data_from_file_explorer()
+        get_level_path_from_file_explorer(self._open_level_path)
+
+    def _open_level_path(self, file_path: str | None) -> None:
+        if not file_path: return
+
+        palette = Tile_Palette()
+        level = read_level(file_path, palette)
+        if level is None: return # the autosave goes on with the open level
+
+        # the edits of the open level are compacted into its own file before its map is replaced
+        if self.autosave: self.autosave.set_level_path(file_path)
+        self._set_level(*level, palette)
+
+        self.tile_map_data_path = file_path
+        save_json_data({"tile_map_data_path": self.tile_map_data_path}, LAST_LEVEL_PATH)
+        if self.autosave: self.autosave.recover()
+
+    def get_used_tilesets_data(self) -> List[dict]:
+        used_types = {tile[0] for tile in self.palette.tiles[1:]}
+        tilesets = [tileset.to_dict() for t_type, tileset in self.image_registry.tilesets.items() if t_type in used_types]
+        tilesets += [data for t_type, data in self.image_registry.tilesets_data.items() if t_type in used_types]
+        return tilesets
+
+    def save_level(self, path: str) -> bool:
+        if self.autosave: self.autosave.wait_for_compaction()
+
+        if is_level_file(path): saved = save_level_file(self.tile_map, self.palette, path, tilesets=self.get_used_tilesets_data())
+        else: saved = self.export_json_data(path)
+
+        if saved and self.autosave and os.path.abspath(path) == os.path.abspath(self.autosave.level_path):
+            self.autosave.clear_journal()
+        return saved
+
+    def export_json_data(self, path: str) -> bool:
+        return save_json_data(tile_map_to_json_data(self.tile_map, self.palette), path)
+
+    def load_level(self, path: str) -> bool:
+        palette = Tile_Palette()
+        level = read_level(path, palette)
+        if level is None: return False
+
+        self._set_level(*level, palette)
+        return True
+
+    def _set_level(self, tile_map: dict, tilesets: List[dict], palette: Tile_Palette) -> None:
+        """Replaces the level with one read by read_level, the tile ids of the tile map point into the palette."""
+        self.palette = palette
+        for tileset_data in tilesets: self.image_registry.add_tileset_data(tileset_data)
+        self._set_tile_map(tile_map)
     
+    def add_tileset(self, tileset: Tileset) -> None:
+        self.image_registry.add_tileset(tileset)
+        self.chunk_render_cache.clear()
+        self.layer_composite_cache.clear()
+
+    def _tileset_image_loaded(self, tileset: Tileset) -> None:
+        # the tiles of the tileset were drawn without images while it was loading
+        self.chunk_render_cache.clear()
+        self.layer_composite_cache.clear()
+        if self.on_images_loaded: self.on_images_loaded()
+
+    def get_tile_image(self, tile_id: int, image_key: str = "normal", tile_size: int | None = None) -> pygame.Surface | None:
+        """Returns the premultiplied image of a tile, what the chunk render cache draws with BLEND_PREMULTIPLIED."""
+        tile = self.palette.get_tile(tile_id)
+        if tile is None: return
+        return self.image_registry.get_image(tile[0], tile[1], tile_size or self.tile_size, alpha=(image_key == "alpha"), premultiplied=True)
+
+    def get_tile_color(self, tile_id: int, image_key: str = "normal") -> pygame.Color | None:
+        """Returns the average color of a tile, what it is drawn with in the chunk thumbnails."""
+        tile = self.palette.get_tile(tile_id)
+        if tile is None: return
+        color = self.image_registry.get_average_color(tile[0], tile[1])
+        if color is None or image_key != "alpha": return color
+        return pygame.Color(color.r, color.g, color.b, color.a * ALPHA_VALUE // 255)
+
+    def get_render_tile_size(self, zoom: float) -> float:
+        """Returns the size a tile is drawn with at a zoom, the zoom is rounded to a whole pixel tile size
+        or, when the chunks are drawn as thumbnails, to a whole pixel chunk size."""
+        render_tile_size = self.tile_size * zoom
+        if render_tile_size >= MIN_BLOCK_TILE_SIZE: return round(render_tile_size)
+        return max(1, round(render_tile_size * CHUNK_SIZE)) / CHUNK_SIZE
+
+    def get_level_bounds(self) -> Tuple[int, int, int, int] | None:
+        """Returns the (left, top, right, bottom) pixel area holding every tile of the level, on grid tiles are
+        counted by their chunks. Returns None for an empty level."""
+        lefts, tops, rights, bottoms = [], [], [], []
+        chunk_pixel_size = CHUNK_SIZE * self.tile_size
+        for layer_data in self.tile_map.values():
+            chunk_positions = layer_data["on_grid"].get_chunk_positions()
+            if chunk_positions:
+                lefts.append(min(x for x, _ in chunk_positions) * chunk_pixel_size)
+                tops.append(min(y for _, y in chunk_positions) * chunk_pixel_size)
+                rights.append((max(x for x, _ in chunk_positions) + 1) * chunk_pixel_size)
+                bottoms.append((max(y for _, y in chunk_positions) + 1) * chunk_pixel_size)
+            for tile in layer_data["off_grid"]:
+                lefts.append(tile["position"][0])
+                tops.append(tile["position"][1])
+                rights.append(tile["position"][0] + self.tile_size)
+                bottoms.append(tile["position"][1] + self.tile_size)
+
+        if not lefts: return
+        return (int(min(lefts)), int(min(tops)), int(max(rights)), int(max(bottoms)))
+
     def create_layer(self, layer_number: int) -> None:
         self.tile_map[str(layer_number)]
     
@@ -66,6 +268,12 @@ class Tilemap:
     def get_grid_position(self, position: List[int | float] | Tuple[int | float]) -> Tuple[int]:
         return (position[0] // self.tile_size, position[1] // self.tile_size)
 
+    def get_layer_grid_position(self, layer: str, position: List[int | float] | Tuple[int | float], world_offset: List[int] | Tuple[int] = (0,0)) -> Tuple[int, int]:
+        """Returns the grid cell of the layer under a position on the map."""
+        layer_parallax = self.tile_map[layer]["parallax"]
+        tile_x, tile_y = self.get_grid_position((position[0] + (world_offset[0] * layer_parallax), position[1] + (world_offset[1] * layer_parallax)))
+        return (int(tile_x), int(tile_y))
+
     def format_position(self, position: List[int | float] | Tuple[int | float]) -> str | None:
         if not isinstance(position, (list, tuple)): return
 
@@ -77,27 +285,27 @@ class Tilemap:
         split_string = formatted_position.split(";")
         return (int(split_string[0]), int(split_string[1]))
     
-    def add_tile(self, t_type: str, variant: str, position: List[int] | Tuple[int], image: pygame.Surface, alpha_image: pygame.Surface, on_grid: bool = True, world_offset: List[int] | Tuple[int] = (0,0)) -> None:
+    def _add_source_image(self, t_type: str, variant: int, image: pygame.Surface | None) -> None:
+        if image and self.image_registry.add_source_image(t_type, variant, image):
+            # loaded tiles of this variant can be drawn now
+            self.chunk_render_cache.clear()
+            self.layer_composite_cache.clear()
+
+    def add_tile(self, t_type: str, variant: str, position: List[int] | Tuple[int], image: pygame.Surface | None = None, on_grid: bool = True, world_offset: List[int] | Tuple[int] = (0,0)) -> None:
         layer = self.layer_manager.get_selected_layer()
         if not self.tile_map: return
         if layer not in self.tile_map: return
 
-        image = pygame.transform.scale(image, (self.tile_size, self.tile_size)) # HAVE TO CHANGE THIS!!!
-        alpha_image = pygame.transform.scale(alpha_image, (self.tile_size, self.tile_size)) # HAVE TO CHANGE THIS!!!
+        self._add_source_image(t_type, variant, image)
 
         layer_parallax = self.tile_map[layer]["parallax"]
         parallax_adjusted_position = (position[0] + (world_offset[0] * layer_parallax), position[1] + (world_offset[1] * layer_parallax))
 
         if on_grid:
-            tile_grid_position = self.get_grid_position(parallax_adjusted_position)
-            formatted_tile_position = self.format_position(tile_grid_position)
-            if formatted_tile_position in self.tile_map[layer]["on_grid"]:
-                del self.tile_map[layer]["on_grid"][formatted_tile_position]
-            self.tile_map[layer]["on_grid"][formatted_tile_position] = {"type": t_type, "variant": variant, "position": tile_grid_position, "images": {"normal": image, "alpha": alpha_image}}
+            tile_x, tile_y = self.get_grid_position(parallax_adjusted_position)
+            self.place_tile(layer, int(tile_x), int(tile_y), t_type, variant)
         else:
-            for offgrid_tile in self.tile_map[layer]["off_grid"]:
-                if offgrid_tile["position"] == parallax_adjusted_position: return
-            self.tile_map[layer]["off_grid"].append({"type": t_type, "variant": variant, "position": parallax_adjusted_position, "images": {"normal": image, "alpha": alpha_image}})
+            self.place_off_grid_tile(layer, parallax_adjusted_position, t_type, variant)
     
     def remove_tile(self, position: List[int] | Tuple[int], on_grid: bool = True, world_offset: List[int] | Tuple[int] = (0,0), delete_overlapping_objects: bool = False) -> None:
         layer = self.layer_manager.get_selected_layer()
@@ -108,41 +316,343 @@ class Tilemap:
         parallax_adjusted_position = (position[0] + (world_offset[0] * layer_parallax), position[1] + (world_offset[1] * layer_parallax))
 
         if on_grid:
-            tile_grid_position = self.get_grid_position(parallax_adjusted_position)
-            formatted_tile_position = self.format_position(tile_grid_position)
-            if formatted_tile_position in self.tile_map[layer]["on_grid"]:
-                del self.tile_map[layer]["on_grid"][formatted_tile_position]
+            tile_x, tile_y = self.get_grid_position(parallax_adjusted_position)
+            self.erase_tile(layer, int(tile_x), int(tile_y))
+        else:
+            self.remove_off_grid_tiles_at(layer, parallax_adjusted_position, delete_overlapping_objects=delete_overlapping_objects)
+
+    def _is_recording_history(self) -> bool:
+        if self.applying_history: return False
+        if self.autosave and self.autosave.replaying: return False # the replayed edits were made in an earlier session
+        return True
+
+    def place_tile(self, layer: str, tile_x: int, tile_y: int, t_type: str, variant: int) -> None:
+        tile_id = self.palette.get_tile_id(t_type, variant)
+        old_tile_id = self.tile_map[layer]["on_grid"].set_tile_id(tile_x, tile_y, tile_id)
+        if old_tile_id == tile_id: return
+
+        self.chunk_render_cache.mark_dirty(layer, tile_x, tile_y)
+        self.layer_composite_cache.mark_layer_dirty(layer)
+        if self._is_recording_history(): self.history.record_cell(layer, tile_x, tile_y, old_tile_id, tile_id)
+        if self.autosave: self.autosave.record(["set", layer, tile_x, tile_y, t_type, variant])
+
+    def erase_tile(self, layer: str, tile_x: int, tile_y: int) -> None:
+        old_tile_id = self.tile_map[layer]["on_grid"].remove_tile(tile_x, tile_y)
+        if old_tile_id == EMPTY_TILE_ID: return
+
+        self.chunk_render_cache.mark_dirty(layer, tile_x, tile_y)
+        self.layer_composite_cache.mark_layer_dirty(layer)
+        if self._is_recording_history(): self.history.record_cell(layer, tile_x, tile_y, old_tile_id, EMPTY_TILE_ID)
+        if self.autosave: self.autosave.record(["erase", layer, tile_x, tile_y])
+
+    def place_off_grid_tile(self, layer: str, position: List[int | float] | Tuple[int | float], t_type: str, variant: int) -> None:
+        position = (position[0], position[1])
+        tile = {"type": t_type, "variant": variant, "position": position}
+        if not self.tile_map[layer]["off_grid"].add(tile): return
+
+        self.layer_composite_cache.mark_layer_dirty(layer)
+        if self._is_recording_history(): self.history.record_off_grid(layer, tile, added=True)
+        if self.autosave: self.autosave.record(["add_off_grid", layer, position[0], position[1], t_type, variant])
+
+    def remove_off_grid_tile(self, layer: str, position: List[int | float] | Tuple[int | float]) -> None:
+        position = (position[0], position[1])
+        tile = self.tile_map[layer]["off_grid"].remove(position)
+        if tile is None: return
+
+        self.layer_composite_cache.mark_layer_dirty(layer)
+        if self._is_recording_history(): self.history.record_off_grid(layer, tile, added=False)
+        if self.autosave: self.autosave.record(["remove_off_grid", layer, position[0], position[1]])
+
+    def remove_off_grid_tiles_at(self, layer: str, point: List[int | float] | Tuple[int | float], delete_overlapping_objects: bool = False) -> None:
+        tiles = self.tile_map[layer]["off_grid"].get_tiles_at(point, self.tile_size)
+        if not tiles: return
+
+        if not delete_overlapping_objects: tiles = tiles[-1:] # only the tile drawn on top
+        self.history.begin_group()
+        for tile in tiles:
+            self.remove_off_grid_tile(layer, tile["position"])
+        self.history.end_group()
+
+    def begin_stroke(self, t_type: str | None = None, variant: int | None = None, image: pygame.Surface | None = None) -> bool:
+        """Starts a brush stroke on the selected layer, without a t_type the stroke erases."""
+        self.end_stroke()
+
+        layer = self.layer_manager.get_selected_layer()
+        if layer not in self.tile_map: return False
+
+        if t_type is None:
+            tile_id = EMPTY_TILE_ID
         else:
-            pass
+            self._add_source_image(t_type, variant, image)
+            tile_id = self.palette.get_tile_id(t_type, variant)
+
+        self.stroke = Brush_Stroke(layer, tile_id)
+        return True
+
+    def continue_stroke(self, position: List[int] | Tuple[int], world_offset: List[int] | Tuple[int] = (0,0)) -> None:
+        """Moves the brush stroke to the position, the cells between the last and the new position are edited too."""
+        if not self.stroke: return
+        if self.stroke.layer not in self.tile_map: # the layer was removed while painting
+            self.stroke = None
+            return
+
+        layer = self.stroke.layer
+        tile_id = self.stroke.tile_id
+        chunk_grid = self.tile_map[layer]["on_grid"]
+
+        new_cells = self.stroke.get_new_cells(self.get_layer_grid_position(layer, position, world_offset))
+        for cell_x, cell_y in new_cells:
+            old_tile_id = chunk_grid.set_tile_id(cell_x, cell_y, tile_id)
+            if old_tile_id == tile_id: continue
+
+            self.chunk_render_cache.mark_dirty(layer, cell_x, cell_y)
+            self.layer_composite_cache.mark_layer_dirty(layer)
+            self.stroke.changes.append((cell_x, cell_y, old_tile_id))
+        profiler.count("stroke cells", len(new_cells))
+
+    def lift_stroke(self) -> None:
+        """The next position of the brush stroke starts a new line instead of connecting to the last position."""
+        if self.stroke: self.stroke.last_cell = None
+
+    def end_stroke(self) -> None:
+        """Finishes the brush stroke and records all of its changes as one edit."""
+        stroke = self.stroke
+        self.stroke = None
+        if not stroke or not stroke.changes: return
+
+        if self._is_recording_history():
+            xs, ys, old_tile_ids = zip(*stroke.changes)
+            self.history.record_cells(stroke.layer, xs, ys, old_tile_ids, array("H", [stroke.tile_id]) * len(stroke.changes))
+
+        if not self.autosave: return
+
+        cells = [coordinate for cell_x, cell_y, _ in stroke.changes for coordinate in (cell_x, cell_y)]
+        if stroke.is_erasing():
+            self.autosave.record(["erase_cells", stroke.layer, cells])
+        else:
+            t_type, variant = self.palette.get_tile(stroke.tile_id)
+            self.autosave.record(["set_cells", stroke.layer, t_type, variant, cells])
+
+    def _get_rect_cells(self, left: int, top: int, right: int, bottom: int) -> Tuple[int, int, int, int]:
+        return (min(left, right), min(top, bottom), max(left, right), max(top, bottom))
+
+    def _apply_bulk_changes(self, layer: str, changes: Tuple[array, array, array], tile_id: int, area: Tuple[int, int, int, int] | None = None) -> int:
+        changed_xs, changed_ys, old_tile_ids = changes
+        if not changed_xs: return 0
+
+        if area is None: area = (min(changed_xs), min(changed_ys), max(changed_xs), max(changed_ys))
+        self.chunk_render_cache.mark_area_dirty(layer, *area)
+        self.layer_composite_cache.mark_layer_dirty(layer)
+        if self._is_recording_history(): self.history.record_cells(layer, changed_xs, changed_ys, old_tile_ids, array("H", [tile_id]) * len(changed_xs))
+        return len(changed_xs)
+
+    def fill_rect(self, layer: str, left: int, top: int, right: int, bottom: int, t_type: str, variant: int, image: pygame.Surface | None = None) -> int:
+        """Places the tile in every cell of the area (right and bottom are inclusive), returns the number of changed cells."""
+        if layer not in self.tile_map: return 0
+        left, top, right, bottom = self._get_rect_cells(left, top, right, bottom)
+        self._add_source_image(t_type, variant, image)
+
+        tile_id = self.palette.get_tile_id(t_type, variant)
+        changes = self.tile_map[layer]["on_grid"].fill_rect(left, top, right, bottom, tile_id)
+        changed_cells = self._apply_bulk_changes(layer, changes, tile_id, (left, top, right, bottom))
+        if changed_cells and self.autosave: self.autosave.record(["fill_rect", layer, left, top, right, bottom, t_type, variant])
+        return changed_cells
+
+    def erase_rect(self, layer: str, left: int, top: int, right: int, bottom: int) -> int:
+        """Erases every cell of the area (right and bottom are inclusive), returns the number of erased cells."""
+        if layer not in self.tile_map: return 0
+        left, top, right, bottom = self._get_rect_cells(left, top, right, bottom)
+
+        changes = self.tile_map[layer]["on_grid"].fill_rect(left, top, right, bottom, EMPTY_TILE_ID)
+        changed_cells = self._apply_bulk_changes(layer, changes, EMPTY_TILE_ID, (left, top, right, bottom))
+        if changed_cells and self.autosave: self.autosave.record(["erase_rect", layer, left, top, right, bottom])
+        return changed_cells
+
+    def flood_fill(self, layer: str, tile_x: int, tile_y: int, t_type: str | None = None, variant: int | None = None, image: pygame.Surface | None = None, bounds: Tuple[int, int, int, int] | None = None) -> int:
+        """Fills the area of equal cells connected to (tile_x, tile_y) with the tile, without a t_type the area is erased.
+        The fill never leaves the bounds (left, top, right, bottom), by default the chunks of the layer, at most FLOOD_FILL_RANGE
+        cells around the start cell. A fill starting outside of the bounds changes nothing."""
+        if layer not in self.tile_map: return 0
+        if bounds is None:
+            # an empty area around the level has no edge, so the fill stays inside the chunks holding tiles
+            extent = self.tile_map[layer]["on_grid"].get_extent()
+            if extent is None: return 0
+            bounds = (max(extent[0], tile_x - FLOOD_FILL_RANGE), max(extent[1], tile_y - FLOOD_FILL_RANGE),
+                      min(extent[2], tile_x + FLOOD_FILL_RANGE), min(extent[3], tile_y + FLOOD_FILL_RANGE))
+
+        if t_type is None:
+            tile_id = EMPTY_TILE_ID
+        else:
+            self._add_source_image(t_type, variant, image)
+            tile_id = self.palette.get_tile_id(t_type, variant)
+
+        changes = self.tile_map[layer]["on_grid"].flood_fill(tile_x, tile_y, tile_id, bounds)
+        changed_cells = self._apply_bulk_changes(layer, changes, tile_id)
+        if changed_cells and self.autosave:
+            # the result depends on the tiles around the start cell, so the changed cells are journaled
+            cells = [coordinate for cell in zip(changes[0], changes[1]) for coordinate in cell]
+            if t_type is None: self.autosave.record(["erase_cells", layer, cells])
+            else: self.autosave.record(["set_cells", layer, t_type, variant, cells])
+        return changed_cells
+
+    def _set_tile_ids(self, layer: str, xs: array, ys: array, tile_ids: array) -> None:
+        """Sets the cells to the tile ids in order and journals the cells with their resulting tile ids."""
+        if not xs: return
+        chunk_grid = self.tile_map[layer]["on_grid"]
+        for x, y, tile_id in zip(xs, ys, tile_ids):
+            chunk_grid.set_tile_id(x, y, tile_id)
+        self.chunk_render_cache.mark_area_dirty(layer, min(xs), min(ys), max(xs), max(ys))
+        self.layer_composite_cache.mark_layer_dirty(layer)
+
+        if not self.autosave: return
+        cells_by_tile_id = {}
+        for x, y in zip(xs, ys):
+            cells_by_tile_id.setdefault(chunk_grid.get_tile_id(x, y), []).extend((x, y))
+        for tile_id, cells in cells_by_tile_id.items():
+            if tile_id == EMPTY_TILE_ID:
+                self.autosave.record(["erase_cells", layer, cells])
+            else:
+                t_type, variant = self.palette.get_tile(tile_id)
+                self.autosave.record(["set_cells", layer, t_type, variant, cells])
+
+    def _apply_history_step(self, step: Edit_Step, undo: bool) -> None:
+        self.applying_history = True
+        try:
+            for layer, delta in step.deltas.items():
+                if layer not in self.tile_map: continue # the layer was removed after the edit
+
+                if undo:
+                    self._set_tile_ids(layer, delta.xs[::-1], delta.ys[::-1], delta.old_tile_ids[::-1])
+                    off_grid_changes = [(tile, not added) for tile, added in reversed(delta.off_grid_changes)]
+                else:
+                    self._set_tile_ids(layer, delta.xs, delta.ys, delta.new_tile_ids)
+                    off_grid_changes = delta.off_grid_changes
+
+                for tile, added in off_grid_changes:
+                    if added: self.place_off_grid_tile(layer, tile["position"], tile["type"], tile["variant"])
+                    else: self.remove_off_grid_tile(layer, tile["position"])
+        finally:
+            self.applying_history = False
+
+    def undo(self) -> bool:
+        """Reverts the last edit (a brush stroke, fill or single tile), returns False if there is nothing to undo."""
+        self.end_stroke()
+        step = self.history.pop_undo_step()
+        if step is None: return False
+
+        self._apply_history_step(step, undo=True)
+        return True
+
+    def redo(self) -> bool:
+        self.end_stroke()
+        step = self.history.pop_redo_step()
+        if step is None: return False
+
+        self._apply_history_step(step, undo=False)
+        return True
+
+    def apply_journal_entry(self, entry: list) -> None:
+        action = entry[0]
+        if action == "add_layer":
+            if entry[1] not in self.tile_map: self.layer_manager.add_layer({"name": entry[1], "parallax": entry[2]})
+        elif action == "remove_layer":
+            if entry[1] in self.tile_map: self.layer_manager.remove_layer(entry[1])
+        elif action == "reorder_layers":
+            if sorted(entry[1]) == sorted(self.tile_map): self.layer_manager.set_layers_render_order(entry[1])
+        elif entry[1] in self.tile_map:
+            if action == "set": self.place_tile(entry[1], entry[2], entry[3], entry[4], entry[5])
+            elif action == "erase": self.erase_tile(entry[1], entry[2], entry[3])
+            elif action == "set_cells":
+                for index in range(0, len(entry[4]), 2): self.place_tile(entry[1], entry[4][index], entry[4][index + 1], entry[2], entry[3])
+            elif action == "erase_cells":
+                for index in range(0, len(entry[2]), 2): self.erase_tile(entry[1], entry[2][index], entry[2][index + 1])
+            elif action == "fill_rect": self.fill_rect(entry[1], entry[2], entry[3], entry[4], entry[5], entry[6], entry[7])
+            elif action == "erase_rect": self.erase_rect(entry[1], entry[2], entry[3], entry[4], entry[5])
+            elif action == "add_off_grid": self.place_off_grid_tile(entry[1], (entry[2], entry[3]), entry[4], entry[5])
+            elif action == "remove_off_grid": self.remove_off_grid_tile(entry[1], (entry[2], entry[3]))
     
-    def render_tilemap(self, render_surface: pygame.Surface, offset: List[int] | Tuple[int] = (0,0)) -> None:
+    def _render_off_grid_tiles(self, render_surface: pygame.Surface, layer: str, offset: List[int] | Tuple[int], selected: bool, render_tile_size: float) -> None:
+        # positions are in parallax space like the on grid tiles, render_offset is scaled to the zoom. The tiles are
+        # premultiplied like the on grid blocks, so overlapping semi transparent tiles stay exact in the layer composites
+        scale = render_tile_size / self.tile_size
+        render_offset = self.get_parallax_position(offset, self.tile_map[layer]["parallax"] * scale)
+        visible_tiles = self.tile_map[layer]["off_grid"].query_area(render_offset[0] / scale - self.tile_size, render_offset[1] / scale - self.tile_size, 
+                                                                    (render_offset[0] + render_surface.get_width()) / scale, (render_offset[1] + render_surface.get_height()) / scale)
+        image_size = max(1, round(render_tile_size))
+        blit_sequence = []
+        for tile in visible_tiles:
+            image = self.image_registry.get_image(tile["type"], tile["variant"], image_size, alpha=not selected, premultiplied=True)
+            if image is None: continue
+            position = tile["position"]
+            blit_sequence.append((image, (position[0] * scale - render_offset[0], position[1] * scale - render_offset[1])))
+        render_surface.fblits(blit_sequence, pygame.BLEND_PREMULTIPLIED)
+        profiler.count("tiles visited", len(visible_tiles))
+        profiler.count("blits", len(blit_sequence))
+
+    def _render_on_grid_tiles(self, render_surface: pygame.Surface, layers: Tuple[str, ...], offset: List[int] | Tuple[int], selected_layer: str | None, render_tile_size: float) -> None:
+        # the layers share their parallax, at block sizes they are baked into the same blocks
+        render_offset = self.get_parallax_position(offset, self.tile_map[layers[0]]["parallax"] * render_tile_size / self.tile_size)
+        image_keys = tuple("normal" if layer == selected_layer else "alpha" for layer in layers)
+        if render_tile_size > MAX_BLOCK_TILE_SIZE:
+            visible_blocks = [tile for layer, image_key in zip(layers, image_keys) for tile in self.chunk_render_cache.get_visible_tiles(self.tile_map[layer]["on_grid"], self.get_tile_image, image_key, render_offset, render_surface.get_size(), render_tile_size)]
+        elif render_tile_size >= MIN_BLOCK_TILE_SIZE:
+            visible_blocks = self.chunk_render_cache.get_visible_blocks(layers, [self.tile_map[layer]["on_grid"] for layer in layers], self.get_tile_image, image_keys, render_offset, render_surface.get_size(), render_tile_size)
+        else:
+            visible_blocks = [thumbnail for layer, image_key in zip(layers, image_keys) for thumbnail in self.chunk_render_cache.get_visible_thumbnails(layer, self.tile_map[layer]["on_grid"], self.get_tile_color, image_key, render_offset, render_surface.get_size(), round(render_tile_size * CHUNK_SIZE))]
+        render_surface.fblits(visible_blocks, pygame.BLEND_PREMULTIPLIED)
+        profiler.count("blits", len(visible_blocks))
+
+    def _get_layer_stacks(self, layers: List[str]) -> List[Tuple[str, ...]]:
+        """Splits the layers (back to front) into stacks of layers sharing their parallax, only the first layer of a stack
+        can have off grid tiles, they are drawn below the on grid tiles of the whole stack."""
+        stacks = []
+        for layer in layers:
+            if stacks and self.tile_map[layer]["parallax"] == self.tile_map[stacks[-1][0]]["parallax"] and not len(self.tile_map[layer]["off_grid"]):
+                stacks[-1].append(layer)
+            else:
+                stacks.append([layer])
+        return [tuple(stack) for stack in stacks]
+
+    def _render_layers(self, render_surface: pygame.Surface, layers: List[str], offset: List[int] | Tuple[int], render_tile_size: float, selected_layer: str | None = None) -> None:
+        """Draws layers back to front, every stack of layers sharing their parallax costs about as much as one layer."""
+        for stack in self._get_layer_stacks(layers):
+            self._render_off_grid_tiles(render_surface, stack[0], offset, stack[0] == selected_layer, render_tile_size)
+            self._render_on_grid_tiles(render_surface, stack, offset, selected_layer, render_tile_size)
+
+    def render_tilemap(self, render_surface: pygame.Surface, offset: List[int] | Tuple[int] = (0,0), zoom: float = 1) -> None:
+        """Draws the layers back to front onto a render surface holding the map background. While the camera rests the
+        unselected layers below and above the selected one come from the layer composite cache, while it moves every
+        layer is drawn directly, stacked with the layers sharing its parallax (the selected one included). The offset
+        is in unzoomed pixels."""
+        render_tile_size = self.get_render_tile_size(zoom)
+        camera = (offset[0], offset[1], render_tile_size)
+        self.chunk_render_cache.begin_frame()
         layers_render_order = self.layer_manager.get_layers_render_order()[::-1]
         selected_layer = self.layer_manager.get_selected_layer()
-        
-        for layer in layers_render_order:
-            layer_parallax = self.tile_map[layer]["parallax"]
-            render_offset = self.get_parallax_position(offset, layer_parallax)
-
-            # off grid
-            for tile in self.tile_map[layer]["off_grid"]:
-                image = tile["images"]["normal" if layer == selected_layer else "alpha"]
-                position = tile["position"]
-                render_surface.blit(image, (position[0] - offset[0], position[1] - offset[1]))
-
-            # on grid
-            for x in range(render_offset[0] // self.tile_size, (render_offset[0] + render_surface.get_width()) // self.tile_size + 1):
-                for y in range(render_offset[1] // self.tile_size, (render_offset[1] + render_surface.get_height()) // self.tile_size + 1):
-                    tile_key = self.format_position((x, y))
-                    layer_on_grid = self.tile_map[layer]["on_grid"]
-                    if tile_key in layer_on_grid:
-                        image = layer_on_grid[tile_key]["images"]["normal" if layer == selected_layer else "alpha"]
-                        position = layer_on_grid[tile_key]["position"]
-                        render_surface.blit(image, (position[0] * self.tile_size - render_offset[0], position[1] * self.tile_size - render_offset[1]))
+        if self.layer_composite_cache.update_camera(camera):
+            self._render_layers(render_surface, layers_render_order, offset, render_tile_size, selected_layer)
+            return
+
+        if selected_layer in layers_render_order:
+            selected_index = layers_render_order.index(selected_layer)
+            layers_below, layers_above = layers_render_order[:selected_index], layers_render_order[selected_index + 1:]
+        else:
+            layers_below, layers_above = layers_render_order, []
+
+        render_layers = lambda surface, layers: self._render_layers(surface, layers, offset, render_tile_size)
+        self.layer_composite_cache.render_below(render_surface, [(layer, self.tile_map[layer]["parallax"]) for layer in layers_below], camera, render_layers)
+        if selected_layer in layers_render_order:
+            self._render_off_grid_tiles(render_surface, selected_layer, offset, True, render_tile_size)
+            self._render_on_grid_tiles(render_surface, (selected_layer,), offset, selected_layer, render_tile_size)
+        self.layer_composite_cache.render_above(render_surface, [(layer, self.tile_map[layer]["parallax"]) for layer in layers_above], camera, render_layers)
             
     def process_event(self, event: pygame.Event) -> None:
         self.layer_manager.process_event(event)
     
-    # def update(self) -> None:
-    #     self.render_tilemap(pygame.Surface((1000, 1000)), (50, 50))
-    #     #print(self.tile_map)
-    #     print(self.layer_manager.layers_render_order)
+    def update(self, dt: float) -> None:
+        if self.autosave: self.autosave.update(dt)
+
+    def close(self) -> None:
+        if self.level_job: self.level_job.cancel()
+        self.end_stroke()
+        if self.autosave: self.autosave.close()
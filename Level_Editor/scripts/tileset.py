@@ -1,9 +1,39 @@
 import pygame
 import pygame.surface
 import json
-from typing import Any
+from collections.abc import Mapping
+from typing import Any, Callable, Iterator, Tuple
 
-from .utils.image import load_image
+from .utils.image_loader import image_loader, decode_image_file, Load_Job
+from .tileset_cache import get_tileset_cache_path, read_cached_tileset_image, save_cached_tileset_image, preprocess_tileset_image
+
+class Tileset_Tiles(Mapping):
+    """The tiles of a tileset by tile id. A tile is only sliced from the tileset image when it is first accessed,
+    looking tiles up never loads the image, there are no tiles until it is loaded."""
+    def __init__(self, tileset: "Tileset") -> None:
+        self.tileset = tileset
+        self.tiles = {}
+    
+    def __getitem__(self, tile_id: int) -> pygame.Surface:
+        tile = self.tiles.get(tile_id)
+        if tile is not None: return tile
+        if tile_id not in self: raise KeyError(tile_id)
+
+        tile = self.tileset._extract_tile(tile_id)
+        self.tiles[tile_id] = tile
+        return tile
+    
+    def __contains__(self, tile_id: Any) -> bool:
+        return isinstance(tile_id, int) and 0 <= tile_id < len(self)
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+    
+    def __len__(self) -> int:
+        return self.tileset.get_tile_count()
+    
+    def clear(self) -> None:
+        self.tiles.clear()
 
 class Tileset:
     def __init__(self, name: str, t_type: str, image_path: str, tile_width: int, tile_height: int, margin: int = 0, spacing: int = 0, colorkey: pygame.Color | None = None) -> None:
@@ -16,31 +46,81 @@ class Tileset:
         self.spacing = spacing
         self.colorkey: pygame.Color = colorkey
 
-        self.image: pygame.Surface = load_image(self.image_path)
-
-        self.image_size = self.image.get_size()
-        self.tiles_per_row = self.image_size[0] // self.tile_width
-        self.tiles_per_column = self.image_size[1] // self.tile_height
+        # the image is loaded on the image loader (load_image_async), until then the tileset has no tiles
+        self.image: pygame.Surface | None = None
+        self.image_load_failed = False
+        self.loading = False
+        self.image_size = (0, 0)
+        self.tiles_per_row = 0
+        self.tiles_per_column = 0
 
-        self.tiles = {}
-        self._extract_tileset_tiles()
+        self.tiles = Tileset_Tiles(self)
     
-    def _extract_tileset_tiles(self):
-        # have to add error handeling, if the usbsurface is outside of the bounds of the surface
-        if self.tile_width > self.image_size[0] or self.tile_height > self.image_size[1]: 
-            print("Didnt find subsurface of that size.")
+    def _load_image(self) -> bool:
+        if self.image is not None: return True
+        if self.image_load_failed or self.loading: return False
+
+        self.set_image(self.read_image())
+        return self.image is not None
+
+    def read_image(self, job: Load_Job | None = None) -> pygame.Surface | None:
+        """Returns the preprocessed tileset image without converting it, so it can run on a worker thread."""
+        cache_path = get_tileset_cache_path(self.image_path, self.tile_width, self.tile_height, self.margin, self.spacing, self.colorkey)
+        if not cache_path:
+            print(f"Error loading tileset image: '{self.image_path}' does not exist.")
             return
 
-        tile_id = 0
+        image = read_cached_tileset_image(cache_path)
+        if image is not None: return image
+
+        image = decode_image_file(self.image_path, job)
+        if image is None: return
+        image = preprocess_tileset_image(image, self.colorkey)
+        save_cached_tileset_image(cache_path, image)
+        return image
+
+    def set_image(self, image: pygame.Surface | None) -> None:
+        """Sets the image returned by read_image, the tiles are sliced from it from now on."""
+        self.loading = False
+        self.tiles.clear()
+        if image is None:
+            self.image_load_failed = True
+            return
+
+        self.image = image.convert_alpha()
+        self.image_size = self.image.get_size()
+        self.tiles_per_row, self.tiles_per_column = self.get_grid_size(self.image_size)
+        self.image_load_failed = False
+
+    def get_grid_size(self, image_size: Tuple[int, int]) -> Tuple[int, int]:
+        """Returns the (tiles per row, tiles per column) an image of that size is sliced into."""
+        return (max(0, (image_size[0] - self.margin + self.spacing) // (self.tile_width + self.spacing)),
+                max(0, (image_size[1] - self.margin + self.spacing) // (self.tile_height + self.spacing)))
 
-        for row in range(self.tiles_per_column):
-            for col in range(self.tiles_per_row):
-                x = col * (self.tile_width + self.spacing) + self.margin
-                y = row * (self.tile_height + self.spacing) + self.margin
-                tile = self.image.subsurface(pygame.Rect(x, y, self.tile_width, self.tile_height))
-                if self.colorkey: tile.set_colorkey(self.colorkey)
-                self.tiles[tile_id] = tile
-                tile_id += 1
+    def load_image_async(self, callback: Callable[["Tileset"], Any] | None = None, on_progress: Callable[[float], Any] | None = None) -> Load_Job | None:
+        """Loads the image on the image loader, the callback is called with the tileset once it has its tiles.
+        Returns None if there is nothing to load."""
+        if self.image is not None or self.image_load_failed or self.loading: return
+        self.loading = True
+
+        def finish(image: pygame.Surface | None) -> None:
+            self.set_image(image)
+            if callback: callback(self)
+
+        return image_loader.submit(self.read_image, finish, on_progress)
+    
+    def _extract_tile(self, tile_id: int) -> pygame.Surface:
+        row, col = divmod(tile_id, self.tiles_per_row)
+        x = col * (self.tile_width + self.spacing) + self.margin
+        y = row * (self.tile_height + self.spacing) + self.margin
+        return self.image.subsurface(pygame.Rect(x, y, self.tile_width, self.tile_height))
+    
+    def _extract_tileset_tiles(self):
+        """Slices every tile of the tileset now instead of on first access."""
+        for tile_id in self.tiles: self.tiles[tile_id]
+    
+    def get_tile_count(self) -> int:
+        return self.tiles_per_row * self.tiles_per_column
     
     def to_dict(self) -> dict:
         return {
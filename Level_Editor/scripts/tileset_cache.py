@@ -0,0 +1,87 @@
+"""
+On disk cache of preprocessed tileset images, so opening a tileset again skips decoding the image file.
+Cache file structure:
+
+    header   CACHE_HEADER_FORMAT   magic, width, height
+    pixels   width * height * 4 bytes of RGBA data (the colorkey is already turned into transparent pixels)
+
+The cache files are named "<path hash>_<version hash>_<parameters hash>.bin", hashes of the image path, the
+modification time and size of the image file and the slicing parameters, so a changed image or tileset never
+hits a stale file. The files of older versions of an image are removed when a new one is written.
+"""
+
+import os
+import struct
+import hashlib
+import pygame
+from typing import List, Tuple
+
+TILESET_CACHE_DIRECTORY = "./caches/tilesets"
+TILESET_CACHE_EXTENTION = ".bin"
+CACHE_MAGIC = b"TSCH"
+CACHE_HEADER_FORMAT = "<4sII"
+CACHE_HEADER_SIZE = struct.calcsize(CACHE_HEADER_FORMAT)
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def get_tileset_cache_path(image_path: str, tile_width: int, tile_height: int, margin: int, spacing: int, colorkey: pygame.Color | List[int] | Tuple[int] | None) -> str | None:
+    try:
+        image_stat = os.stat(image_path)
+    except OSError:
+        return
+
+    colorkey = tuple(colorkey) if colorkey else None
+    version = (image_stat.st_mtime_ns, image_stat.st_size)
+    parameters = (tile_width, tile_height, margin, spacing, colorkey)
+    file_name = f"{_hash(os.path.abspath(image_path))}_{_hash(repr(version))}_{_hash(repr(parameters))}{TILESET_CACHE_EXTENTION}"
+    return os.path.join(TILESET_CACHE_DIRECTORY, file_name)
+
+def preprocess_tileset_image(image: pygame.Surface, colorkey: pygame.Color | List[int] | Tuple[int] | None) -> pygame.Surface:
+    """Returns the image with per pixel alpha, the pixels of the colorkey become transparent."""
+    if not colorkey: return image
+
+    keyed_image = image.copy()
+    keyed_image.set_colorkey(colorkey)
+    preprocessed_image = pygame.Surface(image.get_size(), pygame.SRCALPHA)
+    preprocessed_image.blit(keyed_image, (0,0))
+    return preprocessed_image
+
+def read_cached_tileset_image(cache_path: str) -> pygame.Surface | None:
+    """Returns the cached image without converting it, so it can run on a worker thread."""
+    try:
+        with open(cache_path, "rb") as file:
+            magic, width, height = struct.unpack(CACHE_HEADER_FORMAT, file.read(CACHE_HEADER_SIZE))
+            if magic != CACHE_MAGIC: return
+            pixels = file.read()
+        if len(pixels) != width * height * 4: return
+
+        return pygame.image.frombytes(pixels, (width, height), "RGBA")
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        print(f"Error loading cached tileset image: {e}")
+
+def save_cached_tileset_image(cache_path: str, image: pygame.Surface) -> bool:
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+        temporary_path = cache_path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(struct.pack(CACHE_HEADER_FORMAT, CACHE_MAGIC, image.get_width(), image.get_height()))
+            file.write(pygame.image.tobytes(image, "RGBA"))
+        os.replace(temporary_path, cache_path)
+
+        # the cache files of older versions of the image are never read again
+        directory, file_name = os.path.split(cache_path)
+        path_hash, version_hash, _ = file_name.split("_")
+        for other_file_name in os.listdir(directory):
+            other_path_hash, other_version_hash = (other_file_name.split("_") + ["", ""])[:2]
+            if other_path_hash == path_hash and other_version_hash != version_hash:
+                os.remove(os.path.join(directory, other_file_name))
+        return True
+    except Exception as e:
+        print(f"Error saving cached tileset image: {e}")
+
+    return False
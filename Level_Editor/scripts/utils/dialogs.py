@@ -0,0 +1,91 @@
+"""
+The dialog service owns one hidden Tk root on its own thread, so a file dialog opens without starting Tk again
+and the pygame loop keeps drawing and handling events while it is open. Dialogs are asked for with a callback,
+the result comes back to the pygame loop as an event:
+
+    pygame.Event(DIALOG_CLOSED, {"request_id": 0, "result": "C:/levels/1.lvl"})  # result is None if cancelled
+
+Dialog_Service.process_event calls the callback of the request with the result, on the pygame thread, so
+callbacks can load images and touch the gui. The module level dialog_service is shared by the whole editor.
+"""
+
+import pygame
+import queue
+import threading
+from typing import Any, Callable, Dict
+
+DIALOG_CLOSED = pygame.event.custom_type()
+
+
+class Dialog_Service:
+    def __init__(self) -> None:
+        self.requests: queue.Queue = queue.Queue()
+        self.callbacks: Dict[int, Callable[[Any], Any]] = {}
+        self.request_count = 0
+        self.thread: threading.Thread | None = None
+
+    def _start(self) -> None:
+        if self.thread is not None: return
+        self.thread = threading.Thread(target=self._run, name="Dialog_Service", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        # tkinter objects may only be used by the thread that created the root
+        import tkinter as tk
+        from tkinter import filedialog
+
+        dialogs = {"open_file": filedialog.askopenfilename, "open_files": filedialog.askopenfilenames,
+                   "save_file": filedialog.asksaveasfilename, "directory": filedialog.askdirectory}
+        try:
+            root = tk.Tk()
+            root.withdraw()
+        except Exception as e:
+            print(f"Error starting the dialog service: {e}")
+            root = None
+
+        while True:
+            request = self.requests.get()
+            if request is None: break
+
+            request_id, dialog, options = request
+            result = None
+            if root is not None:
+                try:
+                    result = dialogs[dialog](parent=root, **options)
+                except Exception as e:
+                    print(f"Error opening dialog: {e}")
+
+            if not result: result = None # cancelled dialogs return "" or ()
+            pygame.event.post(pygame.Event(DIALOG_CLOSED, request_id=request_id, result=result))
+
+        if root is not None: root.destroy()
+
+    def request(self, dialog: str, callback: Callable[[Any], Any], **options) -> int:
+        """Opens a dialog ("open_file", "open_files", "save_file" or "directory") with the filedialog options,
+        the callback is called with the result once it closes. Returns the request id."""
+        self._start()
+        request_id = self.request_count
+        self.request_count += 1
+
+        self.callbacks[request_id] = callback
+        self.requests.put((request_id, dialog, options))
+        return request_id
+
+    def is_open(self) -> bool:
+        return bool(self.callbacks)
+
+    def process_event(self, event: pygame.Event) -> bool:
+        """Calls the callback of a closed dialog, returns True if the event was a dialog result."""
+        if event.type != DIALOG_CLOSED: return False
+
+        callback = self.callbacks.pop(event.request_id, None)
+        if callback: callback(event.result)
+        return True
+
+    def close(self) -> None:
+        if self.thread is None: return
+        self.requests.put(None)
+        self.callbacks.clear()
+
+
+dialog_service = Dialog_Service()
@@ -1,12 +1,11 @@
 import pygame
-import tkinter as tk
-from tkinter import filedialog
 import os
 import json
-from typing import Any, Callable
+from typing import Any, Callable, Tuple
 
 from ..tileset import Tileset_Encoder
-from ..utils.other import tkinter_root_init
+from ..level_format import LEVEL_FILE_EXTENTION
+from ..utils.dialogs import dialog_service
 
 def is_valid_file_type(path: str, valid_extentions: set) -> bool:
     return os.path.splitext(path)[1].lower() in valid_extentions
@@ -30,29 +29,46 @@ def load_json_data(path: str, extention: str = ".json") -> Any | None:
     except Exception as e:
         print(f"Error loading JSON file: {e}")
 
-@tkinter_root_init
-def save_as_json_data(data: Any) -> str:
-    file_path = filedialog.asksaveasfilename(title="Save JSON File", filetypes=[("json files (*json)", "*.json")], defaultextension=".json")
+# the file explorer functions don't wait for the dialog, the callback gets the result once it is closed
+# (None if it was cancelled), see dialogs.py
 
-    if not file_path: return
+def save_as_json_data(data: Any, callback: Callable[[str | None], Any] | None = None) -> None:
+    def save(file_path: str | None) -> None:
+        if file_path and not save_json_data(data, file_path):
+            print("JSON file not saved.")
+            file_path = None
+        if callback: callback(file_path)
 
-    if not save_json_data(data, file_path):
-        print("JSON file not saved.")
+    dialog_service.request("save_file", save, title="Save JSON File", filetypes=[("json files (*json)", "*.json")], defaultextension=".json")
 
-    return file_path
+def load_json_data_from_file_explorer(callback: Callable[[Any | None], Any], multiple: bool = False) -> None:
+    """With multiple the callback gets a list with the data of every picked file."""
+    def load(file_path: str | None) -> None:
+        if not file_path or not is_valid_file_type(file_path, [".json"]):
+            callback(None)
+            return
+        callback(load_json_data(file_path))
 
-@tkinter_root_init
-def load_json_data_from_file_explorer() -> Any | None:
-    file_path = filedialog.askopenfilename(title="Open JSON File", filetypes=[("json files (*json)", "*.json")])
+    def load_all(file_paths: Tuple[str] | None) -> None:
+        if not file_paths:
+            callback(None)
+            return
+        callback([data for data in (load_json_data(file_path) for file_path in file_paths if is_valid_file_type(file_path, [".json"])) if data])
 
-    if not file_path: return
-    if not is_valid_file_type(file_path, [".json"]): return
+    if multiple: dialog_service.request("open_files", load_all, title="Open JSON Files", filetypes=[("json files (*json)", "*.json")])
+    else: dialog_service.request("open_file", load, title="Open JSON File", filetypes=[("json files (*json)", "*.json")])
 
-    return load_json_data(file_path)
+def get_level_save_path_from_file_explorer(callback: Callable[[str | None], Any]) -> None:
+    dialog_service.request("save_file", callback, title="Save Level", filetypes=[("level files (*lvl)", f"*{LEVEL_FILE_EXTENTION}"), ("json files (*json)", "*.json")], defaultextension=LEVEL_FILE_EXTENTION)
 
-def get_save_path_from_file_explorer() -> str | None:
-    file_path = filedialog.askdirectory()
-    
-    if not file_path: return 
+def get_level_path_from_file_explorer(callback: Callable[[str | None], Any]) -> None:
+    def check(file_path: str | None) -> None:
+        if not file_path or not is_valid_file_type(file_path, [LEVEL_FILE_EXTENTION, ".json"]):
+            callback(None)
+            return
+        callback(file_path)
 
-    return file_path
+    dialog_service.request("open_file", check, title="Open Level", filetypes=[("level files (*lvl)", f"*{LEVEL_FILE_EXTENTION}"), ("json files (*json)", "*.json")])
+
+def get_save_path_from_file_explorer(callback: Callable[[str | None], Any]) -> None:
+    dialog_service.request("directory", callback)
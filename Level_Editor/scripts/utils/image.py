@@ -1,40 +1,53 @@
 import pygame
 import pygame_gui
-import tkinter as tk
-from tkinter import filedialog
 import os
 import json
 from typing import Callable, List, Any, Tuple
 
-from ..utils.other import tkinter_root_init
+from ..utils.dialogs import dialog_service
+from ..utils.image_loader import image_loader
 
 
-@tkinter_root_init
-def load_image_from_file_explorer(valid_extentions: set = {".png", ".jpg", ".jpeg"}) -> Tuple[pygame.Surface] | Tuple[None]:
+def load_image_from_file_explorer(callback: Callable[[pygame.Surface | None, str | None], Any], valid_extentions: set = {".png", ".jpg", ".jpeg"}) -> None:
+    """Asks for an image without waiting for the dialog or the decoding, the callback gets (image, path) or (None, None)."""
     from ..utils.file import is_valid_file_type
 
-    filetypes = [("Image files", f"*{extention}") for extention in valid_extentions]
-    file_path = filedialog.askopenfilename(filetypes=filetypes)
-    
-    if not file_path: return (None, None)
-    if not is_valid_file_type(file_path, valid_extentions): return (None, None)
+    def load(file_path: str | None) -> None:
+        if not file_path or not is_valid_file_type(file_path, valid_extentions):
+            callback(None, None)
+            return
+        image_loader.load_image(file_path, lambda image: callback(image, file_path) if image else callback(None, None))
 
-    return (pygame.image.load(file_path).convert_alpha(), file_path)
+    filetypes = [("Image files", f"*{extention}") for extention in valid_extentions]
+    dialog_service.request("open_file", load, filetypes=filetypes)
 
-@tkinter_root_init
-def load_images_from_file_explorer(valid_extentions: set = {".png", ".jpg", ".jpeg"}) -> List[Tuple[pygame.Surface]] | List:
+def get_image_path_from_file_explorer(callback: Callable[[str | None], Any], valid_extentions: set = {".png", ".jpg", ".jpeg"}) -> None:
+    """Asks for an image path without decoding the image."""
     from ..utils.file import is_valid_file_type
+
     filetypes = [("Image files", f"*{extention}") for extention in valid_extentions]
-    file_paths = filedialog.askopenfilenames(filetypes=filetypes)
+    dialog_service.request("open_file", lambda file_path: callback(file_path if file_path and is_valid_file_type(file_path, valid_extentions) else None), filetypes=filetypes)
 
-    if not file_paths: return []
+def load_images_from_file_explorer(callback: Callable[[List[Tuple[pygame.Surface, str]]], Any], valid_extentions: set = {".png", ".jpg", ".jpeg"}) -> None:
+    """Asks for images without waiting for the dialog, the images are decoded in parallel and the callback gets a
+    list of (image, path) once they all are."""
+    from ..utils.file import is_valid_file_type
+
+    def load(file_paths: Tuple[str] | None) -> None:
+        paths = [path for path in file_paths or () if is_valid_file_type(path, valid_extentions)]
+        if not paths:
+            callback([])
+            return
 
-    images_data = []
-    for path in file_paths:
-        if is_valid_file_type(path, valid_extentions):
-            images_data.append((pygame.image.load(path).convert_alpha(), path))
+        images = {}
+        def loaded(path: str, image: pygame.Surface | None) -> None:
+            images[path] = image
+            if len(images) == len(paths): callback([(images[path], path) for path in paths if images[path]])
 
-    return images_data
+        for path in paths: image_loader.load_image(path, lambda image, path=path: loaded(path, image))
+
+    filetypes = [("Image files", f"*{extention}") for extention in valid_extentions]
+    dialog_service.request("open_files", load, filetypes=filetypes)
 
 def load_image(path: str, colorkey: pygame.Color = None, size: List[int] | Tuple[int] = None, size_multiplier: float | int = None) -> pygame.Surface | None:
     if not os.path.exists(path): return
@@ -0,0 +1,123 @@
+"""
+The image loader reads and decodes image files on a thread pool, so large tileset sheets don't freeze the
+editor. Only the parts that need the display (convert_alpha, slicing) run on the pygame thread. A load is split
+in two functions:
+
+    work(job) -> result        # on a worker thread, reports progress with job.set_progress(0..1)
+    callback(result)           # on the pygame thread, called by Image_Loader.update once the work is done
+
+An IMAGE_LOADED event is posted once the result of a job is set, so an idle editor wakes up to finish the
+load. Cancelled jobs never call their callback, their work stops at the next set_progress. The module level
+image_loader is shared by the whole editor.
+"""
+
+import io
+import os
+import pygame
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List
+
+IMAGE_LOADED = pygame.event.custom_type()
+READ_CHUNK_SIZE = 1 << 20
+READ_PROGRESS = 0.5 # part of the progress of decode_image_file that is reading the file
+
+
+class Load_Cancelled(Exception):
+    pass
+
+
+class Load_Job:
+    def __init__(self, callback: Callable[[Any], Any], on_progress: Callable[[float], Any] | None = None) -> None:
+        self.callback = callback
+        self.on_progress = on_progress
+        self.future: Future | None = None
+
+        self.progress = 0.0
+        self.reported_progress = None
+        self.cancelled = False
+
+    def set_progress(self, progress: float) -> None:
+        """Called by the work on the worker thread, raises Load_Cancelled to stop cancelled work."""
+        if self.cancelled: raise Load_Cancelled()
+        self.progress = progress
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        if self.future: self.future.cancel()
+
+
+class Image_Loader:
+    def __init__(self, max_workers: int = min(4, os.cpu_count() or 1)) -> None:
+        self.max_workers = max_workers
+        self.executor: ThreadPoolExecutor | None = None
+        self.jobs: List[Load_Job] = []
+
+    @staticmethod
+    def _post_loaded_event(future: Future) -> None:
+        # posted once the result is set, so the update woken up by the event finds the job done
+        if pygame.display.get_init(): pygame.event.post(pygame.Event(IMAGE_LOADED))
+
+    def submit(self, work: Callable[[Load_Job], Any], callback: Callable[[Any], Any], on_progress: Callable[[float], Any] | None = None) -> Load_Job:
+        if self.executor is None: self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="Image_Loader")
+
+        job = Load_Job(callback, on_progress)
+        job.future = self.executor.submit(work, job)
+        job.future.add_done_callback(self._post_loaded_event)
+        self.jobs.append(job)
+        return job
+
+    def load_image(self, path: str, callback: Callable[[pygame.Surface | None], Any], on_progress: Callable[[float], Any] | None = None) -> Load_Job:
+        """Decodes an image file on a worker, the callback gets it converted for the display (or None)."""
+        return self.submit(lambda job: decode_image_file(path, job), lambda image: callback(image.convert_alpha() if image else None), on_progress)
+
+    def is_busy(self) -> bool:
+        return bool(self.jobs)
+
+    def update(self) -> None:
+        """Reports the progress of the running jobs and calls the callbacks of the finished ones."""
+        if not self.jobs: return
+
+        jobs, self.jobs = self.jobs, [] # callbacks can submit new jobs
+        for job in jobs:
+            if job.cancelled: continue
+            if not job.future.done():
+                self.jobs.append(job)
+                if job.on_progress and job.progress != job.reported_progress:
+                    job.reported_progress = job.progress
+                    job.on_progress(job.progress)
+                continue
+
+            try:
+                result = job.future.result()
+            except Exception as e:
+                print(f"Error loading image: {e}")
+                result = None
+            job.callback(result)
+
+    def close(self) -> None:
+        for job in self.jobs: job.cancel()
+        self.jobs.clear()
+        if self.executor: self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+
+
+def decode_image_file(path: str, job: Load_Job | None = None) -> pygame.Surface | None:
+    """Reads and decodes an image file without converting it, so it can run on a worker thread."""
+    try:
+        size = max(1, os.path.getsize(path))
+        data = bytearray()
+        with open(path, "rb") as file:
+            while chunk := file.read(READ_CHUNK_SIZE):
+                data += chunk
+                if job: job.set_progress(READ_PROGRESS * min(1, len(data) / size))
+
+        image = pygame.image.load(io.BytesIO(data), path)
+        if job: job.set_progress(1)
+        return image
+    except Load_Cancelled:
+        raise
+    except Exception as e:
+        print(f"Error loading image '{path}': {e}")
+
+
+image_loader = Image_Loader()
@@ -1,22 +1,8 @@
 import pygame
 import pygame_gui
-import tkinter as tk
 
 from typing import Callable, Tuple, List
 
-def tkinter_root_init(func: Callable) -> Callable:
-    def wrapper(*args, **kwargs):
-        root = tk.Tk()
-        root.withdraw()
-
-        return_value = func(*args, **kwargs)
-
-        root.destroy()
-
-        return return_value
-    
-    return wrapper
-
 def get_color_from_colorpicker(manager: pygame_gui.UIManager, rect: pygame.Rect, title: str = "Color Picker",*args, **kwargs) -> pygame.Color | None:
     color_picker = pygame_gui.windows.UIColourPickerDialog(
         manager=manager,
@@ -0,0 +1,167 @@
+"""
+The frame profiler collects named timers (in ms) and counters for every frame and keeps the last
+history_length frames. Frame record structure:
+
+    {"frame": 0, "frame_ms": 16.6, "timers": {"tile render": 2.1}, "counters": {"blits": 30}}
+
+The module level profiler is shared by the whole editor, so hot paths can be instrumented without passing
+it around. Timers are inclusive, nested timers are also counted in their parent.
+
+It also records the startup, as seconds from the start of the process to every startup stage:
+
+    {"imports": 0.31, "window shown": 0.33, "widgets created": 0.45, "first frame": 0.47, "level loaded": 0.9}
+
+export_startup_report appends them as a row to a csv file, so the startup can be tracked across runs.
+"""
+
+import pygame
+import time
+import json
+import csv
+import os
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+
+class Frame_Profiler:
+    def __init__(self, history_length: int = 600) -> None:
+        self.frames: deque = deque(maxlen=history_length)
+        self.frame_number = 0
+        self.frame_start = None
+
+        self.timers: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+        self.startup_start = time.perf_counter()
+        self.startup_stages: Dict[str, float] = {}
+
+        self.overlay_visible = False
+        self.overlay_surface = None
+        self.overlay_update_interval = 0.5
+        self.last_overlay_update = 0
+        self.font = None
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] = self.timers.get(name, 0) + (time.perf_counter() - start) * 1000
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def begin_frame(self) -> None:
+        self.frame_start = time.perf_counter()
+        self.timers = {}
+        self.counters = {}
+
+    def end_frame(self) -> None:
+        if self.frame_start is None: return
+
+        self.frames.append({
+            "frame": self.frame_number,
+            "frame_ms": (time.perf_counter() - self.frame_start) * 1000,
+            "timers": self.timers,
+            "counters": self.counters
+        })
+        self.frame_number += 1
+        self.frame_start = None
+
+    def get_averages(self, number_of_frames: int = 60) -> dict:
+        frames = list(self.frames)[-number_of_frames:]
+        if not frames: return {"frame_ms": 0, "timers": {}, "counters": {}}
+
+        timers = {}
+        counters = {}
+        for frame in frames:
+            for name, value in frame["timers"].items(): timers[name] = timers.get(name, 0) + value
+            for name, value in frame["counters"].items(): counters[name] = counters.get(name, 0) + value
+
+        return {
+            "frame_ms": sum(frame["frame_ms"] for frame in frames) / len(frames),
+            "timers": {name: value / len(frames) for name, value in timers.items()},
+            "counters": {name: value / len(frames) for name, value in counters.items()}
+        }
+
+    def begin_startup(self, start_time: float) -> None:
+        """Sets the perf_counter time the process started at, the startup stages are measured from it."""
+        self.startup_start = start_time
+        self.startup_stages = {}
+
+    def mark_startup(self, stage: str) -> None:
+        if stage in self.startup_stages: return
+        self.startup_stages[stage] = time.perf_counter() - self.startup_start
+
+    def get_startup_report(self) -> str:
+        return "Startup: " + ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in self.startup_stages.items())
+
+    def export_startup_report(self, path: str) -> bool:
+        """Appends the startup stages to a csv file, a header is written if the file is new."""
+        try:
+            new_file = not os.path.exists(path)
+            with open(path, "a", newline="") as file:
+                writer = csv.writer(file)
+                if new_file: writer.writerow(["time"] + list(self.startup_stages))
+                writer.writerow([time.strftime("%Y-%m-%d %H:%M:%S")] + [round(seconds, 4) for seconds in self.startup_stages.values()])
+            return True
+        except Exception as e:
+            print(f"Error exporting startup report: {e}")
+
+        return False
+
+    def toggle_overlay(self) -> None:
+        self.overlay_visible = not self.overlay_visible
+        self.overlay_surface = None
+
+    def _create_overlay_surface(self) -> pygame.Surface:
+        if not self.font: self.font = pygame.font.Font(None, 20)
+
+        averages = self.get_averages()
+        lines = [f"frame: {averages['frame_ms']:.2f} ms ({1000 / averages['frame_ms'] if averages['frame_ms'] else 0:.0f} fps)"]
+        lines += [f"{name}: {value:.2f} ms" for name, value in sorted(averages["timers"].items())]
+        lines += [f"{name}: {value:.0f}" for name, value in sorted(averages["counters"].items())]
+
+        text_surfaces = [self.font.render(line, True, (255,255,255)) for line in lines]
+        overlay_surface = pygame.Surface((max(text.get_width() for text in text_surfaces) + 16, len(text_surfaces) * 18 + 12), pygame.SRCALPHA)
+        overlay_surface.fill((0,0,0, 170))
+        overlay_surface.blits([(text, (8, 8 + index * 18)) for index, text in enumerate(text_surfaces)], doreturn=False)
+        return overlay_surface
+
+    def draw_overlay(self, render_surface: pygame.Surface, position: List[int] | tuple = (310, 60)) -> None:
+        if not self.overlay_visible: return
+
+        current_time = time.perf_counter()
+        if self.overlay_surface is None or current_time - self.last_overlay_update >= self.overlay_update_interval:
+            self.overlay_surface = self._create_overlay_surface()
+            self.last_overlay_update = current_time
+
+        render_surface.blit(self.overlay_surface, position)
+
+    def export_trace(self, path: str) -> bool:
+        """Writes the recorded frames to a csv file (if the path ends with .csv) or a json file."""
+        try:
+            frames = list(self.frames)
+            if path.lower().endswith(".csv"):
+                timer_names = sorted({name for frame in frames for name in frame["timers"]})
+                counter_names = sorted({name for frame in frames for name in frame["counters"]})
+                with open(path, "w", newline="") as file:
+                    writer = csv.writer(file)
+                    writer.writerow(["frame", "frame_ms"] + [f"{name} ms" for name in timer_names] + counter_names)
+                    for frame in frames:
+                        writer.writerow([frame["frame"], round(frame["frame_ms"], 4)] +
+                                        [round(frame["timers"].get(name, 0), 4) for name in timer_names] +
+                                        [frame["counters"].get(name, 0) for name in counter_names])
+            else:
+                with open(path, "w") as file:
+                    json.dump(frames, file, indent=4)
+            return True
+        except Exception as e:
+            print(f"Error exporting frame trace: {e}")
+
+        return False
+
+
+profiler = Frame_Profiler()
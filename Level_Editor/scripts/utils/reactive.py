@@ -0,0 +1,26 @@
+from typing import Any, Callable, List
+
+
+class Reactive_Value:
+    """Holds a value and calls its subscribers when it changes, so widgets only update when their state does."""
+    def __init__(self, value: Any = None) -> None:
+        self.value = value
+        self.subscribers: List[Callable[[Any], Any]] = []
+
+    def get(self) -> Any:
+        return self.value
+
+    def set(self, value: Any) -> bool:
+        """Sets the value and notifies the subscribers, returns False if the value didn't change."""
+        if value == self.value: return False
+
+        self.value = value
+        for subscriber in self.subscribers: subscriber(value)
+        return True
+
+    def subscribe(self, subscriber: Callable[[Any], Any], call_now: bool = True) -> None:
+        self.subscribers.append(subscriber)
+        if call_now: subscriber(self.value)
+
+    def unsubscribe(self, subscriber: Callable[[Any], Any]) -> None:
+        if subscriber in self.subscribers: self.subscribers.remove(subscriber)
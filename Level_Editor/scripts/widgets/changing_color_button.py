@@ -1,6 +1,8 @@
 import pygame
 import pygame_gui
 
+from ..utils.reactive import Reactive_Value
+
 class Changing_Color_Button(pygame_gui.elements.UIButton):
     def __init__(self, relative_rect, manager, container, text = "", *args, **kwargs):
         super().__init__(relative_rect=relative_rect, manager=manager, container=container, text=text, object_id="#changing_color_button", *args, **kwargs)
@@ -10,19 +12,25 @@ class Changing_Color_Button(pygame_gui.elements.UIButton):
         self.active_border_color = self.colours["selected_bg"]
 
         self.color = (0,0,0,255)
+
+        # (background color, border color), the button is only rebuilt when they change
+        self.appearance = Reactive_Value()
+        self.appearance.subscribe(self._apply_appearance, call_now=False)
     
+    def _apply_appearance(self, appearance: tuple) -> None:
+        self.colours["normal_bg"], self.colours["normal_border"] = appearance
+        self.rebuild()
+
     def set_color(self, new_color: pygame.Color) -> None:
         self.color = new_color
     
     def update(self, time_delta: float):
-        self.colours["normal_bg"] = pygame.Color(self.color)
         if self.held:
-            self.colours["normal_border"] = self.active_border_color
+            border_color = self.active_border_color
         elif self.hovered:
-            self.colours["normal_border"] = self.hover_border_color
+            border_color = self.hover_border_color
         else:
-            self.colours["normal_border"] = self.normal_border_color
-        
-        self.rebuild()
+            border_color = self.normal_border_color
+        self.appearance.set((pygame.Color(self.color), border_color))
 
         super().update(time_delta)
\ No newline at end of file
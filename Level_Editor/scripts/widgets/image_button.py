@@ -4,16 +4,37 @@ from typing import Callable, Any
 
 class Image_Button(pygame_gui.elements.UIButton):
     def __init__(self, id: str, image: pygame.Surface, manager: pygame_gui.UIManager, relative_rect: pygame.Rect, callback: Callable[[Any], Any] = None, *args, **kwargs) -> None:
-        super().__init__(manager=manager, relative_rect=relative_rect, text="", command=lambda: callback(id), *args, **kwargs)
-        self.id = id
+        super().__init__(manager=manager, relative_rect=relative_rect, text="", command=lambda: self.callback(self.id), *args, **kwargs)
         self.callback = callback
-        self.image = pygame.transform.scale(image.copy(), (self.relative_rect.width, self.relative_rect.height))
+        self.set_tile_image(id, image)
+    
+    def set_tile_image(self, id: str, image: pygame.Surface) -> None:
+        """Shows another image on the button, the hovered and selected images are only generated once they are needed."""
+        self.id = id
+        self.tile_image = pygame.transform.scale(image, (self.relative_rect.width, self.relative_rect.height))
         self.normal_image = self._generate_normal_image()
+        self.hovered_image = self.normal_image
+        self.selected_image = self.normal_image
+        self.state_images_generated = False
+
+        self.rebuild()
+        if self.is_selected: self.select()
+    
+    def _generate_state_images(self) -> None:
+        if self.state_images_generated: return
         self.hovered_image = self._generate_hovered_image()
         self.selected_image = self._generate_selected_image()
-
+        self.state_images_generated = True
         self.rebuild()
     
+    def on_hovered(self) -> None:
+        self._generate_state_images()
+        super().on_hovered()
+    
+    def select(self) -> None:
+        self._generate_state_images()
+        super().select()
+    
     def _add_base_image(func: Callable[[Any], Any]) -> Callable:
         def wrapper(*args, **kwargs):
             image: pygame.Surface = func(*args, **kwargs)
@@ -25,13 +46,13 @@ class Image_Button(pygame_gui.elements.UIButton):
     
     @_add_base_image
     def _generate_normal_image(self) -> pygame.Surface:
-        image = self.image.copy()
+        image = self.tile_image.copy()
 
         return image
     
     @_add_base_image
     def _generate_hovered_image(self) -> pygame.Surface:
-        image: pygame.Surface = self.image.copy().convert_alpha()
+        image: pygame.Surface = self.tile_image.copy().convert_alpha()
 
         border_rect = pygame.Rect((0,0), image.get_size())
         border_surface = pygame.Surface(image.get_size(), pygame.SRCALPHA)
@@ -46,7 +67,7 @@ class Image_Button(pygame_gui.elements.UIButton):
         tint_surface = pygame.Surface((self.relative_rect.width, self.relative_rect.height), pygame.SRCALPHA)
         tint_surface.fill(pygame.Color(255,255,255,100)) # rgb(92,96,98)
 
-        image = self.image.copy()
+        image = self.tile_image.copy()
         
         image.blit(tint_surface, (0,0))
 
@@ -7,9 +7,10 @@ from .widgets.changing_color_button import Changing_Color_Button
 from .widgets.order_list import Order_List
 from .tileset import Tileset
 from .utils.file import get_save_path_from_file_explorer, save_json_data
-from .utils.image import load_image_from_file_explorer
+from .utils.image import get_image_path_from_file_explorer
 from .utils.other import throw_error_window
 from .utils.other import string_is_float
+from .utils.reactive import Reactive_Value
 
 class Custom_Window(pygame_gui.elements.UIWindow):
     def __init__(self, manager, rect, *args, **kwargs) -> None:
@@ -69,7 +70,13 @@ class New_Tileset_Window(Custom_Window):
         self.create_widgets()
 
         self.default_colorkey_color = (0,0,0)
-        self.colorkey_color = self.default_colorkey_color
+        self.colorkey_color = Reactive_Value(self.default_colorkey_color)
+        self.colorkey_color.subscribe(self.colorkey_color_button.set_color, call_now=False)
+
+        # the save button is only updated when an entry changes
+        self.text_entries = (self.name_entry, self.type_entry, self.source_entry, self.tile_width_entry, self.tile_height_entry, self.margin_entry, self.spacing_entry)
+        self.can_save = Reactive_Value(self._can_save())
+        self.can_save.subscribe(lambda can_save: self.save_as_button.enable() if can_save else self.save_as_button.disable())
     
     def create_widgets(self) -> None:
             # tileset
@@ -308,18 +315,32 @@ class New_Tileset_Window(Custom_Window):
         )
         self.color_picker.set_blocking(True)
 
-    def create_and_save_tileset(self) -> Tileset:
+    def ask_save_directory(self) -> None:
+        """Asks where to save the tileset, it is created once the directory is picked (see create_and_save_tileset)."""
         source_entry_text = self.source_entry.get_text()
         if not os.path.exists(source_entry_text):
             throw_error_window(f"Failed to load tileset image '{source_entry_text}'", self.manager, pygame.Rect(200, 200, 400, 400))
             return
         
-        save_directory_path = get_save_path_from_file_explorer()
+        get_save_path_from_file_explorer(self._save_directory_picked)
+
+    def _save_directory_picked(self, save_directory_path: str | None) -> None:
+        if not save_directory_path or not self.alive(): return
+        if not self._can_save(): return # the entries changed while the dialog was open
+
+        tileset = self.create_and_save_tileset(save_directory_path)
+        if self.callback: self.callback(tileset)
+        self.kill()
 
-        if not save_directory_path: return
+    def _source_image_picked(self, path: str | None) -> None:
+        if not path or not self.alive(): return
+        self.source_entry.set_text(path)
+        self.can_save.set(self._can_save())
 
+    def create_and_save_tileset(self, save_directory_path: str) -> Tileset:
+        source_entry_text = self.source_entry.get_text()
         tileset = Tileset(name=self.name_entry.get_text(), t_type=self.type_entry.get_text(), image_path=source_entry_text, tile_width=int(self.tile_width_entry.get_text()), tile_height=int(self.tile_height_entry.get_text()), 
-                          margin=int(self.margin_entry.get_text()), spacing=int(self.spacing_entry.get_text()), colorkey=self.colorkey_color if self.colorkey_dropdown_menu.selected_option == ("Colorkey on", "1") else None)
+                          margin=int(self.margin_entry.get_text()), spacing=int(self.spacing_entry.get_text()), colorkey=self.colorkey_color.get() if self.colorkey_dropdown_menu.selected_option == ("Colorkey on", "1") else None)
         
         # have to save the tileset object to its directory
         save_json_data({"tileset_object": tileset}, os.path.join(save_directory_path, tileset.name))
@@ -331,17 +352,13 @@ class New_Tileset_Window(Custom_Window):
 
         if event.type == pygame_gui.UI_BUTTON_PRESSED:
             if event.ui_element == self.brows_button:
-                image, path = load_image_from_file_explorer()
-                if path: self.source_entry.set_text(path)
+                get_image_path_from_file_explorer(self._source_image_picked)
             if event.ui_element == self.colorkey_color_button:
                 self.create_color_picker()
             if event.ui_element == self.cancel_button:
                 self.kill()
-            if event.ui_element == self.save_as_button:
-                tileset = self.create_and_save_tileset()
-                if tileset: 
-                    if self.callback: self.callback(tileset)
-                    self.kill()
+            if event.ui_element == self.save_as_button and self._can_save():
+                self.ask_save_directory()
             
         if event.type == pygame_gui.UI_DROP_DOWN_MENU_CHANGED:
             if event.ui_element == self.colorkey_dropdown_menu:
@@ -350,24 +367,14 @@ class New_Tileset_Window(Custom_Window):
                 elif event.selected_option_id == "1":
                     self.colorkey_color_button.enable()
         
+        if event.type == pygame_gui.UI_TEXT_ENTRY_CHANGED and event.ui_element in self.text_entries:
+            self.can_save.set(self._can_save())
+
         if event.type == pygame_gui.UI_COLOUR_PICKER_COLOUR_PICKED:
             color = event.colour
-            if color: self.colorkey_color_button.set_color(color)
+            if color: self.colorkey_color.set(color)
         
         return consumed_event
-    
-    def update(self, time_delta: float) -> None:
-        super().update(time_delta)
-
-        if hasattr(self, "color_picker"):
-            new_color = self.color_picker.get_colour()
-            self.colorkey_color_button.set_color(new_color)
-            self.colorkey_color = new_color
-        
-        if self._can_save():
-            self.save_as_button.enable()
-        else:
-            self.save_as_button.disable()
 
 class Layer_Manager_Window(Custom_Window):
     def __init__(self, manager: pygame_gui.UIManager, rect: pygame.Rect, starting_buttons: List[str] = None, starting_selected_button_text: str | None = None, 
@@ -454,6 +461,10 @@ class New_Layer_Window(Custom_Window):
 
         self._create_widgets()
 
+        # the create button is only updated when an entry changes
+        self.can_create = Reactive_Value(self._can_create())
+        self.can_create.subscribe(lambda can_create: self.create_button.enable() if can_create else self.create_button.disable())
+
     def _create_widgets(self) -> None:
         layer_panel_rect = pygame.Rect(9, 11, self.given_rect.width - 20, 90)
         self.layer_panel = pygame_gui.elements.UIPanel(
@@ -516,10 +527,20 @@ class New_Layer_Window(Custom_Window):
         if not self.callback: return
 
         self.callback(data)
+
+    def _can_create(self) -> bool:
+        name_entry_text = self.name_entry.get_text()
+        parallax_entry_text = self.parallax_entry.get_text()
+        if (name_entry_text.isspace() or name_entry_text == "") or (name_entry_text in self.exclude_words): return False
+        if (parallax_entry_text.isspace() or parallax_entry_text == "" or not string_is_float(parallax_entry_text)): return False
+        return True
     
     def process_event(self, event: pygame.Event) -> bool:
+        if event.type == pygame_gui.UI_TEXT_ENTRY_CHANGED and event.ui_element in (self.name_entry, self.parallax_entry):
+            self.can_create.set(self._can_create())
+
         if event.type == pygame_gui.UI_BUTTON_PRESSED:
-            if event.ui_element is self.create_button:
+            if event.ui_element is self.create_button and self._can_create():
                 layer_name = self.name_entry.get_text()
                 parallax = float(self.parallax_entry.get_text())
                 callback_data = {"name": layer_name, "parallax": parallax}
@@ -530,14 +551,4 @@ class New_Layer_Window(Custom_Window):
 
         return super().process_event(event)
 
-    def update(self, time_delta: float):
-        name_entry_text = self.name_entry.get_text()
-        parallax_entry_text = self.parallax_entry.get_text()
-        if (name_entry_text.isspace() or name_entry_text == "") or (parallax_entry_text.isspace() or parallax_entry_text == "" or not string_is_float(parallax_entry_text)) or (name_entry_text in self.exclude_words): 
-            self.create_button.disable()
-        else:
-            self.create_button.enable()
-        
-        return super().update(time_delta)
-
     
\ No newline at end of file